@@ -0,0 +1,46 @@
+"""Microbenchmark for the advantages module.
+
+Times reward_to_go, discounted_returns and gae against the per-timestep loops
+the trainers used before, on a batch of --timesteps steps. test_advantages.py
+checks that they agree.
+
+    python bench_advantages.py --timesteps 1000000 --gamma 0.99 --lam 0.95
+"""
+import argparse
+import time
+
+import numpy as np
+
+import advantages
+from test_advantages import reward_to_go_loop, discounted_returns_loop, make_batch
+
+
+def time_fn(fn):
+    start = time.time()
+    fn()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--timesteps', type=int, default=1000000)
+    parser.add_argument('--max_path_length', type=int, default=1000)
+    parser.add_argument('--gamma', type=float, default=0.99)
+    parser.add_argument('--lam', type=float, default=0.95)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    rew_n, lengths, paths = make_batch(args.timesteps, args.max_path_length, rng)
+    for name, loop, vec in [
+            ('reward_to_go', lambda: reward_to_go_loop(paths, args.gamma),
+                             lambda: advantages.reward_to_go(rew_n, lengths, args.gamma)),
+            ('discounted_returns', lambda: discounted_returns_loop(paths, args.gamma),
+                                   lambda: advantages.discounted_returns(rew_n, lengths, args.gamma)),
+            ('gae', lambda: reward_to_go_loop(paths, args.gamma * args.lam),
+                    lambda: advantages.gae(rew_n, lengths, args.gamma, args.lam))]:
+        t_loop, t_vec = time_fn(loop), time_fn(vec)
+        print('%-20s loop: %8.3f s  batched: %8.4f s  speedup: %.0fx' % (name, t_loop, t_vec, t_loop / t_vec))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+
+Batch collection from several environments at once
+
+sample_paths() steps num_envs environments together and queries the policy once
+per vector step with the observations of all of them, instead of once per
+timestep with a batch of one. The environments either live in this process
+(SerialEnvs) or each in a worker process (SubprocEnvs, after baselines'
+SubprocVecEnv), so that slow simulators step in parallel.
+
+    envs = make_envs(env, lambda: gym.make(env_name), num_envs, subprocess=True, seed=seed)
+    paths, steps = sample_paths(envs, policy_fn, min_timesteps, max_path_length, discrete)
+
+"""
+import time
+import numpy as np
+from multiprocessing import Process, Pipe
+
+
+class SerialEnvs(object):
+    def __init__(self, envs):
+        self.envs = envs
+        self.num_envs = len(envs)
+
+    def step(self, actions, indices):
+        obs, rews, dones, _ = zip(*[self.envs[i].step(ac) for i, ac in zip(indices, actions)])
+        return np.array(obs), np.array(rews), np.array(dones)
+
+    def reset(self, indices):
+        return np.array([self.envs[i].reset() for i in indices])
+
+    def render(self, i):
+        self.envs[i].render()
+
+    def close(self):
+        pass
+
+
+def worker(remote, parent_remote, env_fn, seed):
+    parent_remote.close()
+    env = env_fn()
+    if seed is not None:
+        env.seed(seed)
+    while True:
+        cmd, data = remote.recv()
+        if cmd == 'step':
+            ob, rew, done, _ = env.step(data)
+            remote.send((ob, rew, done))
+        elif cmd == 'reset':
+            remote.send(env.reset())
+        elif cmd == 'render':
+            remote.send(env.render())
+        elif cmd == 'close':
+            remote.close()
+            break
+        else:
+            raise NotImplementedError
+
+
+class SubprocEnvs(object):
+    def __init__(self, env_fns, seeds=None):
+        self.num_envs = len(env_fns)
+        seeds = seeds or [None] * self.num_envs
+        self.remotes, self.work_remotes = zip(*[Pipe() for _ in range(self.num_envs)])
+        self.ps = [Process(target=worker, args=(work_remote, remote, env_fn, seed))
+                   for (work_remote, remote, env_fn, seed) in zip(self.work_remotes, self.remotes, env_fns, seeds)]
+        for p in self.ps:
+            p.daemon = True # if the main process crashes, we should not cause things to hang
+            p.start()
+        for remote in self.work_remotes:
+            remote.close()
+        self.closed = False
+
+    def step(self, actions, indices):
+        for i, ac in zip(indices, actions):
+            self.remotes[i].send(('step', ac))
+        obs, rews, dones = zip(*[self.remotes[i].recv() for i in indices])
+        return np.array(obs), np.array(rews), np.array(dones)
+
+    def reset(self, indices):
+        for i in indices:
+            self.remotes[i].send(('reset', None))
+        return np.array([self.remotes[i].recv() for i in indices])
+
+    def render(self, i):
+        self.remotes[i].send(('render', None))
+        self.remotes[i].recv()
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for p in self.ps:
+            p.join()
+        self.closed = True
+
+
+def make_envs(env, env_fn, num_envs, subprocess=False, seed=None):
+    """ num_envs environments: env plus num_envs-1 more from env_fn in this process, or
+    num_envs built by env_fn in worker processes. With a seed, the i-th env is seeded with
+    seed + i, so that runs with the same seed repeat """
+    seeds = None if seed is None else [seed + i for i in range(num_envs)]
+    if subprocess:
+        return SubprocEnvs([env_fn] * num_envs, seeds)
+    envs = [env] + [env_fn() for _ in range(num_envs - 1)]
+    for e, s in zip(envs, seeds or []):
+        e.seed(s)
+    return SerialEnvs(envs)
+
+
+def sample_paths(envs, policy_fn, min_timesteps, max_path_length, discrete, accept=None, render=False):
+    """
+    Collect paths until they hold more than min_timesteps steps.
+
+    policy_fn maps a (num_envs, ob_dim) batch of observations to sampled actions (one-hot
+    for discrete action spaces). A path ends when the env is done or after max_path_length+1
+    steps. Paths for which accept(path) is False are dropped and do not count. Once enough
+    steps are collected, the episodes still in progress are run to the end rather than cut,
+    so that short episodes are not over-represented. With render, the first episode of the
+    first env is rendered.
+
+    Returns the paths, as dicts of arrays with keys observation, action, reward and
+    next_observation, and the number of env steps simulated.
+    """
+    active = list(range(envs.num_envs))
+    obs = dict(zip(active, envs.reset(active)))
+    trajs = dict((i, ([], [], [], [])) for i in active)
+    paths = []
+    timesteps = 0
+    steps = 0
+    while active:
+        if render:
+            envs.render(0)
+            time.sleep(0.05)
+        acs = np.reshape(policy_fn(np.array([obs[i] for i in active])), (len(active), -1))
+        next_obs, rews, dones = envs.step(np.argmax(acs, axis=1) if discrete else acs, active)
+        steps += len(active)
+
+        finished = []
+        for k, i in enumerate(active):
+            traj = trajs[i]
+            for seq, x in zip(traj, (obs[i], acs[k], rews[k], next_obs[k])):
+                seq.append(x)
+            obs[i] = next_obs[k]
+            if dones[k] or len(traj[2]) > max_path_length:
+                finished.append(i)
+        for i in finished:
+            path = dict(zip(("observation", "action", "reward", "next_observation"),
+                            (np.array(seq) for seq in trajs[i])))
+            trajs[i] = ([], [], [], [])
+            if i == 0:
+                render = False
+            if accept is None or accept(path):
+                paths.append(path)
+                timesteps += len(path["reward"])
+        if finished:
+            if timesteps > min_timesteps:
+                active = [i for i in active if i not in finished]
+            else:
+                obs.update(zip(finished, envs.reset(finished)))
+    return paths, steps
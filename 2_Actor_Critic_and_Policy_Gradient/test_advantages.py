@@ -0,0 +1,54 @@
+import numpy as np
+
+import advantages
+
+
+def reward_to_go_loop(paths, gamma):
+    q_n = list()
+    for path in paths:
+        pLen = len(path)
+        q_p = np.zeros(pLen)
+        q_p[pLen - 1] = path[pLen - 1]
+        for t in reversed(range(pLen - 1)):
+            q_p[t] = path[t] + gamma * q_p[t + 1]
+        q_n.append(q_p)
+    return np.concatenate(q_n)
+
+
+def discounted_returns_loop(paths, gamma):
+    q_n = list()
+    for path in paths:
+        pLen = len(path)
+        q_p = 0
+        for t in range(pLen):
+            q_p = q_p + (gamma ** t) * path[t]
+        q_n.append(q_p * np.ones(pLen))
+    return np.concatenate(q_n)
+
+
+def make_batch(timesteps, max_path_length, rng):
+    lengths = []
+    while sum(lengths) < timesteps:
+        lengths.append(rng.randint(1, max_path_length + 1))
+    lengths[-1] -= sum(lengths) - timesteps
+    rew_n = rng.randn(timesteps)
+    paths = np.split(rew_n, np.cumsum(lengths)[:-1])
+    return rew_n, lengths, paths
+
+
+def test_advantages_match_loops():
+    """ The batched functions against the per-timestep loops the trainers used before """
+    rng = np.random.RandomState(0)
+    for _ in range(30):
+        rew_n, lengths, paths = make_batch(rng.randint(1, 5000), rng.choice([1, 10, 1000]), rng)
+        for gamma, lam in [(0.99, 0.95), (1.0, 1.0), (0.9, 0.)]:
+            assert np.allclose(advantages.reward_to_go(rew_n, lengths, gamma), reward_to_go_loop(paths, gamma))
+            assert np.allclose(advantages.discounted_returns(rew_n, lengths, gamma),
+                               discounted_returns_loop(paths, gamma))
+            assert np.allclose(advantages.gae(rew_n, lengths, gamma, lam), reward_to_go_loop(paths, gamma * lam))
+
+
+def test_single_step_paths():
+    rew_n = np.arange(5.)
+    assert np.array_equal(advantages.reward_to_go(rew_n, [1] * 5, 0.99), rew_n)
+    assert np.array_equal(advantages.discounted_returns(rew_n, [1] * 5, 0.99), rew_n)
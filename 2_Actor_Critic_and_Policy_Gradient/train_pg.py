@@ -2,6 +2,8 @@ import numpy as np
 import tensorflow as tf
 import gym
 import logz
+import sampler
+import advantages
 import scipy.signal
 import os
 import time
@@ -72,6 +74,8 @@ def train_PG(exp_name='',
              normalize_advantages=True,
              nn_baseline=False, 
              seed=0,
+             num_envs=1,
+             subproc_envs=False,
              # network arguments
              n_layers=1,
              size=32
@@ -101,6 +105,9 @@ def train_PG(exp_name='',
     # Maximum length for episodes
     max_path_length = max_path_length or env.spec.max_episode_steps
 
+    # Environments stepped together to collect each batch
+    envs = sampler.make_envs(env, lambda: gym.make(env_name), num_envs, subprocess=subproc_envs, seed=seed)
+
     #========================================================================================#
     # Notes on notation:
     # 
@@ -256,42 +263,16 @@ def train_PG(exp_name='',
 
     total_timesteps = 0
 
+    policy_fn = lambda ob: sess.run(sy_sampled_ac, feed_dict={sy_ob_no: ob})
     for itr in range(n_iter):
         print("********** Iteration %i ************"%itr)
 
         # Collect paths until we have enough timesteps
-        timesteps_this_batch = 0
-        paths = []
-        while True:
-            ob = env.reset()
-            obs, acs, rewards = [], [], []
-            animate_this_episode=(len(paths)==0 and (itr % 30 == 0) and animate)
-            steps = 0
-            while True:
-                if animate_this_episode:
-                    env.render()
-                    time.sleep(0.05)
-                obs.append(ob)
-                one_hot_ac = sess.run(sy_sampled_ac, feed_dict={sy_ob_no : ob[None]})
-                
-                if discrete:
-                    ac=int(np.argmax(one_hot_ac))
-                else:
-                    ac=one_hot_ac
-                    #print("helloooo",ac)
-                acs.append(one_hot_ac)
-                ob, rew, done, _ = env.step(ac) #transition dynamics P(s_t+1/s_t,a_t), r(s_t+1/s_t,a_t)
-                rewards.append(rew)
-                steps += 1
-                if done or steps > max_path_length:
-                    break
-            path = {"observation" : np.array(obs), 
-                    "reward" : np.array(rewards), 
-                    "action" : np.array(acs)}
-            paths.append(path)
-            timesteps_this_batch += pathlength(path)
-            if timesteps_this_batch > min_timesteps_per_batch:
-                break
+        sample_start = time.time()
+        paths, env_steps = sampler.sample_paths(envs, policy_fn, min_timesteps_per_batch, max_path_length, discrete,
+                                                render=(itr % 30 == 0) and animate)
+        env_steps_per_sec = env_steps / (time.time() - sample_start)
+        timesteps_this_batch = sum(pathlength(path) for path in paths)
         total_timesteps += timesteps_this_batch
 
         # Build arrays for observation, action for the policy gradient update by concatenating 
@@ -354,25 +335,12 @@ def train_PG(exp_name='',
         #====================================================================================#
 
         # DYNAMIC PROGRAMMING
+        rew_n = np.concatenate([path['reward'] for path in paths])
+        path_lengths = [pathlength(path) for path in paths]
         if reward_to_go:
-            q_n=list()
-            for path in paths:
-                pLen=pathlength(path)
-                q_p=np.zeros(pLen)
-                q_p[pLen-1]=path['reward'][pLen-1]
-                for t in reversed(range(pLen-1)):
-                    q_p[t]=path['reward'][t]+gamma*q_p[t+1]
-                    q_p=np.array(q_p)
-                q_n.append(q_p)
+            q_n = advantages.reward_to_go(rew_n, path_lengths, gamma)
         else:
-            q_n=list()
-            for path in paths:
-                pLen=pathlength(path)
-                q_p=0
-                for t in range(pLen):
-                    q_p=q_p+(gamma**t)*(path['reward'][t])
-                q_n.append(q_p*np.ones(pLen))
-        q_n=np.concatenate(q_n)
+            q_n = advantages.discounted_returns(rew_n, path_lengths, gamma)
         #print(q_n.shape)
         #====================================================================================#
         #                           ----------SECTION 5----------
@@ -451,8 +419,10 @@ def train_PG(exp_name='',
         logz.log_tabular("EpLenStd", np.std(ep_lengths))
         logz.log_tabular("TimestepsThisBatch", timesteps_this_batch)
         logz.log_tabular("TimestepsSoFar", total_timesteps)
+        logz.log_tabular("EnvStepsPerSec", env_steps_per_sec)
         logz.dump_tabular()
         logz.pickle_tf_vars()
+    envs.close()
 
 
 def main():
@@ -473,6 +443,8 @@ def main():
     parser.add_argument('--n_experiments', '-e', type=int, default=1)
     parser.add_argument('--n_layers', '-l', type=int, default=1)
     parser.add_argument('--size', '-s', type=int, default=32)
+    parser.add_argument('--num_envs', type=int, default=1)
+    parser.add_argument('--subproc_envs', action='store_true')
     args = parser.parse_args()
 
     if not(os.path.exists('data')):
@@ -498,7 +470,9 @@ def main():
                 normalize_advantages=not(args.dont_normalize_advantages),
                 nn_baseline=args.nn_baseline, 
                 n_layers=args.n_layers,
-                size=args.size
+                size=args.size,
+                num_envs=args.num_envs,
+                subproc_envs=args.subproc_envs
                 )
     '''
     for e in range(args.n_experiments):
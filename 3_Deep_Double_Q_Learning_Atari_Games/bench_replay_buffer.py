@@ -0,0 +1,73 @@
+"""Microbenchmark for ReplayBuffer batch encoding.
+
+Compares the per-index `_encode_observation` path against the batched gather
+in `_encode_sample`, after checking that both produce identical batches.
+
+    python bench_replay_buffer.py --size 100000 --batch_size 32
+"""
+import argparse
+import time
+
+import numpy as np
+
+from dqn_utils import ReplayBuffer
+
+
+def fill_buffer(size, frame_history_len, done_prob, num_frames, seed=0):
+    rng = np.random.RandomState(seed)
+    buf = ReplayBuffer(size, frame_history_len)
+    for _ in range(num_frames):
+        idx = buf.store_frame(rng.randint(0, 256, size=(84, 84, 1), dtype=np.uint8))
+        buf.store_effect(idx, rng.randint(6), rng.randn(), rng.rand() < done_prob)
+    return buf
+
+
+def encode_sample_loop(buf, idxes):
+    """The original one-observation-at-a-time encoding."""
+    obs_batch      = np.concatenate([buf._encode_observation(idx)[None] for idx in idxes], 0)
+    act_batch      = buf.action[idxes]
+    rew_batch      = buf.reward[idxes]
+    next_obs_batch = np.concatenate([buf._encode_observation(idx + 1)[None] for idx in idxes], 0)
+    done_mask      = np.array([1.0 if buf.done[idx] else 0.0 for idx in idxes], dtype=np.float32)
+    return obs_batch, act_batch, rew_batch, next_obs_batch, done_mask
+
+
+def check_equal(buf, batch_size, trials, rng):
+    for _ in range(trials):
+        idxes = rng.randint(0, buf.num_in_buffer - 1, size=batch_size)
+        for old, new in zip(encode_sample_loop(buf, idxes), buf._encode_sample(idxes)):
+            assert old.dtype == new.dtype and old.shape == new.shape
+            assert np.array_equal(old, new)
+
+
+def time_fn(fn, iters):
+    start = time.time()
+    for _ in range(iters):
+        fn()
+    return (time.time() - start) / iters
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--frame_history_len', type=int, default=4)
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--done_prob', type=float, default=0.01)
+    parser.add_argument('--iters', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(1)
+    # a partially filled buffer exercises the start-of-buffer padding, a
+    # wrapped one the modular indexing across the write head
+    for label, num_frames in [('partial', args.size // 2), ('wrapped', args.size + args.size // 3)]:
+        buf = fill_buffer(args.size, args.frame_history_len, args.done_prob, num_frames)
+        check_equal(buf, args.batch_size, 200, rng)
+        idxes = rng.randint(0, buf.num_in_buffer - 1, size=args.batch_size)
+        t_loop = time_fn(lambda: encode_sample_loop(buf, idxes), args.iters)
+        t_vec  = time_fn(lambda: buf._encode_sample(idxes), args.iters)
+        print('%-8s loop: %8.1f us/batch  batched: %8.1f us/batch  speedup: %.1fx'
+              % (label, t_loop * 1e6, t_vec * 1e6, t_loop / t_vec))
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,8 @@ def learn(env,
           exploration=LinearSchedule(1000000, 0.1),
           stopping_criterion=None,
           replay_buffer_size=1000000,
+          replay_buffer_storage='ram',
+          replay_buffer_dir=None,
           batch_size=32,
           gamma=0.99,
           learning_starts=50000,
@@ -62,6 +64,12 @@ def learn(env,
         takes in env and the number of steps executed so far.
     replay_buffer_size: int
         How many memories to store in the replay buffer.
+    replay_buffer_storage: str
+        'ram' to keep the replay buffer in memory, or 'mmap' to keep it in
+        memory-mapped files under `replay_buffer_dir`.
+    replay_buffer_dir: str or None
+        Directory of the memory-mapped replay buffer. Restarting with the
+        same directory resumes from the stored transitions.
     batch_size: int
         How many transitions to sample each time experience is replayed.
     gamma: float
@@ -183,7 +191,8 @@ def learn(env,
     update_target_fn = tf.group(*update_target_fn)
 
     # construct the replay buffer
-    replay_buffer = ReplayBuffer(replay_buffer_size, frame_history_len)
+    replay_buffer = ReplayBuffer(replay_buffer_size, frame_history_len,
+                                 storage=replay_buffer_storage, storage_dir=replay_buffer_dir)
 
     ###############
     # RUN ENV     #
@@ -349,4 +358,6 @@ def learn(env,
             #logz.log_tabular("StdReturn", np.std(returns))
             logz.log_tabular("MaxReturn", best_mean_episode_reward)
             logz.dump_tabular()
-            #logz.pickle_tf_vars()
\ No newline at end of file
+            replay_buffer.flush()
+            #logz.pickle_tf_vars()
+    replay_buffer.flush()
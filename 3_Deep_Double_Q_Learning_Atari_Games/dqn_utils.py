@@ -4,6 +4,8 @@ import gym
 import tensorflow as tf
 import numpy as np
 import random
+import json
+import os
 
 def huber_loss(x, delta=1.0):
     # https://en.wikipedia.org/wiki/Huber_loss
@@ -180,7 +182,7 @@ def get_wrapper_by_name(env, classname):
             raise ValueError("Couldn't find wrapper named %s"%classname)
 
 class ReplayBuffer(object):
-    def __init__(self, size, frame_history_len):
+    def __init__(self, size, frame_history_len, storage='ram', storage_dir=None):
         """This is a memory efficient implementation of the replay buffer.
 
         The sepecific memory optimizations use here are:
@@ -194,6 +196,13 @@ class ReplayBuffer(object):
         For the tipical use case in Atari Deep RL buffer with 1M frames the total
         memory footprint of this buffer is 10^6 * 84 * 84 bytes ~= 7 gigabytes
 
+        With `storage='mmap'` the buffer arrays are `np.memmap` files in
+        `storage_dir` instead, so the frames live in the OS page cache rather
+        than in the memory of the training process, and a run restarted with
+        the same `storage_dir` continues from the stored contents. Reopening
+        raises a ValueError if the stored size, frame history, dtypes or, on
+        the first stored frame, frame shape differ from this buffer's.
+
         Warning! Assumes that returning frame of zeros at the beginning
         of the episode, when there is less frames than `frame_history_len`,
         is acceptable.
@@ -205,9 +214,18 @@ class ReplayBuffer(object):
             overflows the old memories are dropped.
         frame_history_len: int
             Number of memories to be retried for each observation.
+        storage: str
+            Either 'ram' to keep the buffer in process memory, or 'mmap' to
+            keep it in memory-mapped files under `storage_dir`.
+        storage_dir: str or None
+            Directory of the memory-mapped files, required for 'mmap'.
         """
+        assert storage in ('ram', 'mmap'), "unknown replay storage %s" % storage
+        assert storage == 'ram' or storage_dir is not None, "mmap storage needs a storage_dir"
         self.size = size
         self.frame_history_len = frame_history_len
+        self.storage = storage
+        self.storage_dir = storage_dir
 
         self.next_idx      = 0
         self.num_in_buffer = 0
@@ -216,20 +234,70 @@ class ReplayBuffer(object):
         self.action   = None
         self.reward   = None
         self.done     = None
+        # (next_idx, num_in_buffer) mirrored to disk for the mmap storage
+        self._counters = None
+
+        if storage == 'mmap' and os.path.exists(self._storage_path('header.json')):
+            self._open_storage()
 
     def can_sample(self, batch_size):
         """Returns true if `batch_size` different transitions can be sampled from the buffer."""
         return batch_size + 1 <= self.num_in_buffer
 
     def _encode_sample(self, idxes):
-        obs_batch      = np.concatenate([self._encode_observation(idx)[None] for idx in idxes], 0)
+        idxes          = np.asarray(idxes)
         act_batch      = self.action[idxes]
         rew_batch      = self.reward[idxes]
-        next_obs_batch = np.concatenate([self._encode_observation(idx + 1)[None] for idx in idxes], 0)
-        done_mask      = np.array([1.0 if self.done[idx] else 0.0 for idx in idxes], dtype=np.float32)
+        done_mask      = self.done[idxes].astype(np.float32)
+        # low-dimensional observations (RAM) have no frame history to stack
+        if len(self.obs.shape) == 2:
+            return self.obs[idxes], act_batch, rew_batch, self.obs[idxes + 1], done_mask
+        obs_batch, next_obs_batch = self._encode_observation_pairs(idxes)
 
         return obs_batch, act_batch, rew_batch, next_obs_batch, done_mask
 
+    def _encode_observation_pairs(self, idxes):
+        """Batched equivalent of calling `_encode_observation` on `idxes` and
+        `idxes + 1`.
+
+        Both observations of a transition share `frame_history_len - 1` frames,
+        so the frames for the whole batch are gathered once as a
+        (batch_size, frame_history_len + 1) block and each observation is a
+        window over it. A frame is zeroed when it lies before the start of the
+        buffer (while it is not yet full) or when an episode ended between it
+        and the newest frame of its window, which reproduces the padding done
+        by `_encode_observation`.
+        """
+        k = self.frame_history_len
+        batch_size = len(idxes)
+        img_h, img_w, img_c = self.obs.shape[1], self.obs.shape[2], self.obs.shape[3]
+
+        pos    = idxes[:, None] + np.arange(-k + 1, 2)  # (B, k+1)
+        frames = self.obs[pos % self.size]              # (B, k+1, h, w, c)
+        done   = self.done[pos % self.size]
+        valid  = pos >= 0 if self.num_in_buffer != self.size else np.ones_like(done)
+
+        def window_mask(lo, hi):
+            # a frame in [lo, hi) is kept unless an episode ended at or after
+            # it, strictly before the newest frame hi - 1 of the window
+            cut = np.zeros((batch_size, hi - lo), dtype=bool)
+            cut[:, :-1] = np.logical_or.accumulate(done[:, lo:hi - 1][:, ::-1], axis=1)[:, ::-1]
+            return valid[:, lo:hi] & ~cut
+
+        def stack(window, mask):
+            # both windows are views of `frames`, so a window is copied only
+            # when it has frames to zero out
+            if not mask.all():
+                window = window.copy()
+                window[~mask] = 0
+            # like the unpadded path of `_encode_observation`, this is a view
+            # over frame-major memory whenever img_c == 1
+            return window.transpose(0, 2, 3, 1, 4).reshape(batch_size, img_h, img_w, k * img_c)
+
+        obs_batch      = stack(frames[:, :k], window_mask(0, k))
+        next_obs_batch = stack(frames[:, 1:], window_mask(1, k + 1))
+        return obs_batch, next_obs_batch
+
 
     def sample(self, batch_size):
         """Sample `batch_size` different transitions.
@@ -323,15 +391,18 @@ class ReplayBuffer(object):
             Index at which the frame is stored. To be used for `store_effect` later.
         """
         if self.obs is None:
-            self.obs      = np.empty([self.size] + list(frame.shape), dtype=np.uint8)
-            self.action   = np.empty([self.size],                     dtype=np.int32)
-            self.reward   = np.empty([self.size],                     dtype=np.float32)
-            self.done     = np.empty([self.size],                     dtype=np.bool)
+            self._allocate_storage(frame.shape)
+        elif frame.shape != self.obs.shape[1:]:
+            # e.g. a storage_dir reopened for an env with other observations
+            raise ValueError("frame of shape %s stored in a replay buffer of %s frames"
+                             % (frame.shape, self.obs.shape[1:]))
         self.obs[self.next_idx] = frame
 
         ret = self.next_idx
         self.next_idx = (self.next_idx + 1) % self.size
         self.num_in_buffer = min(self.size, self.num_in_buffer + 1)
+        if self._counters is not None:
+            self._counters[:] = (self.next_idx, self.num_in_buffer)
 
         return ret
 
@@ -356,3 +427,71 @@ class ReplayBuffer(object):
         self.reward[idx] = reward
         self.done[idx]   = done
 
+    def flush(self):
+        """Write the memory-mapped buffer contents back to disk. A no-op for
+        the in-memory storage."""
+        if self._counters is None:
+            return
+        for arr in (self.obs, self.action, self.reward, self.done, self._counters):
+            arr.flush()
+
+    def _storage_path(self, name):
+        return os.path.join(self.storage_dir, name)
+
+    def _storage_shapes(self, frame_shape):
+        return [('obs',    [self.size] + list(frame_shape), np.uint8),
+                ('action', [self.size],                     np.int32),
+                ('reward', [self.size],                     np.float32),
+                ('done',   [self.size],                     np.bool_)]
+
+    def _storage_dtypes(self, frame_shape):
+        return {name: np.dtype(dtype).str for name, _, dtype in self._storage_shapes(frame_shape)}
+
+    def _allocate_storage(self, frame_shape):
+        if self.storage == 'ram':
+            for name, shape, dtype in self._storage_shapes(frame_shape):
+                setattr(self, name, np.empty(shape, dtype=dtype))
+            return
+
+        if not os.path.exists(self.storage_dir):
+            os.makedirs(self.storage_dir)
+        for name, shape, dtype in self._storage_shapes(frame_shape):
+            setattr(self, name, np.memmap(self._storage_path(name + '.dat'),
+                                          dtype=dtype, mode='w+', shape=tuple(shape)))
+        self._counters = np.memmap(self._storage_path('counters.dat'),
+                                   dtype=np.int64, mode='w+', shape=(2,))
+        # the header is written last, so a directory with a header always
+        # has complete data files behind it
+        with open(self._storage_path('header.json'), 'w') as f:
+            json.dump({'size': self.size,
+                       'frame_history_len': self.frame_history_len,
+                       'frame_shape': list(frame_shape),
+                       'dtypes': self._storage_dtypes(frame_shape)}, f)
+
+    def _open_storage(self):
+        """Reopen the memory-mapped files left in `storage_dir` by an earlier run."""
+        with open(self._storage_path('header.json')) as f:
+            header = json.load(f)
+        if header['size'] != self.size:
+            raise ValueError("replay storage in %s holds %d transitions, not %d"
+                             % (self.storage_dir, header['size'], self.size))
+        if header['frame_history_len'] != self.frame_history_len:
+            raise ValueError("replay storage in %s stacks %d frames, not %d"
+                             % (self.storage_dir, header['frame_history_len'], self.frame_history_len))
+        # headers without dtypes were written with the current ones
+        dtypes = self._storage_dtypes(header['frame_shape'])
+        if header.get('dtypes', dtypes) != dtypes:
+            raise ValueError("replay storage in %s has dtypes %s, not %s"
+                             % (self.storage_dir, header['dtypes'], dtypes))
+
+        for name, shape, dtype in self._storage_shapes(header['frame_shape']):
+            setattr(self, name, np.memmap(self._storage_path(name + '.dat'),
+                                          dtype=dtype, mode='r+', shape=tuple(shape)))
+        self._counters = np.memmap(self._storage_path('counters.dat'),
+                                   dtype=np.int64, mode='r+', shape=(2,))
+        self.next_idx, self.num_in_buffer = int(self._counters[0]), int(self._counters[1])
+
+        # the interrupted episode does not continue after the restart, and the
+        # last frame may not have had its effect stored, so close it off
+        if self.num_in_buffer > 0:
+            self.done[(self.next_idx - 1) % self.size] = True
@@ -30,7 +30,9 @@ def atari_model(img_in, num_actions, scope, reuse=False):
 
 def atari_learn(env,
                 session,
-                num_timesteps):
+                num_timesteps,
+                replay_buffer_storage='ram',
+                replay_buffer_dir=None):
     # This is just a rough estimate
     num_iterations = float(num_timesteps) / 4.0
 
@@ -68,6 +70,8 @@ def atari_learn(env,
         exploration=exploration_schedule,
         stopping_criterion=stopping_criterion,
         replay_buffer_size=1000000,
+        replay_buffer_storage=replay_buffer_storage,
+        replay_buffer_dir=replay_buffer_dir,
         batch_size=32,
         gamma=0.99,
         learning_starts=50000,
@@ -117,6 +121,11 @@ def get_env(task, seed):
     return env
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replay_storage', type=str, default='ram', choices=['ram', 'mmap'])
+    parser.add_argument('--replay_dir', type=str, default=None)
+    args = parser.parse_args()
+
     # Get Atari games.
     benchmark = gym.benchmark_spec('Atari40M')
 
@@ -127,7 +136,9 @@ def main():
     seed = 0 # Use a seed of zero (you may want to randomize the seed!)
     env = get_env(task, seed)
     session = get_session()
-    atari_learn(env, session, num_timesteps=task.max_timesteps)
+    atari_learn(env, session, num_timesteps=task.max_timesteps,
+                replay_buffer_storage=args.replay_storage,
+                replay_buffer_dir=args.replay_dir)
 
 if __name__ == "__main__":
     main()
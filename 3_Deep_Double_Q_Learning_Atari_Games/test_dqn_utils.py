@@ -0,0 +1,81 @@
+import json
+import os
+import random
+
+import numpy as np
+import pytest
+
+from dqn_utils import ReplayBuffer
+
+
+def fill(buffers, num_frames, frame_shape=(4, 4, 1), seed=0):
+    """Stores the same frames and effects in each buffer, with episodes of
+    varying length, and leaves the effect of the last frame unstored."""
+    rng = np.random.RandomState(seed)
+    for t in range(num_frames):
+        frame = rng.randint(0, 256, size=frame_shape).astype(np.uint8)
+        action, reward, done = rng.randint(6), rng.randn(), rng.rand() < 0.15
+        for buf in buffers:
+            idx = buf.store_frame(frame)
+            if t < num_frames - 1:
+                buf.store_effect(idx, action, reward, done)
+
+
+def assert_samples_equal(a, b, batch_size=16, seed=0):
+    for _ in range(5):
+        random.seed(seed)
+        batch_a = a.sample(batch_size)
+        random.seed(seed)
+        batch_b = b.sample(batch_size)
+        for x, y in zip(batch_a, batch_b):
+            np.testing.assert_array_equal(x, y)
+        seed += 1
+    np.testing.assert_array_equal(a.encode_recent_observation(), b.encode_recent_observation())
+
+
+@pytest.mark.parametrize('num_frames', [30, 130])
+def test_mmap_reopen_matches_ram(tmp_path, num_frames):
+    storage_dir = str(tmp_path / 'replay')
+    ram = ReplayBuffer(50, 4)
+    mmap = ReplayBuffer(50, 4, storage='mmap', storage_dir=storage_dir)
+    fill([ram, mmap], num_frames)
+    assert_samples_equal(ram, mmap)
+    mmap.flush()
+    del mmap
+
+    reopened = ReplayBuffer(50, 4, storage='mmap', storage_dir=storage_dir)
+    assert (reopened.next_idx, reopened.num_in_buffer) == (ram.next_idx, ram.num_in_buffer)
+    # the episode interrupted by the restart is closed off, its last frame
+    # had no effect stored
+    last = (ram.next_idx - 1) % ram.size
+    assert reopened.done[last]
+    ram.done[last] = True
+    assert_samples_equal(ram, reopened)
+
+    # the reopened buffer continues where the first run stopped
+    fill([ram, reopened], 20, seed=1)
+    assert_samples_equal(ram, reopened)
+
+
+def test_mmap_reopen_header_mismatch(tmp_path):
+    storage_dir = str(tmp_path / 'replay')
+    buf = ReplayBuffer(50, 4, storage='mmap', storage_dir=storage_dir)
+    fill([buf], 10)
+    buf.flush()
+    del buf
+
+    with pytest.raises(ValueError):
+        ReplayBuffer(60, 4, storage='mmap', storage_dir=storage_dir)
+    with pytest.raises(ValueError):
+        ReplayBuffer(50, 2, storage='mmap', storage_dir=storage_dir)
+    with pytest.raises(ValueError):
+        ReplayBuffer(50, 4, storage='mmap', storage_dir=storage_dir).store_frame(np.zeros((5, 5, 1), np.uint8))
+
+    header_path = os.path.join(storage_dir, 'header.json')
+    with open(header_path) as f:
+        header = json.load(f)
+    header['dtypes']['reward'] = np.dtype(np.float64).str
+    with open(header_path, 'w') as f:
+        json.dump(header, f)
+    with pytest.raises(ValueError):
+        ReplayBuffer(50, 4, storage='mmap', storage_dir=storage_dir)
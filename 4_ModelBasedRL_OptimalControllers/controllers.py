@@ -1,5 +1,5 @@
 import numpy as np
-from cost_functions import trajectory_cost_fn
+from cost_functions import trajectory_cost_fn, batched_trajectory_cost_fn
 import time
 
 class Controller():
@@ -8,6 +8,9 @@ class Controller():
     # Get the appropriate action(s) for this state(s)
     def get_action(self, state):
         pass
+    # Called at the start of every path
+    def reset(self):
+        pass
 
 
 class RandomController(Controller):
@@ -17,6 +20,8 @@ class RandomController(Controller):
         """ YOUR CODE HERE """
         """ Your code should randomly sample an action uniformly from the action space """
         return self.ac.sample(),0
+    def get_actions(self, states):
+        return np.array([self.ac.sample() for _ in states]), np.zeros(len(states))
 
 
 class MPCcontroller(Controller):
@@ -27,25 +32,164 @@ class MPCcontroller(Controller):
 				 horizon=5, 
 				 cost_fn=None, 
 				 num_simulated_paths=10,
+				 unroll=False,
+				 num_particles=1,
 				 ):
+        """ With unroll=True the dynamics model rolls out the whole horizon inside its graph
+        (one sess.run per action) instead of being called once per horizon step.
+        With num_particles > 1 every action sequence is simulated num_particles times through the
+        model's predict_trajectories, which samples (e.g. EnsembleDynamicsModel), and its cost is the
+        average over the particles.
+        get_actions() plans for a batch of states at once, simulating the paths of all of them
+        through the same model calls """
+        assert num_particles == 1 or unroll, "particles are propagated by the unrolled rollout"
         self.env = env
         self.dyn_model = dyn_model
         self.horizon = horizon
         self.cost_fn = cost_fn
         self.num_simulated_paths = num_simulated_paths
-    
+        self.unroll = unroll
+        self.num_particles = num_particles
+        self.reset_stats()
+
+    def reset_stats(self):
+        """ Reset the planning statistics: dynamics model evaluations (one per simulated path
+        per horizon step), actions planned and seconds spent planning """
+        self.model_evals = 0
+        self.num_planned = 0
+        self.planning_time = 0.
+
     def get_action(self, state):
+        acts, costs = self.get_actions(np.asarray(state)[None])
+        return acts[0], costs[0]
+
+    def get_actions(self, states):
+        """ Plan for a batch of states of shape (num_states, ob_dim); returns their actions
+        and the predicted costs of their plans """
+        start = time.time()
+        acts, costs = self.plan(states)
+        self.planning_time += time.time() - start
+        self.num_planned += len(states)
+        return acts, costs
+
+    def plan(self, states):
         """ Note: be careful to batch your simulations through the model for speed """
-    	 #sampled_acts = np.array([[self.env.action_space.sample() for j in range(self.num_simulated_paths)] for i in range(self.horizon)])
-        sampled_acts = np.array([[self.env.action_space.sample() for j in range(self.num_simulated_paths)] for i in range(self.horizon)])
-        #sampled_acts=np.random.randint(,size=[self.horizon,self.num_simulated_paths])
-        states = [np.array([state] * self.num_simulated_paths)]
-        nstates = []
-        for i in range(self.horizon):
-             nstates.append(self.dyn_model.predict(states[-1], sampled_acts[i, :]))
-             if i < self.horizon: states.append(nstates[-1])
-        costs = trajectory_cost_fn(self.cost_fn, states, sampled_acts, nstates)
-        return sampled_acts[0][np.argmin(costs)],min(costs)
+        sampled_acts = self.sample_actions(self.horizon, len(states), self.num_simulated_paths)
+        costs = self.rollout_costs(states, sampled_acts)
+        best = np.argmin(costs, axis=1)
+        rows = np.arange(len(states))
+        return sampled_acts[0, rows, best], costs[rows, best]
+
+    def sample_actions(self, horizon, num_states, num_paths):
+        """ Uniformly sample a (horizon, num_states, num_paths, ac_dim) tensor of actions within the action space bounds """
+        low, high = self.env.action_space.low, self.env.action_space.high
+        return np.random.uniform(low, high, size=(horizon, num_states, num_paths) + low.shape)
+
+    def rollout_costs(self, states, acts):
+        """ Simulate the action sequences acts, of shape (horizon, num_states, num_paths, ac_dim),
+        from states of shape (num_states, ob_dim) through the dynamics model and return the cost
+        of each path, of shape (num_states, num_paths) """
+        horizon, num_states, num_paths = acts.shape[:3]
+        # flatten to (horizon, rows, ac_dim); the particles of a path are adjacent rows, so
+        # they are spread over the ensemble members
+        acts = np.repeat(acts.reshape(horizon, num_states * num_paths, -1), self.num_particles, axis=1)
+        init_states = np.repeat(states, num_paths * self.num_particles, axis=0)
+        self.model_evals += acts.shape[0] * acts.shape[1]
+        if self.unroll:
+            nstates = self.dyn_model.predict_trajectories(init_states, acts)
+        else:
+            nstates = []
+            for i in range(len(acts)):
+                nstates.append(self.dyn_model.predict(nstates[-1] if nstates else init_states, acts[i]))
+            nstates = np.array(nstates)
+        prev_states = np.concatenate([init_states[None], nstates[:-1]])
+        costs = batched_trajectory_cost_fn(self.cost_fn, prev_states, acts, nstates)
+        return costs.reshape(num_states, num_paths, self.num_particles).mean(axis=2)
+
+
+class CEMcontroller(MPCcontroller):
+    """ MPC that refines a Gaussian over action sequences with the cross-entropy method: each of
+    num_iterations rounds simulates num_simulated_paths sequences and refits the mean and std to
+    the num_elites cheapest ones. The mean is warm-started from the previous plan shifted by one step.
+    The planned action is the first one of the final mean, and its cost the predicted cost of that
+    mean sequence, simulated once more after the last round """
+    def __init__(self, 
+				 env, 
+				 dyn_model, 
+				 horizon=5, 
+				 cost_fn=None, 
+				 num_simulated_paths=10,
+				 unroll=False,
+				 num_particles=1,
+				 num_iterations=5,
+				 num_elites=10,
+				 alpha=0.1,
+				 ):
+        MPCcontroller.__init__(self, env, dyn_model, horizon, cost_fn, num_simulated_paths, unroll, num_particles)
+        self.num_iterations = num_iterations
+        self.num_elites = num_elites
+        self.alpha = alpha # weight kept on the previous mean and std at each refit
+        self.reset()
+
+    def reset(self):
+        self.prev_plan = None
+
+    def initial_distribution(self, num_states):
+        """ Mean and std of shape (horizon, num_states, ac_dim) """
+        low, high = self.env.action_space.low, self.env.action_space.high
+        mean = np.tile((low + high) / 2., (self.horizon, num_states, 1))
+        if self.prev_plan is not None and self.prev_plan.shape[1] == num_states:
+            mean[:-1] = self.prev_plan[1:]
+        std = np.tile((high - low) / 4., (self.horizon, num_states, 1))
+        return mean, std
+
+    def perturb(self, mean, std):
+        low, high = self.env.action_space.low, self.env.action_space.high
+        noise = np.random.randn(self.horizon, mean.shape[1], self.num_simulated_paths, len(low))
+        return np.clip(mean[:, :, None] + std[:, :, None] * noise, low, high)
+
+    def plan(self, states):
+        mean, std = self.initial_distribution(len(states))
+        for _ in range(self.num_iterations):
+            acts = self.perturb(mean, std)
+            costs = self.rollout_costs(states, acts)
+            elite_idx = np.argsort(costs, axis=1)[:, :self.num_elites]
+            elites = np.take_along_axis(acts, elite_idx[None, :, :, None], axis=2)
+            mean = self.alpha * mean + (1 - self.alpha) * elites.mean(axis=2)
+            std = self.alpha * std + (1 - self.alpha) * elites.std(axis=2)
+        self.prev_plan = mean
+        return mean[0], self.rollout_costs(states, mean[:, :, None])[:, 0]
+
+
+class MPPIcontroller(CEMcontroller):
+    """ MPC with model predictive path integral updates: the plan is moved to the average of the
+    simulated sequences weighted by exp(-cost / temperature), for num_iterations rounds, with the
+    same shifted warm start, fixed sampling noise and returned cost as CEMcontroller """
+    def __init__(self, 
+				 env, 
+				 dyn_model, 
+				 horizon=5, 
+				 cost_fn=None, 
+				 num_simulated_paths=10,
+				 unroll=False,
+				 num_particles=1,
+				 num_iterations=5,
+				 temperature=1.,
+				 ):
+        CEMcontroller.__init__(self, env, dyn_model, horizon, cost_fn, num_simulated_paths, unroll,
+                               num_particles, num_iterations=num_iterations)
+        self.temperature = temperature
+
+    def plan(self, states):
+        mean, std = self.initial_distribution(len(states))
+        for _ in range(self.num_iterations):
+            acts = self.perturb(mean, std)
+            costs = self.rollout_costs(states, acts)
+            weights = np.exp(-(costs - np.min(costs, axis=1, keepdims=True)) / self.temperature)
+            weights /= np.sum(weights, axis=1, keepdims=True)
+            mean = np.einsum('np,hnpa->hna', weights, acts)
+        self.prev_plan = mean
+        return mean[0], self.rollout_costs(states, mean[:, :, None])[:, 0]
  
 
 		
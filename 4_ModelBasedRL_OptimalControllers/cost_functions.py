@@ -8,24 +8,25 @@ import numpy as np
 
 def cheetah_cost_fn(state, action, next_state):
     if len(state.shape) > 1:
+        # batched over all leading axes, e.g. (num_paths, ob_dim) or (horizon, num_paths, ob_dim)
 
         heading_penalty_factor=10
-        scores=np.zeros((state.shape[0],))
+        scores=np.zeros(state.shape[:-1])
 
         #dont move front shin back so far that you tilt forward
-        front_leg = state[:,5]
+        front_leg = state[...,5]
         my_range = 0.2
         scores[front_leg>=my_range] += heading_penalty_factor
 
-        front_shin = state[:,6]
+        front_shin = state[...,6]
         my_range = 0
         scores[front_shin>=my_range] += heading_penalty_factor
 
-        front_foot = state[:,7]
+        front_foot = state[...,7]
         my_range = 0
         scores[front_foot>=my_range] += heading_penalty_factor
 
-        scores-= (next_state[:,17] - state[:,17]) / 0.01 #+ 0.1 * (np.sum(action**2, axis=1))
+        scores-= (next_state[...,17] - state[...,17]) / 0.01 #+ 0.1 * (np.sum(action**2, axis=-1))
         return scores
 
     heading_penalty_factor=10
@@ -59,4 +60,10 @@ def trajectory_cost_fn(cost_fn, states, actions, next_states):
     trajectory_cost = 0
     for i in range(len(actions)):
         trajectory_cost += cost_fn(states[i], actions[i], next_states[i])
-    return trajectory_cost
\ No newline at end of file
+    return trajectory_cost
+
+def batched_trajectory_cost_fn(cost_fn, states, actions, next_states):
+    """ Same as trajectory_cost_fn for arrays of shape (horizon, num_paths, dim), with a cost_fn
+    that is batched over leading axes: all steps of all paths are scored in one call, and the
+    cost of each path, of shape (num_paths,), is returned """
+    return np.sum(cost_fn(states, actions, next_states), axis=0)
@@ -1,5 +1,6 @@
 import tensorflow as tf
 import numpy as np
+import time
 
 # Predefined function to build a feedforward neural network
 def build_mlp(input_placeholder, 
@@ -8,21 +9,58 @@ def build_mlp(input_placeholder,
               n_layers=2, 
               size=500, 
               activation=tf.tanh,
-              output_activation=None
+              output_activation=None,
+              reuse=False
               ):
     out = input_placeholder
-    with tf.variable_scope(scope):
+    with tf.variable_scope(scope, reuse=reuse):
         for _ in range(n_layers):
             out = tf.layers.dense(out, size, activation=activation)
         out = tf.layers.dense(out, output_size, activation=output_activation)
     return out
 
+# Feedforward networks of an ensemble, one per leading index of the input. Each layer keeps
+# the weights of all members stacked in a single (ensemble_size, in, out) tensor, so the
+# whole ensemble is evaluated with one batched matmul per layer
+def build_ensemble_mlp(input_tensor,
+              output_size,
+              scope,
+              ensemble_size,
+              n_layers=2,
+              size=500,
+              activation=tf.tanh,
+              output_activation=None,
+              reuse=False
+              ):
+    out = input_tensor
+    sizes = [size] * n_layers + [output_size]
+    with tf.variable_scope(scope, reuse=reuse):
+        for i, out_size in enumerate(sizes):
+            in_size = out.get_shape().as_list()[-1]
+            W = tf.get_variable('W%d' % i, shape=[ensemble_size, in_size, out_size],
+                                initializer=tf.truncated_normal_initializer(stddev=1. / (2 * np.sqrt(in_size))))
+            b = tf.get_variable('b%d' % i, shape=[ensemble_size, 1, out_size],
+                                initializer=tf.zeros_initializer())
+            out = tf.matmul(out, W) + b
+            act = activation if i < n_layers else output_activation
+            if act is not None:
+                out = act(out)
+    return out
+
 def normalize(data, mean, std):
     return (data - mean) / (std + 1e-10)
 
 def denormalize(data, mean, std):
     return data * (std + 1e-10) + mean 
 
+def extend_validation_split(is_validation, count, validation_fraction):
+    """ Per-row validation flags of a dataset that grew by appending to count rows: each new row is
+    assigned to the validation or the training split once, and keeps it in every later fit """
+    new_rows=count-len(is_validation)
+    new_flags=np.zeros(new_rows, dtype=bool)
+    new_flags[np.random.permutation(new_rows)[:int(new_rows*validation_fraction)]]=True
+    return np.concatenate([is_validation,new_flags])
+
 class NNDynamicsModel():
     def __init__(self, 
                  env, 
@@ -34,31 +72,68 @@ class NNDynamicsModel():
                  batch_size,
                  iterations,
                  learning_rate,
-                 sess
+                 sess,
+                 validation_fraction=0.1,
+                 patience=5,
+                 incremental=False,
+                 old_data_ratio=1.
                  ):
         
-        """ Note: Be careful about normalization """
+        """ Note: Be careful about normalization
+
+        fit() trains for up to `iterations` epochs over shuffled minibatches drawn inside the graph,
+        holding out `validation_fraction` of the data and stopping once the validation loss has not
+        improved for `patience` epochs, with the weights of the best epoch. The dataset is assumed
+        to only grow by appending, so rows keep the split they were assigned when first seen. With
+        `incremental=True`, fit() trains on the rows added since the previous fit mixed with a
+        random sample of `old_data_ratio` times as many older rows """
         # https://stackoverflow.com/questions/37770911/tensorflow-creating-a-graph-in-a-class-and-running-it-ouside
         self.normalization=normalization
         self.iterations=iterations
         self.batch_size=batch_size
         self.sess=sess
+        self.validation_fraction=validation_fraction
+        self.patience=patience
+        self.incremental=incremental
+        self.old_data_ratio=old_data_ratio
+        self.num_fitted=0 # rows of the dataset seen by the previous fit, for the incremental mode
+        self.is_validation=np.zeros(0, dtype=bool) # split of each row of the dataset
+        self.fit_time=0.
+        self.validation_loss=float('nan')
+        self.mlp_args=(n_layers,size,activation,output_activation)
+        self.rollouts={} # in-graph rollouts built by predict_trajectories, keyed by horizon
         ob_dim = env.observation_space.shape[0] #local variables of init just for convinience
         ac_dim = env.action_space.shape[0]
+        self.ob_dim, self.ac_dim = ob_dim, ac_dim
         self.sy_ob = tf.placeholder(shape=[None, ob_dim], name="ob", dtype=tf.float32)
         self.sy_ac = tf.placeholder(shape=[None, ac_dim], name="ac", dtype=tf.float32)
         self.delta = tf.placeholder(shape=[None, ob_dim], name="del", dtype=tf.float32)
         ob_ac = tf.concat([self.sy_ob,self.sy_ac],axis=1)
         self.delta_prediction=build_mlp(ob_ac ,ob_dim,'trans_dyna',
                                    n_layers,size,activation,output_activation)
-        loss=tf.losses.mean_squared_error(labels=self.delta,predictions=self.delta_prediction)
-        self.dyna_update_op=tf.train.AdamOptimizer(learning_rate).minimize(loss)
+        self.loss=tf.losses.mean_squared_error(labels=self.delta,predictions=self.delta_prediction)
+
+        # training input pipeline: the (normalized) training set is fed once per fit and shuffled
+        # into minibatches inside the graph, every epoch in a new order
+        self.sy_train=[tf.placeholder(shape=[None, d], dtype=tf.float32) for d in (ob_dim, ac_dim, ob_dim)]
+        self.sy_train_count=tf.placeholder(shape=[], dtype=tf.int64)
+        self.sy_epochs=tf.placeholder(shape=[], dtype=tf.int64)
+        dataset=tf.data.Dataset.from_tensor_slices(tuple(self.sy_train))
+        dataset=dataset.shuffle(buffer_size=self.sy_train_count).batch(batch_size).repeat(self.sy_epochs)
+        self.train_iterator=dataset.make_initializable_iterator()
+        batch_ob, batch_ac, batch_delta = self.train_iterator.get_next()
+        batch_prediction=build_mlp(tf.concat([batch_ob,batch_ac],axis=1),ob_dim,'trans_dyna',
+                                   n_layers,size,activation,output_activation,reuse=True)
+        train_loss=tf.losses.mean_squared_error(labels=batch_delta,predictions=batch_prediction)
+        self.dyna_update_op=tf.train.AdamOptimizer(learning_rate).minimize(train_loss)
+        self.params=tf.trainable_variables('trans_dyna')
 
     def fit(self, data):
         """
         Write a function to take in a dataset of (unnormalized)states, (unnormalized)actions, (unnormalized)next_states and 
         fit the dynamics model going from normalized states, normalized actions to normalized state differences (s_t+1 - s_t)
         """
+        start_time=time.time()
         #paths=data
         obs = data['observations']
         delta = data["delta"]
@@ -71,21 +146,50 @@ class NNDynamicsModel():
         acs = normalize(acs,self.normalization['actions'][0],self.normalization['actions'][1])
         
         
-        train_count = len(obs)  
-        N_EPOCHS=50
-        for i in range(1, N_EPOCHS + 1):       # tf.data /tf.train.batch /tf.train.shuffle_batch -- later
-            print("epoch: ",i)
-            done=False
-            start=0;end=0
-            while(not done):
-                start=end
-                end=min(start+self.batch_size,train_count)
-                #print(start+self.batch_size,train_count)
-                #print(end)
-                if(end==train_count):
-                    done=True
-                self.sess.run(self.dyna_update_op, feed_dict={self.sy_ob:obs[start:end], self.sy_ac:acs[start:end], self.delta:delta[start:end] })
-                
+        count=len(obs)
+        if self.incremental and self.num_fitted > 0:
+            new_rows=np.arange(self.num_fitted,count)
+            num_old=min(self.num_fitted,int(self.old_data_ratio*len(new_rows)))
+            rows=np.concatenate([new_rows,np.random.choice(self.num_fitted,num_old,replace=False)])
+        else:
+            rows=np.arange(count)
+        self.num_fitted=count
+        self.is_validation=extend_validation_split(self.is_validation,count,self.validation_fraction)
+        val_rows, train_rows = rows[self.is_validation[rows]], rows[~self.is_validation[rows]]
+        num_val=len(val_rows)
+
+        feed=dict(zip(self.sy_train,(obs[train_rows],acs[train_rows],delta[train_rows])))
+        feed.update({self.sy_train_count:len(train_rows), self.sy_epochs:self.iterations})
+        self.sess.run(self.train_iterator.initializer, feed_dict=feed)
+        steps_per_epoch=int(np.ceil(len(train_rows)/float(self.batch_size)))
+        val_feed={self.sy_ob:obs[val_rows], self.sy_ac:acs[val_rows], self.delta:delta[val_rows]}
+
+        best_loss=float('inf')
+        best_params=None
+        bad_epochs=0
+        for i in range(1, self.iterations + 1):
+            for _ in range(steps_per_epoch):
+                self.sess.run(self.dyna_update_op)
+            if num_val==0:
+                print("epoch: ",i)
+                continue
+            val_loss=self.sess.run(self.loss, feed_dict=val_feed)
+            print("epoch: ",i,"validation loss: ",val_loss)
+            if val_loss < best_loss:
+                best_loss=val_loss
+                best_params=self.sess.run(self.params)
+                bad_epochs=0
+            else:
+                bad_epochs+=1
+                if bad_epochs >= self.patience:
+                    break
+        # keep the model of the best epoch, which validation_loss describes
+        if best_params is not None:
+            for param, value in zip(self.params, best_params):
+                param.load(value, self.sess)
+
+        self.fit_time=time.time()-start_time
+        self.validation_loss=best_loss if num_val > 0 else float('nan')
 
     def predict(self, states, actions):
         """ Write a function to take in a batch of (unnormalized) states and (unnormalized) actions 
@@ -100,4 +204,189 @@ class NNDynamicsModel():
         prediction=self.sess.run(self.delta_prediction, feed_dict={self.sy_ob:obs, self.sy_ac:acs })
             
         
-        return denormalize(prediction,self.normalization['delta'][0],self.normalization['delta'][1]) + states  
+        return denormalize(prediction,self.normalization['delta'][0],self.normalization['delta'][1]) + states
+
+    def predict_trajectories(self, states, actions):
+        """ Roll the model forward from (unnormalized) states of shape (num_paths, ob_dim) under
+        action sequences of shape (horizon, num_paths, ac_dim), and return the (unnormalized)
+        predicted next states of shape (horizon, num_paths, ob_dim). The whole horizon is unrolled
+        inside one graph, so this costs a single sess.run instead of one per step """
+        horizon=actions.shape[0]
+        if horizon not in self.rollouts:
+            self.rollouts[horizon]=self._build_rollout(horizon)
+        sy_ob0, sy_acs, next_obs = self.rollouts[horizon]
+        return self.sess.run(next_obs, feed_dict={sy_ob0:states, sy_acs:actions})
+
+    def _build_rollout(self, horizon):
+        # the normalization statistics are baked into the rollout graph as constants
+        stats={k:[tf.constant(x, dtype=tf.float32) for x in v] for k,v in self.normalization.items()}
+        sy_ob0 = tf.placeholder(shape=[None, self.ob_dim], name="rollout_ob", dtype=tf.float32)
+        sy_acs = tf.placeholder(shape=[horizon, None, self.ac_dim], name="rollout_acs", dtype=tf.float32)
+        ob=sy_ob0
+        next_obs=[]
+        for t in range(horizon):
+            ob_ac = tf.concat([normalize(ob,*stats['observations']),normalize(sy_acs[t],*stats['actions'])],axis=1)
+            delta = build_mlp(ob_ac,self.ob_dim,'trans_dyna',*self.mlp_args,reuse=True)
+            ob = denormalize(delta,*stats['delta']) + ob
+            next_obs.append(ob)
+        return sy_ob0, sy_acs, tf.stack(next_obs)
+
+
+class EnsembleDynamicsModel():
+    def __init__(self, 
+                 env, 
+                 n_layers,
+                 size, 
+                 activation, 
+                 output_activation, 
+                 normalization,
+                 batch_size,
+                 iterations,
+                 learning_rate,
+                 sess,
+                 ensemble_size=5,
+                 validation_fraction=0.1,
+                 patience=5
+                 ):
+        """ Probabilistic ensemble of ensemble_size dynamics models (https://arxiv.org/abs/1805.12114).
+        Each member outputs a Gaussian over the normalized state difference and is trained on its
+        own bootstrap of the data by maximum likelihood. predict() returns the ensemble mean, while
+        predict_trajectories() propagates trajectory sampling particles: each row of the batch stays
+        with one member for the whole horizon (row i with member i % ensemble_size) and its next
+        state is sampled from that member's Gaussian. fit() splits the data and stops early as in
+        NNDynamicsModel """
+        self.normalization=normalization
+        self.iterations=iterations
+        self.batch_size=batch_size
+        self.sess=sess
+        self.ensemble_size=ensemble_size
+        self.validation_fraction=validation_fraction
+        self.patience=patience
+        self.fit_time=0.
+        self.validation_loss=float('nan')
+        self.is_validation=np.zeros(0, dtype=bool)
+        self.mlp_args=(n_layers,size,activation,output_activation)
+        self.rollouts={}
+        ob_dim = env.observation_space.shape[0]
+        ac_dim = env.action_space.shape[0]
+        self.ob_dim, self.ac_dim = ob_dim, ac_dim
+        K = ensemble_size
+
+        # softly bounded log variance, as in the paper; the bounds are learned along with the members
+        with tf.variable_scope('trans_ensemble_logvar'):
+            self.max_logvar=tf.get_variable('max', initializer=0.5*tf.ones([1, ob_dim]))
+            self.min_logvar=tf.get_variable('min', initializer=-10.*tf.ones([1, ob_dim]))
+
+        # training and validation batches, one slice per member: (ensemble_size, batch, dim)
+        self.sy_ob = tf.placeholder(shape=[K, None, ob_dim], name="ens_ob", dtype=tf.float32)
+        self.sy_ac = tf.placeholder(shape=[K, None, ac_dim], name="ens_ac", dtype=tf.float32)
+        self.delta = tf.placeholder(shape=[K, None, ob_dim], name="ens_del", dtype=tf.float32)
+        mean, logvar = self._member_outputs(tf.concat([self.sy_ob,self.sy_ac],axis=2), reuse=False)
+        self.loss=tf.reduce_mean(tf.square(mean - self.delta))
+        nll=tf.reduce_sum(tf.reduce_mean(tf.square(mean - self.delta) * tf.exp(-logvar) + logvar, axis=[1, 2]))
+        nll+=0.01 * (tf.reduce_sum(self.max_logvar) - tf.reduce_sum(self.min_logvar))
+        self.dyna_update_op=tf.train.AdamOptimizer(learning_rate).minimize(nll)
+        self.params=tf.trainable_variables('trans_ensemble')
+
+        # ensemble mean prediction: every member sees the whole batch
+        self.sy_pred_ob = tf.placeholder(shape=[None, ob_dim], name="ob", dtype=tf.float32)
+        self.sy_pred_ac = tf.placeholder(shape=[None, ac_dim], name="ac", dtype=tf.float32)
+        ob_ac = tf.tile(tf.concat([self.sy_pred_ob,self.sy_pred_ac],axis=1)[None], [K, 1, 1])
+        self.delta_prediction=tf.reduce_mean(self._member_outputs(ob_ac, reuse=True)[0], axis=0)
+
+    def _member_outputs(self, ob_ac, reuse):
+        # mean and bounded log variance of the normalized state difference, per member
+        out = build_ensemble_mlp(ob_ac, 2*self.ob_dim, 'trans_ensemble', self.ensemble_size,
+                                 *self.mlp_args, reuse=reuse)
+        mean, logvar = out[..., :self.ob_dim], out[..., self.ob_dim:]
+        logvar = self.max_logvar - tf.nn.softplus(self.max_logvar - logvar)
+        logvar = self.min_logvar + tf.nn.softplus(logvar - self.min_logvar)
+        return mean, logvar
+
+    def fit(self, data):
+        """ Fit every member on its own bootstrap of the (normalized) training split """
+        start_time=time.time()
+        obs = normalize(data['observations'],self.normalization['observations'][0],self.normalization['observations'][1])
+        delta = normalize(data['delta'],self.normalization['delta'][0],self.normalization['delta'][1])
+        acs = normalize(data['actions'],self.normalization['actions'][0],self.normalization['actions'][1])
+
+        K=self.ensemble_size
+        self.is_validation=extend_validation_split(self.is_validation,len(obs),self.validation_fraction)
+        val_rows, train_rows = np.flatnonzero(self.is_validation), np.flatnonzero(~self.is_validation)
+        num_val=len(val_rows)
+        bootstraps=train_rows[np.random.randint(len(train_rows), size=(K, len(train_rows)))]
+        tile=lambda x: np.broadcast_to(x[None], (K,)+x.shape)
+        val_feed={self.sy_ob:tile(obs[val_rows]), self.sy_ac:tile(acs[val_rows]), self.delta:tile(delta[val_rows])}
+
+        best_loss=float('inf')
+        best_params=None
+        bad_epochs=0
+        for i in range(1, self.iterations + 1):
+            # shuffle each member's bootstrap independently
+            order=np.argsort(np.random.rand(*bootstraps.shape), axis=1)
+            epoch=bootstraps[np.arange(K)[:,None], order]
+            for start in range(0, epoch.shape[1], self.batch_size):
+                batch=epoch[:, start:start+self.batch_size]
+                self.sess.run(self.dyna_update_op, feed_dict={self.sy_ob:obs[batch], self.sy_ac:acs[batch], self.delta:delta[batch]})
+            if num_val==0:
+                print("epoch: ",i)
+                continue
+            val_loss=self.sess.run(self.loss, feed_dict=val_feed)
+            print("epoch: ",i,"validation loss: ",val_loss)
+            if val_loss < best_loss:
+                best_loss=val_loss
+                best_params=self.sess.run(self.params)
+                bad_epochs=0
+            else:
+                bad_epochs+=1
+                if bad_epochs >= self.patience:
+                    break
+        # keep the model of the best epoch, which validation_loss describes
+        if best_params is not None:
+            for param, value in zip(self.params, best_params):
+                param.load(value, self.sess)
+
+        self.fit_time=time.time()-start_time
+        self.validation_loss=best_loss if num_val > 0 else float('nan')
+
+    def predict(self, states, actions):
+        """ Return the (unnormalized) next states predicted by the mean of the ensemble """
+        obs = normalize(states,self.normalization['observations'][0],self.normalization['observations'][1])
+        acs = normalize(actions,self.normalization['actions'][0],self.normalization['actions'][1])
+        prediction=self.sess.run(self.delta_prediction, feed_dict={self.sy_pred_ob:obs, self.sy_pred_ac:acs })
+        return denormalize(prediction,self.normalization['delta'][0],self.normalization['delta'][1]) + states
+
+    def predict_trajectories(self, states, actions):
+        """ Propagate particles from (unnormalized) states of shape (num_particles, ob_dim) under
+        actions of shape (horizon, num_particles, ac_dim) with trajectory sampling, in one sess.run.
+        Returns sampled next states of shape (horizon, num_particles, ob_dim) """
+        horizon, count = actions.shape[0], len(states)
+        # pad the batch to a multiple of the ensemble size so it splits evenly across the members,
+        # cycling through the rows as the batch may be smaller than the ensemble
+        pad = -count % self.ensemble_size
+        if pad:
+            idx = np.arange(count + pad) % count
+            states, actions = states[idx], actions[:, idx]
+        if horizon not in self.rollouts:
+            self.rollouts[horizon]=self._build_rollout(horizon)
+        sy_ob0, sy_acs, next_obs = self.rollouts[horizon]
+        return self.sess.run(next_obs, feed_dict={sy_ob0:states, sy_acs:actions})[:, :count]
+
+    def _build_rollout(self, horizon):
+        K=self.ensemble_size
+        stats={k:[tf.constant(x, dtype=tf.float32) for x in v] for k,v in self.normalization.items()}
+        sy_ob0 = tf.placeholder(shape=[None, self.ob_dim], name="rollout_ob", dtype=tf.float32)
+        sy_acs = tf.placeholder(shape=[horizon, None, self.ac_dim], name="rollout_acs", dtype=tf.float32)
+        in_dim = self.ob_dim + self.ac_dim
+        ob=sy_ob0
+        next_obs=[]
+        for t in range(horizon):
+            ob_ac = tf.concat([normalize(ob,*stats['observations']),normalize(sy_acs[t],*stats['actions'])],axis=1)
+            # row i goes to member i % K: (N, in) -> (K, N/K, in)
+            ob_ac = tf.transpose(tf.reshape(ob_ac, [-1, K, in_dim]), [1, 0, 2])
+            mean, logvar = self._member_outputs(ob_ac, reuse=True)
+            delta = mean + tf.exp(logvar / 2.) * tf.random_normal(tf.shape(mean))
+            delta = tf.reshape(tf.transpose(delta, [1, 0, 2]), [-1, self.ob_dim])
+            ob = denormalize(delta,*stats['delta']) + ob
+            next_obs.append(ob)
+        return sy_ob0, sy_acs, tf.stack(next_obs)
@@ -1,8 +1,8 @@
 import numpy as np
 import tensorflow as tf
 import gym
-from dynamics import NNDynamicsModel
-from controllers import MPCcontroller, RandomController
+from dynamics import NNDynamicsModel, EnsembleDynamicsModel
+from controllers import MPCcontroller, CEMcontroller, MPPIcontroller, RandomController
 from cost_functions import cheetah_cost_fn, trajectory_cost_fn
 import time
 import logz
@@ -10,6 +10,7 @@ import os
 import copy
 import matplotlib.pyplot as plt
 from cheetah_env import HalfCheetahEnvNew
+from vec_env import SubprocEnvs
 
 def sample(env, 
            controller, 
@@ -32,6 +33,7 @@ def sample(env,
         actions=list()
         next_states=list()
         states.append(env.reset())
+        controller.reset()
         #print(np.array(states).shape)
         totalr=0
         totalc=0
@@ -58,6 +60,48 @@ def sample(env,
 
     return paths,rewards,costs
 
+def sample_parallel(envs, 
+           controller, 
+           num_paths=10, 
+           horizon=1000):
+    """
+        Same as sample() for environment copies stepped in parallel by envs (a SubprocEnvs):
+        the controller plans the actions of all copies with one batched get_actions call per step.
+        Paths are collected num_envs at a time; returns the same paths, rewards and costs as sample().
+    """
+    paths = []
+    rewards=[]
+    costs=[]
+    n=envs.num_envs
+    ob_shape=envs.observation_space.shape
+    ac_shape=envs.action_space.shape
+    print("num_sum_path",num_paths)
+    while len(paths) < num_paths:
+        states=np.zeros((horizon,n)+ob_shape)
+        actions=np.zeros((horizon,n)+ac_shape)
+        next_states=np.zeros((horizon,n)+ob_shape)
+        totalr=np.zeros(n)
+        totalc=np.zeros(n)
+        obs=envs.reset()
+        controller.reset()
+        for j in range(horizon):
+            states[j]=obs
+            actions[j],c=controller.get_actions(obs)
+            obs, r, done, _ = envs.step(actions[j])
+            next_states[j]=obs
+            totalr+=r
+            totalc+=c
+        for i in range(min(n,num_paths-len(paths))):
+            paths.append({'observations': states[:,i],
+                          'actions': actions[:,i],
+                          'next_observations': next_states[:,i]
+                          })
+            rewards.append(totalr[i])
+            costs.append(totalc[i])
+        print("paths :",len(paths))
+
+    return paths,rewards,costs
+
 # Utility to compute cost a path for a given cost function
 def path_cost(cost_fn, path):
     return trajectory_cost_fn(cost_fn, path['observations'], path['actions'], path['next_observations'])
@@ -93,11 +137,23 @@ def train(env,
          onpol_iters=1,
          dynamics_iters=60,
          batch_size=512,
+         validation_fraction=0.1,
+         patience=5,
+         incremental=False,
+         old_data_ratio=1.,
+         envs=None,
+         ensemble_size=1,
+         num_particles=1,
          num_paths_random=10, 
          num_paths_onpol=1, 
          num_simulated_paths=10000,
          env_horizon=1000, 
          mpc_horizon=15,
+         mpc_unroll=False,
+         planner='random',
+         plan_iters=5,
+         num_elites=50,
+         mppi_temperature=1.,
          n_layers=2,
          size=100,
          activation=tf.nn.relu,
@@ -115,6 +171,22 @@ def train(env,
 
     batch_size                  Batch size for dynamics training.
 
+    validation_fraction         Fraction of the data held out to validate the
+    |                           dynamics model; training stops early after
+    |_                          `patience` epochs without improvement.
+
+    incremental                 Refit the dynamics model only on the data added
+    |                           since the last fit, mixed with `old_data_ratio`
+    |_                          times as many randomly sampled older transitions.
+
+    envs                        Optional SubprocEnvs of copies of env; when given,
+    |_                          paths are collected in parallel with sample_parallel.
+
+    ensemble_size               With more than one member, use a probabilistic
+    |                           ensemble as the dynamics model; the MPC then
+    |                           scores each action sequence by averaging
+    |_                          `num_particles` sampled rollouts (needs mpc_unroll).
+
     num_paths_random            Number of paths/trajectories/rollouts generated 
     |                           by a random agent. We use these to train our 
     |_                          initial dynamics model.
@@ -134,6 +206,18 @@ def train(env,
     |                           how many timesteps should be in each fictitious
     |_                          rollout.
 
+    mpc_unroll                  Unroll the whole MPC horizon inside the dynamics
+    |                           model graph, so that planning each action takes
+    |_                          a single sess.run.
+
+    planner                     How the MPC policy searches for action sequences:
+    |                           'random' shooting, iterative 'cem' refinement
+    |_                          or 'mppi' path integral refinement.
+
+    plan_iters                  Refinement rounds per action for cem and mppi,
+    |                           each simulating num_simulated_paths rollouts.
+    |_                          num_elites and mppi_temperature tune the update.
+
     n_layers/size/activations   Neural network architecture arguments. 
 
     """
@@ -148,7 +232,11 @@ def train(env,
 
     random_controller = RandomController(env)
 
-    paths,rewards,costs=sample(env,random_controller,num_paths_random)
+    if envs is not None:
+        collect=lambda controller, num_paths: sample_parallel(envs,controller,num_paths,env_horizon)
+    else:
+        collect=lambda controller, num_paths: sample(env,controller,num_paths,env_horizon)
+    paths,rewards,costs=collect(random_controller,num_paths_random)
     obs = np.concatenate([path["observations"] for path in paths])
     acs = np.concatenate([path["actions"] for path in paths])
     n_obs = np.concatenate([path["next_observations"] for path in paths])
@@ -178,22 +266,36 @@ def train(env,
     # 
     sess = tf.Session()
 
-    dyn_model = NNDynamicsModel(env=env, 
-                                n_layers=n_layers, 
-                                size=size, 
-                                activation=activation, 
-                                output_activation=output_activation, 
-                                normalization=normalization,
-                                batch_size=batch_size,
-                                iterations=dynamics_iters,
-                                learning_rate=learning_rate,
-                                sess=sess)
-
-    mpc_controller = MPCcontroller(env=env, 
-                                   dyn_model=dyn_model, 
-                                   horizon=mpc_horizon, 
-                                   cost_fn=cost_fn, 
-                                   num_simulated_paths=num_simulated_paths)
+    dyn_args = dict(env=env, 
+                    n_layers=n_layers, 
+                    size=size, 
+                    activation=activation, 
+                    output_activation=output_activation, 
+                    normalization=normalization,
+                    batch_size=batch_size,
+                    iterations=dynamics_iters,
+                    learning_rate=learning_rate,
+                    sess=sess,
+                    validation_fraction=validation_fraction,
+                    patience=patience)
+    if ensemble_size > 1:
+        dyn_model = EnsembleDynamicsModel(ensemble_size=ensemble_size, **dyn_args)
+    else:
+        dyn_model = NNDynamicsModel(incremental=incremental, old_data_ratio=old_data_ratio, **dyn_args)
+
+    mpc_args = dict(env=env, 
+                    dyn_model=dyn_model, 
+                    horizon=mpc_horizon, 
+                    cost_fn=cost_fn, 
+                    num_simulated_paths=num_simulated_paths,
+                    unroll=mpc_unroll,
+                    num_particles=num_particles)
+    if planner == 'cem':
+        mpc_controller = CEMcontroller(num_iterations=plan_iters, num_elites=num_elites, **mpc_args)
+    elif planner == 'mppi':
+        mpc_controller = MPPIcontroller(num_iterations=plan_iters, temperature=mppi_temperature, **mpc_args)
+    else:
+        mpc_controller = MPCcontroller(**mpc_args)
 
 
     #========================================================
@@ -217,7 +319,10 @@ def train(env,
         
         # Generate trajectories from MPC controllers
         
-        pathsM,returns,costs=sample(env,mpc_controller,num_paths_onpol)
+        mpc_controller.reset_stats()
+        start=time.time()
+        pathsM,returns,costs=collect(mpc_controller,num_paths_onpol)
+        sample_time=time.time()-start
         obs = np.concatenate([path["observations"] for path in pathsM])
         acs = np.concatenate([path["actions"] for path in pathsM])
         n_obs = np.concatenate([path["next_observations"] for path in pathsM])
@@ -232,6 +337,9 @@ def train(env,
         # Statistics for performance of MPC policy using
         # our learned dynamics model
         logz.log_tabular('Iteration', itr)
+        # Cost and quality of the dynamics model fit
+        logz.log_tabular('FitTime', dyn_model.fit_time)
+        logz.log_tabular('ValidationLoss', dyn_model.validation_loss)
         # In terms of cost function which your MPC controller uses to plan
         logz.log_tabular('AverageCost', np.mean(costs))
         logz.log_tabular('StdCost', np.std(costs))
@@ -242,6 +350,10 @@ def train(env,
         logz.log_tabular('StdReturn', np.std(returns))
         logz.log_tabular('MinimumReturn', np.min(returns))
         logz.log_tabular('MaximumReturn', np.max(returns))
+        # Planning cost of the MPC controller
+        logz.log_tabular('EvalsPerAction', mpc_controller.model_evals / mpc_controller.num_planned)
+        logz.log_tabular('PlanningLatency', mpc_controller.planning_time / mpc_controller.num_planned)
+        logz.log_tabular('SampleTime', sample_time)
 
         logz.dump_tabular()
 
@@ -257,18 +369,30 @@ def main():
     # Training args
     parser.add_argument('--learning_rate', '-lr', type=float, default=1e-3)
     parser.add_argument('--onpol_iters', '-n', type=int, default=1)
-    parser.add_argument('--dyn_iters', '-nd', type=int, default=150)
+    parser.add_argument('--dyn_iters', '-nd', type=int, default=50)
     parser.add_argument('--batch_size', '-b', type=int, default=512)
+    parser.add_argument('--val_frac', type=float, default=0.1)
+    parser.add_argument('--patience', type=int, default=5)
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--old_data_ratio', type=float, default=1.)
+    parser.add_argument('--ensemble_size', type=int, default=1)
     # Data collection
     parser.add_argument('--random_paths', '-r', type=int, default=10)
     parser.add_argument('--onpol_paths', '-d', type=int, default=1)
     parser.add_argument('--simulated_paths', '-sp', type=int, default=1000)
     parser.add_argument('--ep_len', '-ep', type=int, default=1000)
+    parser.add_argument('--num_envs', type=int, default=1)
     # Neural network architecture args
     parser.add_argument('--n_layers', '-l', type=int, default=2)
     parser.add_argument('--size', '-s', type=int, default=500)
     # MPC Controller
     parser.add_argument('--mpc_horizon', '-m', type=int, default=15)
+    parser.add_argument('--mpc_unroll', action='store_true')
+    parser.add_argument('--num_particles', type=int, default=1)
+    parser.add_argument('--planner', type=str, default='random', choices=['random', 'cem', 'mppi'])
+    parser.add_argument('--plan_iters', type=int, default=5)
+    parser.add_argument('--num_elites', type=int, default=50)
+    parser.add_argument('--mppi_temperature', type=float, default=1.)
     args = parser.parse_args()
 
     # Set seed
@@ -287,6 +411,11 @@ def main():
     if args.env_name is "HalfCheetah-v2":
         env = HalfCheetahEnvNew()
         cost_fn = cheetah_cost_fn
+        env_fn = HalfCheetahEnvNew
+    envs = None
+    if args.num_envs > 1:
+        envs = SubprocEnvs([env_fn] * args.num_envs)
+        envs.seed(args.seed)
     train(env=env, 
                  cost_fn=cost_fn,
                  logdir=logdir,
@@ -295,16 +424,30 @@ def main():
                  onpol_iters=args.onpol_iters,
                  dynamics_iters=args.dyn_iters,
                  batch_size=args.batch_size,
+                 validation_fraction=args.val_frac,
+                 patience=args.patience,
+                 incremental=args.incremental,
+                 old_data_ratio=args.old_data_ratio,
+                 envs=envs,
+                 ensemble_size=args.ensemble_size,
+                 num_particles=args.num_particles,
                  num_paths_random=args.random_paths, 
                  num_paths_onpol=args.onpol_paths, 
                  num_simulated_paths=args.simulated_paths,
                  env_horizon=args.ep_len, 
                  mpc_horizon=args.mpc_horizon,
+                 mpc_unroll=args.mpc_unroll,
+                 planner=args.planner,
+                 plan_iters=args.plan_iters,
+                 num_elites=args.num_elites,
+                 mppi_temperature=args.mppi_temperature,
                  n_layers = args.n_layers,
                  size=args.size,
                  activation=tf.nn.relu,
                  output_activation=None,
                  )
+    if envs is not None:
+        envs.close()
 
 if __name__ == "__main__":
     main()
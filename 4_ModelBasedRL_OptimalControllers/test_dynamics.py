@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+if not hasattr(tf, 'placeholder'):
+    pytest.skip('the dynamics models are built with the TensorFlow 1 graph API', allow_module_level=True)
+
+import controllers  # noqa: E402
+from dynamics import EnsembleDynamicsModel  # noqa: E402
+
+
+class Box(object):
+    def __init__(self, n):
+        self.shape = (n,)
+        self.low = -np.ones(n)
+        self.high = np.ones(n)
+
+
+class Env(object):
+    observation_space = Box(3)
+    action_space = Box(2)
+
+
+def make_ensemble(sess, ensemble_size):
+    normalization = {'observations': [np.zeros(3), np.ones(3)], 'actions': [np.zeros(2), np.ones(2)],
+                     'delta': [np.zeros(3), np.ones(3)]}
+    model = EnsembleDynamicsModel(Env, 1, 16, tf.tanh, None, normalization, 32, 1, 1e-3, sess,
+                                  ensemble_size=ensemble_size)
+    sess.run(tf.global_variables_initializer())
+    return model
+
+
+def test_predict_trajectories_batch_sizes():
+    """ Batches smaller than the ensemble or not a multiple of its size are padded to one """
+    np.random.seed(0)
+    with tf.Graph().as_default(), tf.Session() as sess:
+        model = make_ensemble(sess, 5)
+        for count in [1, 3, 5, 7, 12]:
+            states = np.random.randn(count, 3)
+            actions = np.random.uniform(-1, 1, size=(4, count, 2))
+            next_states = model.predict_trajectories(states, actions)
+            assert next_states.shape == (4, count, 3)
+            assert np.all(np.isfinite(next_states))
+
+
+def test_cem_on_ensemble():
+    """ One particle per path, and the single path of the final plan's cost, through the ensemble """
+    np.random.seed(0)
+    cost_fn = lambda states, actions, next_states: np.sum(next_states ** 2, axis=-1)
+    with tf.Graph().as_default(), tf.Session() as sess:
+        model = make_ensemble(sess, 5)
+        for cls in [controllers.CEMcontroller, controllers.MPPIcontroller]:
+            controller = cls(Env, model, horizon=3, cost_fn=cost_fn, num_simulated_paths=7, unroll=True)
+            action, cost = controller.get_action(np.zeros(3))
+            assert action.shape == (2,) and np.isfinite(cost)
@@ -0,0 +1,70 @@
+import numpy as np
+from multiprocessing import Process, Pipe
+
+# Environment copies stepped in worker processes, after
+# baselines/common/vec_env/subproc_vec_env.py. Paths here have a fixed horizon,
+# so workers do not reset on done; the sampler resets all copies together.
+
+def worker(remote, parent_remote, env_fn):
+    parent_remote.close()
+    env = env_fn()
+    while True:
+        cmd, data = remote.recv()
+        if cmd == 'step':
+            remote.send(env.step(data))
+        elif cmd == 'reset':
+            remote.send(env.reset())
+        elif cmd == 'seed':
+            remote.send(env.seed(data))
+        elif cmd == 'close':
+            remote.close()
+            break
+        elif cmd == 'get_spaces':
+            remote.send((env.observation_space, env.action_space))
+        else:
+            raise NotImplementedError
+
+
+class SubprocEnvs():
+    def __init__(self, env_fns):
+        """
+        env_fns: picklable callables (e.g. an env class) that build the environments
+        """
+        self.closed = False
+        self.num_envs = len(env_fns)
+        self.remotes, self.work_remotes = zip(*[Pipe() for _ in range(self.num_envs)])
+        self.ps = [Process(target=worker, args=(work_remote, remote, env_fn))
+            for (work_remote, remote, env_fn) in zip(self.work_remotes, self.remotes, env_fns)]
+        for p in self.ps:
+            p.daemon = True # if the main process crashes, we should not cause things to hang
+            p.start()
+        for remote in self.work_remotes:
+            remote.close()
+
+        self.remotes[0].send(('get_spaces', None))
+        self.observation_space, self.action_space = self.remotes[0].recv()
+
+    def step(self, actions):
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', action))
+        obs, rews, dones, infos = zip(*[remote.recv() for remote in self.remotes])
+        return np.stack(obs), np.stack(rews), np.stack(dones), infos
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        return np.stack([remote.recv() for remote in self.remotes])
+
+    def seed(self, seed):
+        for i, remote in enumerate(self.remotes):
+            remote.send(('seed', seed + i))
+        return [remote.recv() for remote in self.remotes]
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for p in self.ps:
+            p.join()
+        self.closed = True
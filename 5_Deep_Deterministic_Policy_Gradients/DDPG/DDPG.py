@@ -19,7 +19,7 @@ import pprint as pp
 import os
 import logz
 
-from replay_buffer import ReplayBuffer
+from replay_buffer import RingReplayBuffer
 
 # ===========================
 #   Actor and Critic DNNs
@@ -365,7 +365,7 @@ def train(sess, env, args, actor, critic, actor_noise, logdir):
     critic.update_target_network()
 
     # Initialize replay memory
-    replay_buffer = ReplayBuffer(int(args['buffer_size']), int(args['random_seed']))
+    replay_buffer = RingReplayBuffer(int(args['buffer_size']), int(args['random_seed']))
 
     # Needed to enable BatchNorm.
     # This hurts the performance on Pendulum but could be useful
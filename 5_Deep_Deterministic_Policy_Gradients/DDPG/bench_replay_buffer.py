@@ -0,0 +1,68 @@
+"""
+Insert and sample throughput of the deque-based ReplayBuffer against the
+preallocated RingReplayBuffer.
+
+    python bench_replay_buffer.py --capacities 1e5,1e6,1e7 --s-dim 4 --a-dim 1
+
+Each buffer is filled to capacity before sampling. Filling the deque at large
+capacities takes gigabytes of per-object overhead, so it is skipped above
+--max-deque-capacity.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from replay_buffer import ReplayBuffer, RingReplayBuffer
+
+
+def make_transitions(n, s_dim, a_dim, seed=0):
+    rng = np.random.RandomState(seed)
+    s = rng.randn(n, s_dim)
+    a = rng.randn(n, a_dim)
+    r = rng.randn(n)
+    t = rng.rand(n) < 0.01
+    return s, a, r, t
+
+
+def bench(buffer_cls, capacity, transitions, batch_size, n_sample):
+    s, a, r, t = transitions
+    n = len(s)
+    buf = buffer_cls(capacity)
+
+    start = time.time()
+    for i in range(capacity):
+        j = i % (n - 1)
+        buf.add(s[j], a[j], float(r[j]), bool(t[j]), s[j + 1])
+    insert_rate = capacity / (time.time() - start)
+
+    start = time.time()
+    for _ in range(n_sample):
+        buf.sample_batch(batch_size)
+    sample_rate = n_sample / (time.time() - start)
+    return insert_rate, sample_rate
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--capacities', default='1e5,1e6,1e7')
+    parser.add_argument('--s-dim', type=int, default=4)
+    parser.add_argument('--a-dim', type=int, default=1)
+    parser.add_argument('--minibatch-size', type=int, default=1000)
+    parser.add_argument('--n-sample', type=int, default=200)
+    parser.add_argument('--max-deque-capacity', type=float, default=1e6)
+    args = parser.parse_args()
+
+    transitions = make_transitions(100000, args.s_dim, args.a_dim)
+    print('%-18s %10s %16s %16s' % ('buffer', 'capacity', 'inserts/sec', 'batches/sec'))
+    for capacity in [int(float(c)) for c in args.capacities.split(',')]:
+        for name, buffer_cls in [('ReplayBuffer', ReplayBuffer), ('RingReplayBuffer', RingReplayBuffer)]:
+            if buffer_cls is ReplayBuffer and capacity > args.max_deque_capacity:
+                continue
+            insert_rate, sample_rate = bench(buffer_cls, capacity, transitions,
+                                             args.minibatch_size, args.n_sample)
+            print('%-18s %10d %16.0f %16.1f' % (name, capacity, insert_rate, sample_rate))
+
+
+if __name__ == '__main__':
+    main()
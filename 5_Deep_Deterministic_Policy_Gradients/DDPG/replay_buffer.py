@@ -55,3 +55,59 @@ class ReplayBuffer(object):
             if self.count > 0:
                 self.buffer.popleft()
                 self.count -= 1
+
+
+class RingReplayBuffer(object):
+
+    def __init__(self, buffer_size, random_seed=123):
+        """
+        Same interface as ReplayBuffer, but each field lives in one
+        preallocated array, allocated on the first add from the shapes of
+        that transition. States and actions keep the dtypes of that first
+        transition, rewards and terminals are stored as float32, so that an
+        int first reward does not truncate later ones. Slots form a ring:
+        `ptr` is the next slot to write and the `count` slots before it hold
+        the stored experiences, oldest first.
+        """
+        self.buffer_size = buffer_size
+        self.count = 0
+        self.ptr = 0
+        self.fields = None
+        self.rng = np.random.RandomState(random_seed)
+
+    def add(self, s, a, r, t, s2):
+        experience = (s, a, r, t, s2)
+        if self.fields is None:
+            dtypes = [np.asarray(s).dtype, np.asarray(a).dtype, np.float32, np.float32, np.asarray(s2).dtype]
+            self.fields = [np.empty((self.buffer_size,) + np.shape(x), dtype=dtype)
+                           for x, dtype in zip(experience, dtypes)]
+        for field, x in zip(self.fields, experience):
+            field[self.ptr] = x
+        self.ptr = (self.ptr + 1) % self.buffer_size
+        self.count = min(self.count + 1, self.buffer_size)
+
+    def size(self):
+        return self.count
+
+    def sample_batch(self, batch_size):
+        if self.count < batch_size:
+            offsets = self.rng.permutation(self.count)
+        else:
+            # with replacement, so the draw does not depend on the buffer size;
+            # duplicates are rare once the buffer is much larger than a batch
+            offsets = self.rng.randint(0, self.count, size=batch_size)
+        idxes = (self.ptr - self.count + offsets) % self.buffer_size
+
+        if self.fields is None:
+            return tuple(np.array([]) for _ in range(5))
+        s_batch, a_batch, r_batch, t_batch, s2_batch = [field[idxes] for field in self.fields]
+
+        return s_batch, a_batch, r_batch, t_batch, s2_batch
+
+    def clear(self):
+        self.count = 0
+        self.ptr = 0
+
+    def update(self):
+        # drop the 1000 oldest experiences, like ReplayBuffer.update
+        self.count = max(self.count - 1000, 0)
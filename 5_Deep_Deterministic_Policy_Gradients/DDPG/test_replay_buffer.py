@@ -0,0 +1,46 @@
+import numpy as np
+
+from replay_buffer import ReplayBuffer, RingReplayBuffer
+
+
+def add_transitions(buffers, n, seed):
+    rng = np.random.RandomState(seed)
+    for i in range(n):
+        # an int reward and a bool terminal first, like a sparse-reward env
+        r = 0 if i == 0 else rng.randn()
+        a, t = rng.randn(2), bool(rng.rand() < 0.1)
+        for buffer in buffers:
+            buffer.add(np.full(3, i, dtype=np.float64), a, r, t, np.full(3, i + 1, dtype=np.float64))
+
+
+def test_add_sample():
+    buffer = RingReplayBuffer(10)
+    add_transitions([buffer], 4, seed=0)
+    assert buffer.size() == 4
+    s, a, r, t, s2 = buffer.sample_batch(16)
+    # fewer experiences than a batch: each one once
+    assert sorted(s[:, 0]) == [0, 1, 2, 3]
+    assert np.array_equal(s2, s + 1)
+    assert a.shape == (4, 2) and r.shape == t.shape == (4,)
+    assert r.dtype == t.dtype == np.float32
+    assert np.count_nonzero(r) == 3
+
+
+def test_wraparound():
+    ring, deque_buffer = RingReplayBuffer(7), ReplayBuffer(7)
+    add_transitions([ring, deque_buffer], 25, seed=1)
+    assert ring.size() == deque_buffer.size() == 7
+    s, a, r, t, s2 = ring.sample_batch(200)
+    # only the 7 newest experiences, with the fields of each one kept together
+    newest = {e[0][0]: e for e in deque_buffer.buffer}
+    assert set(s[:, 0]) == set(newest)
+    for i in range(len(s)):
+        e = newest[s[i, 0]]
+        assert np.array_equal(a[i], e[1]) and r[i] == np.float32(e[2]) and t[i] == e[3]
+        assert np.array_equal(s2[i], e[4])
+
+    ring.update()
+    assert ring.size() == 0
+    add_transitions([ring], 3, seed=2)
+    s, _, _, _, _ = ring.sample_batch(4)
+    assert sorted(s[:, 0]) == [0, 1, 2]
@@ -4,6 +4,7 @@ import numpy as np
 import tensorflow as tf
 from gym import spaces
 from collections import deque
+from baselines.common.math_util import discount_with_masks
 
 def sample(logits):
     noise = tf.random_uniform(tf.shape(logits))
@@ -152,12 +153,7 @@ def conv_to_fc(x):
     return x
 
 def discount_with_dones(rewards, dones, gamma):
-    discounted = []
-    r = 0
-    for reward, done in zip(rewards[::-1], dones[::-1]):
-        r = reward + gamma*r*(1.-done) # fixed off by one bug
-        discounted.append(r)
-    return discounted[::-1]
+    return discount_with_masks(np.asarray(rewards), 1. - np.asarray(dones), gamma) # fixed off by one bug
 
 def find_trainable_variables(key):
     with tf.variable_scope(key):
@@ -0,0 +1,102 @@
+"""Replay-side cost of an off-policy ACER update: the time of Buffer.get.
+
+Fills a Buffer with random Atari-sized rollouts, one env in fifty done per step,
+and times get() against the loop implementation it replaced, which copied one
+row per env for each array and stacked the frames by shifting and masking the
+whole segment nstack times. The last column is the time per segment of one
+get(segments_per_env=4).
+
+    python -m baselines.acer.bench_buffer --num_envs 16 --nstack 4
+"""
+import argparse
+import time
+
+import numpy as np
+from gym import spaces
+
+from baselines.acer.buffer import Buffer
+
+
+class FakeVecEnv(object):
+    def __init__(self, num_envs, shape):
+        self.num_envs = num_envs
+        self.observation_space = spaces.Box(low=0, high=255, shape=shape, dtype=np.uint8)
+
+
+class LoopBuffer(Buffer):
+    """The previous take and decode; decode only supports nstack=4."""
+    def take(self, x, idx, envx):
+        nenv = self.nenv
+        out = np.empty([nenv] + list(x.shape[2:]), dtype=x.dtype)
+        for i in range(nenv):
+            out[i] = x[idx[i], envx[i]]
+        return out
+
+    def decode(self, enc_obs, dones):
+        nstack, nenv, nsteps, nh, nw, nc = self.nstack, self.nenv, self.nsteps, self.nh, self.nw, self.nc
+        y = np.empty([nsteps + nstack - 1, nenv, 1, 1, 1], dtype=np.float32)
+        obs = np.zeros([nstack, nsteps + nstack, nenv, nh, nw, nc], dtype=np.uint8)
+        x = np.reshape(enc_obs, [nenv, nsteps + nstack, nh, nw, nc]).swapaxes(1, 0)
+        y[3:] = np.reshape(1.0 - dones, [nenv, nsteps, 1, 1, 1]).swapaxes(1, 0)
+        y[:3] = 1.0
+        for i in range(nstack):
+            obs[-(i + 1), i:] = x
+            x = x[:-1] * y
+            y = y[1:]
+        return np.reshape(obs[:, 3:].transpose((2, 1, 3, 4, 0, 5)), [nenv, (nsteps + 1), nh, nw, nstack * nc])
+
+    def get(self):
+        idx = np.random.randint(0, self.num_in_buffer, self.nenv)
+        envx = np.arange(self.nenv)
+        take = lambda x: self.take(x, idx, envx)
+        dones = take(self.dones)
+        obs = self.decode(take(self.enc_obs), dones)
+        return obs, take(self.actions), take(self.rewards), take(self.mus), dones, take(self.masks)
+
+
+def fill(buffer, nenv, nsteps, nstack, nact=6):
+    rng = np.random.RandomState(0)
+    frames = rng.randint(0, 256, size=(nenv, nsteps + nstack, buffer.nh, buffer.nw, buffer.nc)).astype(np.uint8)
+    for _ in range(buffer.size):
+        buffer.put(frames, rng.randint(0, nact, size=(nenv, nsteps)), rng.randn(nenv, nsteps),
+                   rng.rand(nenv, nsteps, nact), rng.rand(nenv, nsteps) < 0.02, rng.rand(nenv, nsteps + 1) < 0.02)
+
+
+def time_fn(fn, iters, repeats=5):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.time()
+        for _ in range(iters):
+            fn()
+        best = min(best, (time.time() - start) / iters)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_envs', default='16')
+    parser.add_argument('--nsteps', type=int, default=20)
+    parser.add_argument('--nstack', type=int, default=4)
+    parser.add_argument('--size', type=int, default=2000, help='buffer size in frames per env')
+    parser.add_argument('--iters', type=int, default=20)
+    args = parser.parse_args()
+
+    print('%8s %12s %12s %8s %16s' % ('num_envs', 'loop', 'vectorized', 'speedup', '4 per env / seg'))
+    for num_envs in [int(n) for n in args.num_envs.split(',')]:
+        env = FakeVecEnv(num_envs, (84, 84, 1))
+        buffer = Buffer(env, args.nsteps, args.nstack, size=args.size)
+        fill(buffer, num_envs, args.nsteps, args.nstack)
+        loop_buffer = LoopBuffer(env, args.nsteps, args.nstack, size=args.nsteps)
+        for name in ['enc_obs', 'actions', 'rewards', 'mus', 'dones', 'masks']:
+            setattr(loop_buffer, name, getattr(buffer, name))
+        loop_buffer.num_in_buffer = buffer.num_in_buffer
+
+        vec_time = time_fn(buffer.get, args.iters)
+        multi_time = time_fn(lambda: buffer.get(segments_per_env=4), args.iters) / 4
+        loop_time = time_fn(loop_buffer.get, args.iters) if args.nstack == 4 else float('nan')
+        print('%8d %9.2f ms %9.2f ms %7.1fx %13.2f ms' % (num_envs, loop_time * 1e3, vec_time * 1e3,
+                                                          loop_time / vec_time, multi_time * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,13 @@ class Buffer(object):
         self.next_idx = 0
         self.num_in_buffer = 0
 
+        # Index tables of the stacked obs of a segment: at step k, slot s holds frame k + s of the
+        # segment's enc_obs, i.e. frame k - (nstack - 1) + s of its obs, which is dropped if an
+        # episode ended at a step in [stack_since[k, s], k).
+        steps, slots = np.arange(nsteps + 1)[:, None], np.arange(nstack)[None, :]
+        self.stack_index = steps + slots
+        self.stack_since = np.maximum(steps - (nstack - 1) + slots, 0)
+
     def has_atleast(self, frames):
         # Frames per env, so total (nenv * frames) Frames needed
         # Each buffer loc has nenv * nsteps frames
@@ -32,23 +39,22 @@ class Buffer(object):
 
     # Generate stacked frames
     def decode(self, enc_obs, dones):
-        # enc_obs has shape [nenvs, nsteps + nstack, nh, nw, nc]
-        # dones has shape [nenvs, nsteps, nh, nw, nc]
-        # returns stacked obs of shape [nenv, (nsteps + 1), nh, nw, nstack*nc]
-        nstack, nenv, nsteps, nh, nw, nc = self.nstack, self.nenv, self.nsteps, self.nh, self.nw, self.nc
-        y = np.empty([nsteps + nstack - 1, nenv, 1, 1, 1], dtype=np.float32)
-        obs = np.zeros([nstack, nsteps + nstack, nenv, nh, nw, nc], dtype=np.uint8)
-        x = np.reshape(enc_obs, [nenv, nsteps + nstack, nh, nw, nc]).swapaxes(1,
-                                                                              0)  # [nsteps + nstack, nenv, nh, nw, nc]
-        y[3:] = np.reshape(1.0 - dones, [nenv, nsteps, 1, 1, 1]).swapaxes(1, 0)  # keep
-        y[:3] = 1.0
-        # y = np.reshape(1 - dones, [nenvs, nsteps, 1, 1, 1])
-        for i in range(nstack):
-            obs[-(i + 1), i:] = x
-            # obs[:,i:,:,:,-(i+1),:] = x
-            x = x[:-1] * y
-            y = y[1:]
-        return np.reshape(obs[:, 3:].transpose((2, 1, 3, 4, 0, 5)), [nenv, (nsteps + 1), nh, nw, nstack * nc])
+        # enc_obs has shape [nsegments, nsteps + nstack, nh, nw, nc]
+        # dones has shape [nsegments, nsteps]
+        # returns stacked obs of shape [nsegments, (nsteps + 1), nh, nw, nstack*nc]
+        return self.stack(enc_obs[:, self.stack_index], dones)
+
+    def stack(self, frames, dones):
+        # frames has shape [nsegments, nsteps + 1, nstack, nh, nw, nc], gathered with stack_index
+        # dones has shape [nsegments, nsteps]
+        nsegments = len(frames)
+        # Zero the frames of earlier episodes: an episode ended between the step of a frame and step k
+        # if the number of dones before step k changed since then.
+        ndones = np.zeros([nsegments, self.nsteps + 1], dtype=np.int32)
+        np.cumsum(dones, axis=1, out=ndones[:, 1:])
+        frames[ndones[:, self.stack_since] != ndones[:, :, None]] = 0
+        return np.reshape(frames.transpose((0, 1, 3, 4, 2, 5)),
+                          [nsegments, self.nsteps + 1, self.nh, self.nw, self.nstack * self.nc])
 
     def put(self, enc_obs, actions, rewards, mus, dones, masks):
         # enc_obs [nenv, (nsteps + nstack), nh, nw, nc]
@@ -60,8 +66,8 @@ class Buffer(object):
             self.actions = np.empty([self.size] + list(actions.shape), dtype=np.int32)
             self.rewards = np.empty([self.size] + list(rewards.shape), dtype=np.float32)
             self.mus = np.empty([self.size] + list(mus.shape), dtype=np.float32)
-            self.dones = np.empty([self.size] + list(dones.shape), dtype=np.bool)
-            self.masks = np.empty([self.size] + list(masks.shape), dtype=np.bool)
+            self.dones = np.empty([self.size] + list(dones.shape), dtype=np.bool_)
+            self.masks = np.empty([self.size] + list(masks.shape), dtype=np.bool_)
 
         self.enc_obs[self.next_idx] = enc_obs
         self.actions[self.next_idx] = actions
@@ -74,28 +80,26 @@ class Buffer(object):
         self.num_in_buffer = min(self.size, self.num_in_buffer + 1)
 
     def take(self, x, idx, envx):
-        nenv = self.nenv
-        out = np.empty([nenv] + list(x.shape[2:]), dtype=x.dtype)
-        for i in range(nenv):
-            out[i] = x[idx[i], envx[i]]
-        return out
+        return x[idx, envx]
 
-    def get(self):
+    def get(self, segments_per_env=1):
         # returns
         # obs [nenv, (nsteps + 1), nh, nw, nstack*nc]
         # actions, rewards, dones [nenv, nsteps]
         # mus [nenv, nsteps, nact]
+        # With segments_per_env, the first axis has segments_per_env * nenv segments instead, the
+        # rows [j * nenv, (j + 1) * nenv) holding the j-th segment of each env.
         nenv = self.nenv
         assert self.can_sample()
 
         # Sample exactly one id per env. If you sample across envs, then higher correlation in samples from same env.
-        idx = np.random.randint(0, self.num_in_buffer, nenv)
-        envx = np.arange(nenv)
+        idx = np.random.randint(0, self.num_in_buffer, segments_per_env * nenv)
+        envx = np.tile(np.arange(nenv), segments_per_env)
 
-        take = lambda x: self.take(x, idx, envx)  # for i in range(nenv)], axis = 0)
+        take = lambda x: self.take(x, idx, envx)
         dones = take(self.dones)
-        enc_obs = take(self.enc_obs)
-        obs = self.decode(enc_obs, dones)
+        # Gather only the frames of the stacked obs
+        obs = self.stack(self.enc_obs[idx[:, None, None], envx[:, None, None], self.stack_index], dones)
         actions = take(self.actions)
         rewards = take(self.rewards)
         mus = take(self.mus)
@@ -111,7 +111,7 @@ class MaxAndSkipEnv(gym.Wrapper):
                 break
         # Note that the observation on the done=True frame
         # doesn't matter
-        max_frame = self._obs_buffer.max(axis=0)
+        max_frame = np.maximum(self._obs_buffer[0], self._obs_buffer[1])
 
         return max_frame, total_reward, done, info
 
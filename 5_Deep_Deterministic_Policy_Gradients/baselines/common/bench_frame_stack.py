@@ -0,0 +1,79 @@
+"""Cost of a VecFrameStack step against the np.roll stacking it replaced.
+
+Steps VecFrameStack over a vectorized env that returns the same Atari frames
+every step, with one env in seven done, and times the step of the wrapper
+alone. The np.roll column is the previous implementation: roll the whole
+stack by one frame, zero the done envs one by one, write the new frame.
+
+    python -m baselines.common.bench_frame_stack --num_envs 16,64,256
+"""
+import argparse
+import time
+
+import numpy as np
+from gym import spaces
+
+from baselines.common.vec_env import VecEnv
+from baselines.common.vec_env.vec_frame_stack import VecFrameStack
+
+
+class ConstantVecEnv(VecEnv):
+    def __init__(self, num_envs, shape, dtype):
+        observation_space = spaces.Box(low=0, high=255, shape=shape, dtype=dtype)
+        VecEnv.__init__(self, num_envs, observation_space, spaces.Discrete(2))
+        self.obs = np.random.randint(0, 256, size=(num_envs,) + shape).astype(dtype)
+        self.rews = np.zeros(num_envs, dtype=np.float32)
+        self.dones = np.arange(num_envs) % 7 == 0
+        self.infos = [{} for _ in range(num_envs)]
+
+    def reset(self):
+        return self.obs
+
+    def step_async(self, actions):
+        pass
+
+    def step_wait(self):
+        return self.obs, self.rews, self.dones, self.infos
+
+    def close(self):
+        pass
+
+
+def roll_step(stackedobs, obs, news):
+    stackedobs = np.roll(stackedobs, shift=-1, axis=-1)
+    for (i, new) in enumerate(news):
+        if new:
+            stackedobs[i] = 0
+    stackedobs[..., -obs.shape[-1]:] = obs
+    return stackedobs
+
+
+def time_fn(fn, iters):
+    start = time.time()
+    for _ in range(iters):
+        fn()
+    return (time.time() - start) / iters
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_envs', default='16,64,256')
+    parser.add_argument('--nstack', type=int, default=4)
+    parser.add_argument('--iters', type=int, default=100)
+    args = parser.parse_args()
+
+    print('%8s %14s %14s %8s' % ('num_envs', 'np.roll', 'VecFrameStack', 'speedup'))
+    for num_envs in [int(n) for n in args.num_envs.split(',')]:
+        venv = ConstantVecEnv(num_envs, (84, 84, 1), np.uint8)
+        stack = VecFrameStack(venv, args.nstack)
+        stack.reset()
+        stack_time = time_fn(stack.step_wait, args.iters)
+        stackedobs = stack.stackedobs.copy()
+        def step():
+            roll_step(stackedobs, venv.obs, venv.dones)
+        roll_time = time_fn(step, args.iters)
+        print('%8d %11.0f us %11.0f us %7.1fx' % (num_envs, roll_time * 1e6, stack_time * 1e6, roll_time / stack_time))
+
+
+if __name__ == '__main__':
+    main()
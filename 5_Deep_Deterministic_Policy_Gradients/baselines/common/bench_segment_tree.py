@@ -0,0 +1,73 @@
+"""Microbenchmark for the sum/min segment trees used by prioritized replay.
+
+For each capacity, times drawing a batch of proportional samples and updating
+the priorities of a batch of leaves, once through the scalar API one item at
+a time (as PrioritizedReplayBuffer used to) and once with the batched calls.
+
+    python -m baselines.common.bench_segment_tree --log2_capacities 17,18,19,20,21,22 --batch_size 32
+"""
+import argparse
+import time
+
+import numpy as np
+
+from baselines.common.segment_tree import SumSegmentTree, MinSegmentTree
+
+
+def sample_scalar(it_sum, size, batch_size):
+    res = []
+    for _ in range(batch_size):
+        mass = np.random.random() * it_sum.sum(0, size - 1)
+        res.append(it_sum.find_prefixsum_idx(mass))
+    return res
+
+
+def sample_batch(it_sum, size, batch_size):
+    mass = np.random.random(batch_size) * it_sum.sum(0, size - 1)
+    return it_sum.find_prefixsum_idx(mass)
+
+
+def update_scalar(it_sum, it_min, idxes, priorities):
+    for idx, priority in zip(idxes, priorities):
+        it_sum[idx] = priority
+        it_min[idx] = priority
+
+
+def update_batch(it_sum, it_min, idxes, priorities):
+    it_sum[idxes] = priorities
+    it_min[idxes] = priorities
+
+
+def time_fn(fn, iters):
+    start = time.time()
+    for _ in range(iters):
+        fn()
+    return (time.time() - start) / iters
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--log2_capacities', default='17,18,19,20,21,22')
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--iters', type=int, default=200)
+    args = parser.parse_args()
+
+    print('%-10s %14s %14s %14s %14s' % ('capacity', 'sample loop', 'sample batch', 'update loop', 'update batch'))
+    for log2_capacity in [int(c) for c in args.log2_capacities.split(',')]:
+        capacity = 2 ** log2_capacity
+        it_sum, it_min = SumSegmentTree(capacity), MinSegmentTree(capacity)
+        update_batch(it_sum, it_min, np.arange(capacity), np.random.rand(capacity) + 0.01)
+
+        idxes = sample_batch(it_sum, capacity, args.batch_size)
+        priorities = np.random.rand(args.batch_size) + 0.01
+        times = [
+            time_fn(lambda: sample_scalar(it_sum, capacity, args.batch_size), args.iters),
+            time_fn(lambda: sample_batch(it_sum, capacity, args.batch_size), args.iters),
+            time_fn(lambda: update_scalar(it_sum, it_min, idxes, priorities), args.iters),
+            time_fn(lambda: update_batch(it_sum, it_min, idxes, priorities), args.iters),
+        ]
+        print('2^%-8d %11.1f us %11.1f us %11.1f us %11.1f us' % ((log2_capacity,) + tuple(t * 1e6 for t in times)))
+
+
+if __name__ == '__main__':
+    main()
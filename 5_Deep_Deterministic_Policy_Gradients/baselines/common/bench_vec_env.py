@@ -0,0 +1,93 @@
+"""Steps/sec of the subprocess vectorized environments.
+
+Steps SubprocVecEnv, ShmemVecEnv, SubprocVecEnv with several envs per worker,
+and AsyncSubprocVecEnv waiting for half of the envs, with num_envs copies of
+an env whose step costs almost nothing by default, so that the time goes into
+moving observations between processes. Observations are Atari-sized frame
+stacks, Prosthetics-sized state vectors or CartPole-sized states. With
+--step_time, each step also sleeps for an exponentially distributed time of
+that mean, which makes some envs straggle.
+
+    python -m baselines.common.bench_vec_env --num_envs 8,16,32 --obs atari,prosthetics
+    python -m baselines.common.bench_vec_env --obs cartpole --envs_per_worker 8
+    python -m baselines.common.bench_vec_env --obs prosthetics --step_time 0.01
+"""
+import argparse
+import functools
+import time
+
+import gym
+import numpy as np
+from gym import spaces
+
+from baselines.common.vec_env.subproc_vec_env import SubprocVecEnv, AsyncSubprocVecEnv
+from baselines.common.vec_env.shmem_vec_env import ShmemVecEnv
+
+OBS_SPACES = {
+    'atari': ((84, 84, 4), np.uint8),
+    'prosthetics': ((158,), np.float64),
+    'cartpole': ((4,), np.float64),
+}
+
+
+class ConstantEnv(gym.Env):
+    def __init__(self, shape, dtype, step_time=0., episode_length=1000):
+        self.observation_space = spaces.Box(low=0, high=255, shape=shape, dtype=dtype)
+        self.action_space = spaces.Discrete(2)
+        self._ob = np.random.randint(0, 256, size=shape).astype(dtype)
+        self._step_time = step_time
+        self._rng = np.random.RandomState()  # seeded from the OS, not copied from the parent by fork
+        self._episode_length = episode_length
+        self._steps = 0
+
+    def reset(self):
+        self._steps = 0
+        return self._ob.copy()
+
+    def step(self, action):
+        if self._step_time > 0:
+            time.sleep(self._rng.exponential(self._step_time))
+        self._steps += 1
+        return self._ob.copy(), 0., self._steps >= self._episode_length, {}
+
+
+def steps_per_sec(make_venv, num_envs, shape, dtype, step_time, num_steps):
+    venv = make_venv([lambda: ConstantEnv(shape, dtype, step_time) for _ in range(num_envs)])
+    actions = np.zeros(num_envs, dtype=np.int64)
+    obs = venv.reset()
+    for _ in range(10):
+        obs = venv.step(actions[:len(obs)])[0]
+    env_steps = 0
+    start = time.time()
+    for _ in range(num_steps):
+        obs = venv.step(actions[:len(obs)])[0]
+        env_steps += len(obs)
+    elapsed = time.time() - start
+    venv.close()
+    return env_steps / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_envs', default='8,16,32')
+    parser.add_argument('--obs', default='atari,prosthetics')
+    parser.add_argument('--envs_per_worker', type=int, default=4)
+    parser.add_argument('--step_time', type=float, default=0.)
+    parser.add_argument('--num_steps', type=int, default=500)
+    args = parser.parse_args()
+
+    print('%-12s %8s %16s %16s %16s %16s' % ('obs', 'num_envs', 'SubprocVecEnv', 'ShmemVecEnv',
+                                             '%d per worker' % args.envs_per_worker, 'async, half'))
+    for obs in args.obs.split(','):
+        shape, dtype = OBS_SPACES[obs]
+        for num_envs in [int(n) for n in args.num_envs.split(',')]:
+            make_venvs = [SubprocVecEnv, ShmemVecEnv,
+                          functools.partial(SubprocVecEnv, envs_per_worker=args.envs_per_worker),
+                          functools.partial(AsyncSubprocVecEnv, min_ready=num_envs // 2)]
+            rates = [steps_per_sec(make_venv, num_envs, shape, dtype, args.step_time, args.num_steps)
+                     for make_venv in make_venvs]
+            print('%-12s %8d' % (obs, num_envs) + ''.join('%17.0f' % rate for rate in rates))
+
+
+if __name__ == '__main__':
+    main()
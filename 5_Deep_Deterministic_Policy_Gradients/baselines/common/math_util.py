@@ -72,6 +72,45 @@ def discount_with_boundaries(X, New, gamma):
         Y[t] = X[t] + gamma * Y[t+1] * (1 - New[t+1])
     return Y
 
+def discount_with_masks(X, masks, gamma, last=0.):
+    """
+    X: array of floats, time x ...
+    masks: array of X's shape, 0 at the steps that end an episode and 1 elsewhere
+    last: discounted sum after the last step, to bootstrap from
+    Returns Y with Y[t] = X[t] + gamma * masks[t] * Y[t+1] and Y[T] = last.
+    Each column is discounted along time by one lfilter pass, after which the part of
+    each sum that leaks across the end of an episode is subtracted again.
+    """
+    X = np.array(X, dtype=np.float64)
+    T = len(X)
+    if T == 0:
+        return X
+    masks = np.broadcast_to(masks, X.shape).reshape(T, -1)
+    X[T-1] += gamma * masks[T-1].reshape(X.shape[1:]) * last
+    x = X.reshape(T, -1)
+    # end of the episode of each step, and the discounted sum from the step after it
+    ends = (masks == 0)
+    ends[T-1] = True
+    t = np.arange(T)[:, None]
+    end = np.minimum.accumulate(np.where(ends, t, T)[::-1], axis=0)[::-1]
+    y = discount(x, gamma)
+    y_next = np.append(y, np.zeros_like(y[:1]), axis=0)[end + 1, np.arange(x.shape[1])]
+    y = y - gamma ** (end + 1 - t) * y_next
+    return y.reshape(X.shape)
+
+def generalized_advantages(rewards, values, news, last_values, last_news, gamma, lam):
+    """
+    GAE(lambda) advantages and TD(lambda) returns of a rollout, time x ...
+    news: whether the observation of each step starts a new episode
+    last_values, last_news: value and new flag of the observation after the last step
+    Returns (advantages, returns) as float32 arrays
+    """
+    nextnonterminal = 1.0 - np.concatenate([news[1:], [last_news]])
+    nextvalues = np.concatenate([values[1:], [last_values]])
+    deltas = rewards + gamma * nextvalues * nextnonterminal - values
+    advs = discount_with_masks(deltas, nextnonterminal, gamma * lam).astype(np.float32)
+    return advs, advs + values
+
 def test_discount_with_boundaries():
     gamma=0.9
     x = np.array([1.0, 2.0, 3.0, 4.0], 'float32')
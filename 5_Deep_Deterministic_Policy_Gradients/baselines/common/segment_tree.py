@@ -1,4 +1,4 @@
-import operator
+import numpy as np
 
 
 class SegmentTree(object):
@@ -16,37 +16,27 @@ class SegmentTree(object):
                `reduce` operation which reduces `operation` over
                a contiguous subsequence of items in the array.
 
+        The tree is stored in a flat float64 array, and items can also be
+        read and set in batches by indexing with an array of indexes.
+
         Paramters
         ---------
         capacity: int
             Total size of the array - must be a power of two.
-        operation: lambda obj, obj -> obj
+        operation: numpy ufunc (eg. np.add, np.minimum)
             and operation for combining elements (eg. sum, max)
             must form a mathematical group together with the set of
             possible values for array elements (i.e. be associative)
-        neutral_element: obj
+            and apply elementwise to arrays.
+        neutral_element: float
             neutral element for the operation above. eg. float('-inf')
             for max and 0 for sum.
         """
         assert capacity > 0 and capacity & (capacity - 1) == 0, "capacity must be positive and a power of 2."
         self._capacity = capacity
-        self._value = [neutral_element for _ in range(2 * capacity)]
+        self._value = np.full(2 * capacity, neutral_element, dtype=np.float64)
         self._operation = operation
-
-    def _reduce_helper(self, start, end, node, node_start, node_end):
-        if start == node_start and end == node_end:
-            return self._value[node]
-        mid = (node_start + node_end) // 2
-        if end <= mid:
-            return self._reduce_helper(start, end, 2 * node, node_start, mid)
-        else:
-            if mid + 1 <= start:
-                return self._reduce_helper(start, end, 2 * node + 1, mid + 1, node_end)
-            else:
-                return self._operation(
-                    self._reduce_helper(start, mid, 2 * node, node_start, mid),
-                    self._reduce_helper(mid + 1, end, 2 * node + 1, mid + 1, node_end)
-                )
+        self._neutral_element = neutral_element
 
     def reduce(self, start=0, end=None):
         """Returns result of applying `self.operation`
@@ -70,10 +60,28 @@ class SegmentTree(object):
             end = self._capacity
         if end < 0:
             end += self._capacity
-        end -= 1
-        return self._reduce_helper(start, end, 1, 0, self._capacity - 1)
+        if start == 0 and end == self._capacity:
+            return self._value[1]
+        # bottom-up over the nodes covering [start, end), keeping the left and
+        # right parts apart so that the operation need not be commutative
+        start += self._capacity
+        end += self._capacity
+        left = right = self._neutral_element
+        while start < end:
+            if start & 1:
+                left = self._operation(left, self._value[start])
+                start += 1
+            if end & 1:
+                end -= 1
+                right = self._operation(self._value[end], right)
+            start //= 2
+            end //= 2
+        return self._operation(left, right)
 
     def __setitem__(self, idx, val):
+        if np.ndim(idx) > 0:
+            self._set_batch(idx, val)
+            return
         # index of the leaf
         idx += self._capacity
         self._value[idx] = val
@@ -85,16 +93,27 @@ class SegmentTree(object):
             )
             idx //= 2
 
+    def _set_batch(self, idxes, vals):
+        # set all leaves, then recompute their parents one level at a time; a
+        # parent shared by several leaves is just recomputed more than once.
+        # With repeated indexes the last value wins, as with sequential sets
+        idxes = np.asarray(idxes, dtype=np.int64) + self._capacity
+        self._value[idxes] = vals
+        for _ in range(self._capacity.bit_length() - 1):
+            idxes >>= 1
+            left = idxes << 1
+            self._value[idxes] = self._operation(self._value[left], self._value[left + 1])
+
     def __getitem__(self, idx):
-        assert 0 <= idx < self._capacity
-        return self._value[self._capacity + idx]
+        assert np.all(0 <= idx) and np.all(idx < self._capacity)
+        return self._value[self._capacity + np.asarray(idx)]
 
 
 class SumSegmentTree(SegmentTree):
     def __init__(self, capacity):
         super(SumSegmentTree, self).__init__(
             capacity=capacity,
-            operation=operator.add,
+            operation=np.add,
             neutral_element=0.0
         )
 
@@ -112,14 +131,18 @@ class SumSegmentTree(SegmentTree):
 
         Parameters
         ----------
-        perfixsum: float
-            upperbound on the sum of array prefix
+        perfixsum: float or np.array
+            upperbound on the sum of array prefix; for an array of
+            prefixsums, all of them descend the tree together, one
+            level at a time
 
         Returns
         -------
-        idx: int
+        idx: int or np.array
             highest index satisfying the prefixsum constraint
         """
+        if np.ndim(prefixsum) > 0:
+            return self._find_prefixsum_idx_batch(prefixsum)
         assert 0 <= prefixsum <= self.sum() + 1e-5
         idx = 1
         while idx < self._capacity:  # while non-leaf
@@ -130,12 +153,24 @@ class SumSegmentTree(SegmentTree):
                 idx = 2 * idx + 1
         return idx - self._capacity
 
+    def _find_prefixsum_idx_batch(self, prefixsum):
+        prefixsum = np.array(prefixsum, dtype=np.float64)
+        assert np.all(0 <= prefixsum) and np.all(prefixsum <= self.sum() + 1e-5)
+        idx = np.ones(len(prefixsum), dtype=np.int64)
+        for _ in range(self._capacity.bit_length() - 1):  # all queries descend together
+            idx <<= 1
+            left = self._value[idx]
+            right = left <= prefixsum
+            prefixsum -= left * right
+            idx += right
+        return idx - self._capacity
+
 
 class MinSegmentTree(SegmentTree):
     def __init__(self, capacity):
         super(MinSegmentTree, self).__init__(
             capacity=capacity,
-            operation=min,
+            operation=np.minimum,
             neutral_element=float('inf')
         )
 
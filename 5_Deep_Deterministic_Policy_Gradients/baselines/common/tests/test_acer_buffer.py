@@ -0,0 +1,53 @@
+import numpy as np
+from gym import spaces
+
+from baselines.acer.buffer import Buffer
+
+
+class FakeVecEnv(object):
+    def __init__(self, num_envs, shape):
+        self.num_envs = num_envs
+        self.observation_space = spaces.Box(low=0, high=255, shape=shape, dtype=np.uint8)
+
+
+def stack_frames(enc_obs, dones, nstack):
+    """Stacked obs of one env: at step k, frame k + s of enc_obs in slot s, unless an episode ended since."""
+    nsteps = len(dones)
+    obs = np.zeros((nsteps + 1,) + enc_obs.shape[1:-1] + (nstack, enc_obs.shape[-1]), dtype=np.uint8)
+    for k in range(nsteps + 1):
+        for s in range(nstack):
+            if not dones[max(k - (nstack - 1) + s, 0):k].any():
+                obs[k, ..., s, :] = enc_obs[k + s]
+    return obs.reshape(obs.shape[:-2] + (-1,))
+
+
+def test_buffer_get():
+    np.random.seed(0)
+    nenv, nsteps, nact = 3, 5, 4
+    for nstack in [1, 2, 4]:
+        buffer = Buffer(FakeVecEnv(nenv, (2, 3, 2)), nsteps, nstack, size=3 * nsteps)
+        rollouts = []
+        for _ in range(3):
+            rollout = (np.random.randint(0, 256, size=(nenv, nsteps + nstack, 2, 3, 2)).astype(np.uint8),
+                       np.random.randint(0, nact, size=(nenv, nsteps)),
+                       np.random.randn(nenv, nsteps).astype(np.float32),
+                       np.random.rand(nenv, nsteps, nact).astype(np.float32),
+                       np.random.rand(nenv, nsteps) < 0.3,
+                       np.random.rand(nenv, nsteps + 1) < 0.3)
+            buffer.put(*rollout)
+            rollouts.append(rollout)
+
+        for segments_per_env in [1, 3]:
+            obs, actions, rewards, mus, dones, masks = buffer.get(segments_per_env=segments_per_env)
+            assert obs.shape == (segments_per_env * nenv, nsteps + 1, 2, 3, 2 * nstack)
+            for row in range(segments_per_env * nenv):
+                env = row % nenv
+                # the rollout the row was sampled from
+                rollout = next(r for r in rollouts if np.array_equal(r[3][env], mus[row]))
+                enc_obs, r_actions, r_rewards, _, r_dones, r_masks = rollout
+                assert np.array_equal(obs[row], stack_frames(enc_obs[env], r_dones[env], nstack))
+                assert np.array_equal(buffer.decode(enc_obs[env:env + 1], r_dones[env:env + 1])[0], obs[row])
+                assert np.array_equal(actions[row], r_actions[env])
+                assert np.array_equal(rewards[row], r_rewards[env])
+                assert np.array_equal(dones[row], r_dones[env])
+                assert np.array_equal(masks[row], r_masks[env])
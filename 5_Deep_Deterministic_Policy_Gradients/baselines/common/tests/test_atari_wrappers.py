@@ -0,0 +1,56 @@
+import gym
+import numpy as np
+import pytest
+from gym import spaces
+
+pytest.importorskip('cv2')  # baselines.common.atari_wrappers resizes frames with cv2
+from baselines.common.atari_wrappers import MaxAndSkipEnv  # noqa: E402
+
+
+class RandomFrameEnv(gym.Env):
+    """Random 210x160x3 frames, with episodes of 1 to 9 steps so that some end mid-skip."""
+    observation_space = spaces.Box(low=0, high=255, shape=(210, 160, 3), dtype=np.uint8)
+    action_space = spaces.Discrete(2)
+
+    def __init__(self, seed):
+        self.rng = np.random.RandomState(seed)
+
+    def reset(self):
+        self.steps_left = self.rng.randint(1, 10)
+        return self.rng.randint(0, 256, size=self.observation_space.shape).astype(np.uint8)
+
+    def step(self, action):
+        self.steps_left -= 1
+        ob = self.rng.randint(0, 256, size=self.observation_space.shape).astype(np.uint8)
+        return ob, float(self.rng.randint(3)), self.steps_left == 0, {}
+
+
+class OldMaxAndSkipEnv(MaxAndSkipEnv):
+    """MaxAndSkipEnv as it was before it max-pooled with np.maximum."""
+    def step(self, action):
+        total_reward = 0.0
+        done = None
+        for i in range(self._skip):
+            obs, reward, done, info = self.env.step(action)
+            if i == self._skip - 2: self._obs_buffer[0] = obs
+            if i == self._skip - 1: self._obs_buffer[1] = obs
+            total_reward += reward
+            if done:
+                break
+        max_frame = self._obs_buffer.max(axis=0)
+
+        return max_frame, total_reward, done, info
+
+
+@pytest.mark.parametrize('skip', [1, 2, 4])
+def test_max_and_skip_matches_max_over_buffer(skip):
+    env, old_env = MaxAndSkipEnv(RandomFrameEnv(0), skip), OldMaxAndSkipEnv(RandomFrameEnv(0), skip)
+    for _ in range(10):
+        np.testing.assert_array_equal(env.reset(), old_env.reset())
+        done = False
+        while not done:
+            ob, reward, done, _ = env.step(0)
+            old_ob, old_reward, old_done, _ = old_env.step(0)
+            assert ob.dtype == old_ob.dtype == np.uint8
+            np.testing.assert_array_equal(ob, old_ob)
+            assert (reward, done) == (old_reward, old_done)
@@ -0,0 +1,212 @@
+import json
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from baselines.ddpg import memory as memory_module
+from baselines.ddpg.memory import Memory
+
+
+def append_episodes(memories, num_appends, seed):
+    """
+    Appends the same steps of several envs to each memory, with episode ends, where obs1 is a
+    reset observation and not the next obs0, and appends of varying numbers of envs.
+    """
+    rng = np.random.RandomState(seed)
+    obs = None
+    for _ in range(num_appends):
+        nenvs = rng.choice([1, 3, 3, 3, 5])
+        if obs is None or len(obs) != nenvs:
+            obs = rng.randn(nenvs, 2, 3)
+        obs1 = rng.randn(nenvs, 2, 3)
+        actions = rng.randn(nenvs, 2)
+        rewards = rng.randn(nenvs)
+        terminals = rng.rand(nenvs) < 0.2
+        for memory in memories:
+            memory.append_batch(obs, actions, rewards, obs1, terminals)
+        obs = np.where(terminals[:, None, None], rng.randn(nenvs, 2, 3), obs1)
+
+
+def assert_samples_equal(memory1, memory2, batch_size=64):
+    state = np.random.get_state()
+    batch1 = memory1.sample(batch_size)
+    np.random.set_state(state)
+    batch2 = memory2.sample(batch_size)
+    assert sorted(batch1) == sorted(batch2)
+    for key in batch1:
+        assert batch1[key].dtype == batch2[key].dtype
+        assert np.array_equal(batch1[key], batch2[key]), key
+
+
+def test_dedup_next_observations():
+    np.random.seed(0)
+    for limit, num_appends in [(7, 2), (7, 30), (50, 40), (1, 5)]:
+        plain = Memory(limit, (2,), (2, 3))
+        dedup = Memory(limit, (2,), (2, 3), dedup_next_observations=True)
+        for seed in range(3):
+            append_episodes([plain, dedup], num_appends, seed)
+            assert plain.nb_entries == dedup.nb_entries
+            for _ in range(5):
+                assert_samples_equal(plain, dedup)
+        # obs1 kept aside only for the transitions not linked to a next obs0, all of them in the memory
+        assert len(dedup.next_observations) <= dedup.nb_entries
+
+
+def assert_memories_equal(memory1, memory2):
+    assert memory1.transitions.state() == memory2.transitions.state()
+    assert np.array_equal(memory1.transitions.data, memory2.transitions.data)
+    for _ in range(3):
+        assert_samples_equal(memory1, memory2)
+
+
+def read_header(path):
+    with open(os.path.join(path, 'header.json')) as f:
+        return json.load(f)
+
+
+def test_save_load(tmp_path):
+    np.random.seed(0)
+    for dedup in [False, True]:
+        path = str(tmp_path / ('dedup' if dedup else 'plain'))
+        memory = Memory(20, (2,), (2, 3), observation_dtype='float16', dedup_next_observations=dedup)
+        append_episodes([memory], 4, seed=0)
+        memory.save(path)
+        for in_memory in [False, True]:
+            assert_memories_equal(memory, Memory.load(path, in_memory=in_memory))
+
+        # the ring wraps between the two saves, but less than limit transitions are appended
+        append_episodes([memory], 4, seed=1)
+        assert memory.transitions.appended > memory.limit
+        transitions_file = read_header(path)['transitions_file']
+        memory.save(path, incremental=True)
+        assert read_header(path)['transitions_file'] == transitions_file
+        loaded = Memory.load(path)
+        assert_memories_equal(memory, loaded)
+
+        # the loaded memory keeps adding to the checkpoint
+        append_episodes([memory, loaded], 3, seed=2)
+        loaded.save(path, incremental=True)
+        assert read_header(path)['transitions_file'] == transitions_file
+        assert_memories_equal(memory, Memory.load(path))
+
+
+def test_save_interrupted(tmp_path, monkeypatch):
+    np.random.seed(0)
+    path = str(tmp_path)
+    memory = Memory(20, (2,), (2, 3), dedup_next_observations=True)
+    append_episodes([memory], 4, seed=0)
+    memory.save(path)
+    append_episodes([memory], 3, seed=1)
+
+    def interrupted(filename, slots, values):
+        raise KeyboardInterrupt()
+    with monkeypatch.context() as m:
+        m.setattr(memory_module.RingBuffer, 'write_slots', staticmethod(interrupted))
+        with pytest.raises(KeyboardInterrupt):
+            memory.save(path, incremental=True)
+    # load finishes the save from its journal
+    assert_memories_equal(memory, Memory.load(path))
+    assert not os.path.exists(os.path.join(path, 'journal.npz'))
+
+
+def test_save_foreign_checkpoint(tmp_path):
+    np.random.seed(0)
+    path = str(tmp_path)
+    other = Memory(20, (2,), (2, 3))
+    append_episodes([other], 2, seed=0)
+    other.save(path)
+    memory = Memory(20, (2,), (2, 3))
+    append_episodes([memory], 3, seed=1)
+    assert memory.nb_entries > other.nb_entries
+    # same layout, but another memory's transitions: written in full
+    memory.save(path, incremental=True)
+    assert_memories_equal(memory, Memory.load(path))
+
+    # a checkpoint of the same lineage saved at another point: written in full too
+    loaded = Memory.load(path)
+    append_episodes([memory], 2, seed=2)
+    memory.save(path, incremental=True)
+    append_episodes([loaded], 2, seed=3)
+    loaded.save(path, incremental=True)
+    assert_memories_equal(loaded, Memory.load(path))
+    assert len([name for name in os.listdir(path) if name.startswith('transitions-')]) == 1
+
+
+def test_load_version_mismatch(tmp_path):
+    path = str(tmp_path)
+    memory = Memory(20, (2,), (2, 3))
+    append_episodes([memory], 2, seed=0)
+    memory.save(path)
+    header = read_header(path)
+    header['version'] = memory_module.CHECKPOINT_VERSION - 1
+    with open(os.path.join(path, 'header.json'), 'w') as f:
+        json.dump(header, f)
+    with pytest.raises(ValueError, match='version'):
+        Memory.load(path)
+
+
+class LegacyRingBuffer(object):
+    """The per-field RingBuffer of the old Memory, which was pickled whole."""
+    def __init__(self, maxlen, shape, dtype='float32'):
+        self.maxlen = maxlen
+        self.start = 0
+        self.length = 0
+        self.data = np.zeros((maxlen,) + shape).astype(dtype)
+
+    def append(self, v):
+        if self.length < self.maxlen:
+            self.length += 1
+        else:
+            self.start = (self.start + 1) % self.maxlen
+        self.data[(self.start + self.length - 1) % self.maxlen] = v
+
+
+class LegacyMemory(object):
+    def __init__(self, limit, action_shape, observation_shape):
+        self.limit = limit
+        self.observations0 = LegacyRingBuffer(limit, shape=observation_shape)
+        self.actions = LegacyRingBuffer(limit, shape=action_shape)
+        self.rewards = LegacyRingBuffer(limit, shape=(1,))
+        self.terminals1 = LegacyRingBuffer(limit, shape=(1,))
+        self.observations1 = LegacyRingBuffer(limit, shape=observation_shape)
+
+    def append_batch(self, obs0, action, reward, obs1, terminal1):
+        for i in range(len(obs0)):
+            self.observations0.append(obs0[i])
+            self.actions.append(action[i])
+            self.rewards.append(reward[i])
+            self.observations1.append(obs1[i])
+            self.terminals1.append(terminal1[i])
+
+
+def test_import_legacy_pickle(tmp_path, monkeypatch):
+    np.random.seed(0)
+    for dedup in [False, True]:
+        for num_appends in [3, 30]:
+            legacy, memory = LegacyMemory(20, (2,), (2, 3)), Memory(20, (2,), (2, 3))
+            append_episodes([legacy, memory], num_appends, seed=0)
+            filename = str(tmp_path / 'memory.pickle')
+            # pickled under the names the old classes had in baselines.ddpg.memory
+            old_classes = {name: type(name, (cls,), {'__module__': memory_module.__name__})
+                           for name, cls in [('Memory', LegacyMemory), ('RingBuffer', LegacyRingBuffer)]}
+            legacy.__class__ = old_classes['Memory']
+            for ring in vars(legacy).values():
+                if isinstance(ring, LegacyRingBuffer):
+                    ring.__class__ = old_classes['RingBuffer']
+            with monkeypatch.context() as m:
+                for name, cls in old_classes.items():
+                    m.setattr(memory_module, name, cls)
+                with open(filename, 'wb') as f:
+                    pickle.dump(legacy, f)
+
+            # the old pickles fail loudly instead of loading a memory that cannot sample
+            with open(filename, 'rb') as f, pytest.raises(ValueError, match='import_legacy_pickle'):
+                pickle.load(f)
+
+            path = str(tmp_path / ('checkpoint-%d-%d' % (dedup, num_appends)))
+            imported = memory_module.import_legacy_pickle(filename, path, dedup_next_observations=dedup)
+            assert imported.nb_entries == memory.nb_entries
+            assert_samples_equal(imported, memory)
+            assert_samples_equal(Memory.load(path), memory)
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from baselines.her.her import make_sample_her_transitions
+
+
+N, T = 3, 4
+
+
+def make_episode_batch():
+    """Episodes laid out like the HER replay buffer's, with ag[e, t] = (10 e, t), so the
+    goal of a transition tells which achieved goal it was replaced by, and original goals
+    (10 e + 5, 100) that are far from all of them."""
+    e, t = np.meshgrid(np.arange(N), np.arange(T + 1), indexing='ij')
+    ag = np.stack([10. * e, t], axis=-1)
+    episode_batch = {'o': ag.copy(), 'ag': ag,
+                     'g': np.stack([10. * e[:, :T] + 5, np.full((N, T), 100.)], axis=-1),
+                     'u': ag[:, :T].copy()}
+    episode_batch['o_2'] = episode_batch['o'][:, 1:, :]
+    episode_batch['ag_2'] = episode_batch['ag'][:, 1:, :]
+    return episode_batch
+
+
+def her_goals(replay_strategy):
+    """Returns the (episode, t) of each transition, the (episode, t) of the achieved
+    goal that replaced its goal, and the transitions themselves."""
+    np.random.seed(0)
+    sample = make_sample_her_transitions(replay_strategy, 4, None, distance_threshold=1.)
+    transitions = sample(make_episode_batch(), 5000)
+    episode, t = transitions['u'][:, 0] / 10, transitions['u'][:, 1]
+    np.testing.assert_array_equal(transitions['o'], transitions['u'])
+    np.testing.assert_array_equal(transitions['ag_2'], transitions['ag'] + [0, 1])
+    np.testing.assert_array_equal(transitions['o_2'], transitions['ag_2'])
+    her = transitions['g'][:, 1] != 100
+    np.testing.assert_array_equal(transitions['g'][~her, 0], 10 * episode[~her] + 5)
+    # the reward is 0 within the threshold, which is inclusive
+    d = np.linalg.norm(transitions['ag_2'] - transitions['g'], axis=-1)
+    np.testing.assert_array_equal(transitions['r'], -(d > 1.).astype(np.float32))
+    goal_episode, goal_t = transitions['g'][:, 0] / 10, transitions['g'][:, 1]
+    return (episode[her], t[her]), (goal_episode[her], goal_t[her]), transitions
+
+
+def pairs(*arrays):
+    return set(zip(*[a.astype(int) for a in arrays]))
+
+
+@pytest.mark.parametrize('replay_strategy', ['future', 'final', 'episode', 'random'])
+def test_her_goal_indices(replay_strategy):
+    (episode, t), (goal_episode, goal_t), transitions = her_goals(replay_strategy)
+    # replay_k = 4 relabels 4 in 5 transitions
+    assert abs(len(t) / len(transitions['r']) - 0.8) < 0.02
+
+    # goals achieved at time index t' are ag[t'], the one achieved by the transition at t' - 1
+    if replay_strategy == 'future':
+        expected = {(t, t2) for t in range(T) for t2 in range(t + 1, T + 1)}
+    elif replay_strategy == 'final':
+        expected = {(t, T) for t in range(T)}
+    else:
+        expected = {(t, t2) for t in range(T) for t2 in range(1, T + 1)}
+    assert pairs(t, goal_t) == expected
+
+    if replay_strategy == 'random':
+        assert pairs(episode, goal_episode) == {(e, e2) for e in range(N) for e2 in range(N)}
+    else:
+        np.testing.assert_array_equal(goal_episode, episode)
+
+    # the relabelled transition is rewarded when its goal is at most one step from ag_2
+    reached = (goal_episode == episode) & (np.abs(goal_t - (t + 1)) <= 1)
+    her_rewards = transitions['r'][transitions['g'][:, 1] != 100]
+    np.testing.assert_array_equal(her_rewards, -(~reached).astype(np.float32))
+
+
+def test_her_none():
+    (episode, t), _, transitions = her_goals('none')
+    assert len(t) == 0
+    np.testing.assert_array_equal(transitions['r'], -np.ones(len(transitions['r'])))
+
+
+def test_her_reward_fun():
+    """Without distance_threshold, the reward comes from reward_fun on ag_2 and the goal."""
+    np.random.seed(0)
+    reward_fun = lambda ag_2, g, info: -(np.linalg.norm(ag_2 - g, axis=-1) > 1.).astype(np.float32)
+    sample = make_sample_her_transitions('future', 4, reward_fun)
+    transitions = sample(make_episode_batch(), 500)
+    np.testing.assert_array_equal(transitions['r'], reward_fun(transitions['ag_2'], transitions['g'], {}))
+    assert (transitions['r'] == 0).any() and (transitions['r'] == -1).any()
@@ -0,0 +1,57 @@
+import threading
+import time
+
+import numpy as np
+
+from baselines.her.her import make_sample_her_transitions
+from baselines.her.replay_buffer import ReplayBuffer, BatchPrefetcher
+
+
+def make_episode(episode_id, T, dims):
+    """An episode whose every entry is its id, so a transition gathered from more
+    than one episode shows up as keys that disagree."""
+    return {key: np.full((1, T + 1 if key in ['o', 'ag'] else T, dim), episode_id, dtype=np.float64)
+            for key, dim in dims.items()}
+
+
+class YieldingDict(dict):
+    """Lets other threads run on every lookup, so that writes land in the middle of a sample."""
+    def __getitem__(self, key):
+        time.sleep(0)
+        return dict.__getitem__(self, key)
+
+
+def test_prefetch_while_storing():
+    T, dims = 5, {'o': 3, 'ag': 2, 'g': 2, 'u': 2}
+    buffer_shapes = {key: (T + 1 if key in ['o', 'ag'] else T, dim) for key, dim in dims.items()}
+    sample_her_transitions = make_sample_her_transitions('future', 4, None, distance_threshold=0.5)
+    buffer = ReplayBuffer(buffer_shapes, 8 * T, T,
+                          lambda buffers, batch_size: sample_her_transitions(YieldingDict(buffers), batch_size))
+    buffer.store_episode(make_episode(0, T, dims))
+
+    stopped = threading.Event()
+
+    def write():
+        # once the buffer is full, episodes overwrite random slots while they are sampled
+        episode_id = 1
+        while not stopped.is_set():
+            buffer.store_episode(make_episode(episode_id, T, dims))
+            episode_id += 1
+            time.sleep(0.001)
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    prefetcher = BatchPrefetcher(lambda: buffer.sample(32), 2)
+    try:
+        for _ in range(100):
+            transitions = prefetcher.get()
+            ids = transitions['u'][:, 0]
+            for key in ['o', 'o_2', 'ag', 'ag_2', 'g', 'u']:
+                np.testing.assert_array_equal(transitions[key], np.broadcast_to(ids[:, None], transitions[key].shape),
+                                              err_msg='%s of a transition torn across episodes' % key)
+            np.testing.assert_array_equal(transitions['r'], np.zeros(32))
+    finally:
+        stopped.set()
+        writer.join()
+        prefetcher.close()
+    assert buffer.full
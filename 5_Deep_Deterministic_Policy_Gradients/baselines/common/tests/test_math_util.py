@@ -0,0 +1,59 @@
+import numpy as np
+
+from baselines.common.math_util import discount_with_masks, generalized_advantages
+
+
+def add_vtarg_and_adv_loop(rewards, values, news, last_values, last_news, gamma, lam):
+    """The per-step loop of add_vtarg_and_adv and the PPO2 runner that generalized_advantages replaced."""
+    T = len(rewards)
+    advs = np.zeros_like(rewards, dtype=np.float32)
+    lastgaelam = 0
+    for t in reversed(range(T)):
+        if t == T - 1:
+            nextnonterminal = 1.0 - last_news
+            nextvalues = last_values
+        else:
+            nextnonterminal = 1.0 - news[t + 1]
+            nextvalues = values[t + 1]
+        delta = rewards[t] + gamma * nextvalues * nextnonterminal - values[t]
+        advs[t] = lastgaelam = delta + gamma * lam * nextnonterminal * lastgaelam
+    return advs, advs + values
+
+
+def discount_with_masks_loop(X, masks, gamma, last=0.):
+    Y = np.empty(np.shape(X), dtype=np.float64)
+    for t in reversed(range(len(Y))):
+        Y[t] = last = X[t] + gamma * masks[t] * last
+    return Y
+
+
+def test_discount_with_masks():
+    rng = np.random.RandomState(0)
+    for shape in [(1,), (7,), (50, 3), (20, 2, 3)]:
+        for done_prob in [0., 0.1, 1.]:
+            X = rng.randn(*shape)
+            masks = (rng.rand(*shape) >= done_prob).astype(np.float64)
+            last = rng.randn(*shape[1:])
+            for gamma in [0., 0.9, 1.]:
+                assert np.allclose(discount_with_masks(X, masks, gamma), discount_with_masks_loop(X, masks, gamma))
+                assert np.allclose(discount_with_masks(X, masks, gamma, last),
+                                   discount_with_masks_loop(X, masks, gamma, last))
+    assert discount_with_masks(np.zeros((0, 2)), np.zeros((0, 2)), 0.9).shape == (0, 2)
+
+
+def test_generalized_advantages():
+    rng = np.random.RandomState(0)
+    for nsteps, nenvs in [(1, None), (64, None), (128, 4)]:
+        shape = (nsteps,) if nenvs is None else (nsteps, nenvs)
+        rewards = rng.randn(*shape).astype(np.float32)
+        values = rng.randn(*shape).astype(np.float32)
+        news = rng.rand(*shape) < 0.05
+        last_values = np.float32(rng.randn(*shape[1:]))
+        last_news = np.asarray(rng.rand(*shape[1:]) < 0.05)
+        for gamma, lam in [(0.99, 0.95), (1., 1.)]:
+            advs, returns = generalized_advantages(rewards, values, news, last_values, last_news, gamma, lam)
+            expected_advs, expected_returns = add_vtarg_and_adv_loop(rewards, values, news, last_values,
+                                                                     last_news, gamma, lam)
+            assert advs.dtype == returns.dtype == np.float32
+            assert np.allclose(advs, expected_advs, atol=1e-5)
+            assert np.allclose(returns, expected_returns, atol=1e-5)
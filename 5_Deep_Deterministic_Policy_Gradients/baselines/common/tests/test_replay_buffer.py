@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow.contrib')  # baselines.deepq builds its models with tf.contrib
+from baselines.deepq.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer  # noqa: E402
+
+
+class ListReplayBuffer(object):
+    """The list-of-tuples buffer that ReplayBuffer replaced."""
+    def __init__(self, size):
+        self._storage = []
+        self._maxsize = size
+        self._next_idx = 0
+
+    def add(self, obs_t, action, reward, obs_tp1, done):
+        data = (obs_t, action, reward, obs_tp1, done)
+        if self._next_idx >= len(self._storage):
+            self._storage.append(data)
+        else:
+            self._storage[self._next_idx] = data
+        self._next_idx = (self._next_idx + 1) % self._maxsize
+
+    def _encode_sample(self, idxes):
+        obses_t, actions, rewards, obses_tp1, dones = [], [], [], [], []
+        for i in idxes:
+            obs_t, action, reward, obs_tp1, done = self._storage[i]
+            obses_t.append(np.asarray(obs_t))
+            actions.append(np.asarray(action))
+            rewards.append(reward)
+            obses_tp1.append(np.asarray(obs_tp1))
+            dones.append(done)
+        return np.array(obses_t), np.array(actions), np.array(rewards), np.array(obses_tp1), np.array(dones)
+
+
+def add_episodes(buffers, num_steps, seed):
+    """Adds the same chained episodes to each buffer, ending one in four steps on average."""
+    rng = np.random.RandomState(seed)
+    obs = rng.randint(0, 256, size=(4, 3)).astype(np.uint8)
+    for _ in range(num_steps):
+        next_obs = rng.randint(0, 256, size=(4, 3)).astype(np.uint8)
+        action, reward, done = rng.randint(0, 4), float(rng.randn()), rng.rand() < 0.25
+        for buffer in buffers:
+            buffer.add(obs, action, reward, next_obs, float(done))
+        obs = rng.randint(0, 256, size=(4, 3)).astype(np.uint8) if done else next_obs
+
+
+def add_stacked_episodes(buffers, num_steps, seed, k=4):
+    """Adds the same episodes of stacks of k frames to each buffer, as FrameStack returns them."""
+    rng = np.random.RandomState(seed)
+    new_frame = lambda: rng.randint(0, 256, size=(4, 3, 2)).astype(np.uint8)
+    frames = [new_frame()] * k
+    for _ in range(num_steps):
+        next_frames = frames[1:] + [new_frame()]
+        action, reward, done = rng.randint(0, 4), float(rng.randn()), rng.rand() < 0.1
+        for buffer in buffers:
+            buffer.add(np.concatenate(frames, axis=2), action, reward, np.concatenate(next_frames, axis=2),
+                       float(done))
+        frames = [new_frame()] * k if done else next_frames
+
+
+def test_replay_buffer_matches_list_buffer():
+    for size in [1, 2, 7, 50]:
+        for buffer_cls in [ReplayBuffer, lambda size: PrioritizedReplayBuffer(size, alpha=0.6)]:
+            buffer, list_buffer = buffer_cls(size), ListReplayBuffer(size)
+            for seed in range(4):
+                # the buffer wraps around from the second round on for the small sizes
+                add_episodes([buffer, list_buffer], 20, seed)
+                assert len(buffer) == len(list_buffer._storage)
+                idxes = np.arange(len(buffer))
+                for value, expected in zip(buffer._encode_sample(idxes), list_buffer._encode_sample(idxes)):
+                    assert value.dtype == expected.dtype and value.shape == expected.shape
+                    assert np.array_equal(value, expected)
+
+
+def test_replay_buffer_frame_stacks():
+    for size in [1, 2, 7, 50]:
+        for buffer_cls in [ReplayBuffer, lambda size, k: PrioritizedReplayBuffer(size, alpha=0.6, frame_history_len=k)]:
+            buffer, list_buffer = buffer_cls(size, 4), ListReplayBuffer(size)
+            for seed in range(4):
+                add_stacked_episodes([buffer, list_buffer], 30, seed)
+                idxes = np.arange(len(buffer))
+                for value, expected in zip(buffer._encode_sample(idxes), list_buffer._encode_sample(idxes)):
+                    assert value.dtype == expected.dtype and value.shape == expected.shape
+                    assert np.array_equal(value, expected)
+            # one frame per transition, plus the frames the oldest stack reaches back to
+            assert buffer._frames.shape == (size + 3, 4, 3, 2)
+
+
+def test_replay_buffer_rejects_unstacked():
+    buffer = ReplayBuffer(10, frame_history_len=2)
+    obs = np.arange(12, dtype=np.uint8).reshape(2, 3, 2)
+    with pytest.raises(ValueError):
+        buffer.add(obs, 0, 0., obs, 0.)
+
+
+def test_replay_buffer_sample():
+    np.random.seed(0)
+    buffer = ReplayBuffer(7)
+    add_episodes([buffer], 10, seed=0)
+    obs, actions, rewards, next_obs, dones = buffer.sample(16)
+    assert obs.shape == next_obs.shape == (16, 4, 3) and obs.dtype == np.uint8
+    assert actions.shape == rewards.shape == dones.shape == (16,)
@@ -95,9 +95,43 @@ def test_max_interval_tree():
     assert np.isclose(tree.min(3, 4), 3.0)
 
 
+def test_batch_set():
+    rng = np.random.RandomState(0)
+    batch, sequential = SumSegmentTree(64), SumSegmentTree(64)
+    batch_min, sequential_min = MinSegmentTree(64), MinSegmentTree(64)
+
+    idxes = rng.randint(0, 64, size=100)  # with repeats; the last value wins
+    vals = rng.rand(100)
+    batch[idxes] = vals
+    batch_min[idxes] = vals
+    for idx, val in zip(idxes, vals):
+        sequential[idx] = val
+        sequential_min[idx] = val
+
+    assert np.allclose(batch._value, sequential._value)
+    assert np.allclose(batch_min._value, sequential_min._value)
+    assert np.allclose(batch[np.arange(64)], [sequential[i] for i in range(64)])
+    for start, end in [(0, 64), (3, 17), (10, 11), (5, -1)]:
+        assert np.isclose(batch.sum(start, end), sequential.sum(start, end))
+        assert np.isclose(batch_min.min(start, end), sequential_min.min(start, end))
+
+
+def test_prefixsum_idx_batch():
+    rng = np.random.RandomState(0)
+    tree = SumSegmentTree(128)
+    tree[np.arange(100)] = rng.rand(100) * (rng.rand(100) > 0.3)
+
+    prefixsums = rng.rand(1000) * tree.sum()
+    assert np.array_equal(tree.find_prefixsum_idx(prefixsums),
+                          [tree.find_prefixsum_idx(p) for p in prefixsums])
+    assert tree.find_prefixsum_idx(np.zeros(0)).shape == (0,)
+
+
 if __name__ == '__main__':
     test_tree_set()
     test_tree_set_overlap()
     test_prefixsum_idx()
     test_prefixsum_idx2()
     test_max_interval_tree()
+    test_batch_set()
+    test_prefixsum_idx_batch()
@@ -0,0 +1,117 @@
+import gym
+import numpy as np
+from gym import spaces
+
+from baselines.common.vec_env.dummy_vec_env import DummyVecEnv
+from baselines.common.vec_env.shmem_vec_env import ShmemVecEnv
+from baselines.common.vec_env.subproc_vec_env import SubprocVecEnv, AsyncSubprocVecEnv
+from baselines.common.vec_env.vec_frame_stack import VecFrameStack
+
+
+class SimpleEnv(gym.Env):
+    """Deterministic env whose observations depend on the seed, the steps and the actions."""
+    def __init__(self, seed, shape, dtype):
+        self._start = seed
+        self._state = None
+        self._steps = 0
+        self.observation_space = spaces.Box(low=0, high=255, shape=shape, dtype=dtype)
+        self.action_space = spaces.Box(low=0, high=100, shape=(), dtype=np.float32)
+
+    def reset(self):
+        self._state = np.full(self.observation_space.shape, self._start)
+        self._steps = 0
+        return self._state.astype(self.observation_space.dtype)
+
+    def step(self, action):
+        self._state = (self._state + int(action)) % 256
+        self._steps += 1
+        done = self._steps % (3 + self._start) == 0
+        return self._state.astype(self.observation_space.dtype), float(self._start + self._steps), done, {'steps': self._steps}
+
+
+def assert_venvs_equal(venv1, venv2, num_steps):
+    """Compares the outputs of two vectorized environments stepped with the same actions."""
+    try:
+        assert np.array_equal(venv1.reset(), venv2.reset())
+        for _ in range(num_steps):
+            actions = np.random.randint(0, 100, size=venv1.num_envs)
+            outs1, outs2 = venv1.step(actions), venv2.step(actions)
+            assert outs1[0].dtype == outs2[0].dtype
+            for out1, out2 in zip(outs1[:3], outs2[:3]):
+                assert np.array_equal(out1, out2)
+    finally:
+        venv1.close()
+        venv2.close()
+
+
+def test_shmem_vec_env():
+    for shape, dtype in [((2, 3), np.uint8), ((5,), np.float32)]:
+        fns = [lambda seed=seed: SimpleEnv(seed, shape, dtype) for seed in range(4)]
+        assert_venvs_equal(DummyVecEnv(fns), ShmemVecEnv(fns), num_steps=50)
+
+
+def test_shmem_vec_env_views():
+    """The results of a step stay valid through the next step."""
+    fns = [lambda seed=seed: SimpleEnv(seed, (3,), np.uint8) for seed in range(2)]
+    venv = ShmemVecEnv(fns)
+    try:
+        obs = venv.reset().copy()
+        prev_obs = venv.step(np.ones(2))[0]
+        expected = prev_obs.copy()
+        assert np.array_equal(expected, obs + 1)
+        venv.step(np.ones(2))
+        assert np.array_equal(prev_obs, expected)
+    finally:
+        venv.close()
+
+
+def test_envs_per_worker():
+    fns = [lambda seed=seed: SimpleEnv(seed, (2, 3), np.uint8) for seed in range(6)]
+    assert_venvs_equal(DummyVecEnv(fns), SubprocVecEnv(fns, envs_per_worker=3), num_steps=50)
+    assert_venvs_equal(DummyVecEnv(fns), AsyncSubprocVecEnv(fns, envs_per_worker=2), num_steps=50)
+
+
+def test_async_partial_steps():
+    """Each env returned by step_wait() carries the result of the last action sent to it."""
+    fns = [lambda seed=seed: SimpleEnv(seed, (3,), np.uint8) for seed in range(6)]
+    envs = [fn() for fn in fns]
+    venv = AsyncSubprocVecEnv(fns, envs_per_worker=2, min_ready=3)
+    try:
+        assert np.array_equal(venv.reset(), [env.reset() for env in envs])
+        expected = {}
+        for _ in range(50):
+            actions = np.random.randint(0, 100, size=len(venv.ready_ids))
+            for i, action in zip(venv.ready_ids, actions):
+                ob, rew, done, _ = envs[i].step(action)
+                expected[i] = (envs[i].reset() if done else ob, rew, done)
+            obs, rews, dones, _ = venv.step(actions)
+            assert len(obs) == 4  # min_ready rounded up to whole workers
+            for i, ob, rew, done in zip(venv.ready_ids, obs, rews, dones):
+                assert np.array_equal(ob, expected[i][0]) and rew == expected[i][1] and done == expected[i][2]
+    finally:
+        venv.close()
+
+
+def test_vec_frame_stack():
+    """
+    Stacks the frames as rolling the stack by one frame, i.e. by the 2 channels of an
+    observation, per step would.
+    """
+    nstack = 3
+    fns = [lambda seed=seed: SimpleEnv(seed, (2, 3, 2), np.uint8) for seed in range(4)]
+    venv = VecFrameStack(DummyVecEnv(fns), nstack)
+    try:
+        obs = venv.reset()
+        expected = np.zeros_like(obs)
+        expected[..., -2:] = DummyVecEnv(fns).reset()
+        assert np.array_equal(obs, expected)
+        for _ in range(50):
+            prev_obs, prev_expected = obs, expected
+            obs, _, dones, _ = venv.step(np.random.randint(0, 100, size=4))
+            expected = np.roll(expected, shift=-2, axis=-1)
+            expected[dones] = 0
+            expected[..., -2:] = obs[..., -2:]
+            assert np.array_equal(obs, expected)
+            assert np.array_equal(prev_obs, prev_expected)
+    finally:
+        venv.close()
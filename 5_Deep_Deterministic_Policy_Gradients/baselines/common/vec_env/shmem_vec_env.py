@@ -0,0 +1,187 @@
+import ctypes
+from collections import OrderedDict
+from multiprocessing import Process, Pipe, RawArray
+
+import numpy as np
+from gym import spaces
+
+from baselines.common.vec_env import VecEnv, CloudpickleWrapper
+from baselines.common.tile_images import tile_images
+
+# Observations, rewards and dones are written by the workers straight into shared
+# arrays; the pipes carry only the commands and the infos.
+# There are two generations of buffers, used in turn by successive steps/resets, so
+# that the arrays returned by one step stay valid through the next one (e.g. while
+# (obs, new_obs) is stored) and are only overwritten by the step after that.
+NUM_GENERATIONS = 2
+
+
+def obs_space_info(obs_space):
+    """
+    Returns the keys, shapes and dtypes of the parts of an observation;
+    a non-Dict space has a single part with key None.
+    """
+    if isinstance(obs_space, spaces.Dict):
+        assert isinstance(obs_space.spaces, OrderedDict)
+        subspaces = obs_space.spaces
+    else:
+        subspaces = {None: obs_space}
+    keys = list(subspaces.keys())
+    shapes = {key: subspaces[key].shape for key in keys}
+    dtypes = {key: np.dtype(subspaces[key].dtype) for key in keys}
+    return keys, shapes, dtypes
+
+
+def shared_array(shape, dtype):
+    return RawArray(ctypes.c_byte, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+
+
+def as_array(raw, shape, dtype):
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+class SharedBuffers(object):
+    """
+    Views of NUM_GENERATIONS x (obs, rews, dones) shared arrays for num_envs envs.
+    """
+    def __init__(self, raws, num_envs, keys, shapes, dtypes):
+        self.raws = raws
+        self.keys = keys
+        obs_raws, rews_raws, dones_raws = raws
+        self.obs = [{key: as_array(raw[key], (num_envs,) + shapes[key], dtypes[key]) for key in keys}
+                    for raw in obs_raws]
+        self.rews = [as_array(raw, (num_envs,), np.float32) for raw in rews_raws]
+        self.dones = [as_array(raw, (num_envs,), np.bool_) for raw in dones_raws]
+
+    @classmethod
+    def allocate(cls, num_envs, keys, shapes, dtypes):
+        raws = ([{key: shared_array((num_envs,) + shapes[key], dtypes[key]) for key in keys}
+                 for _ in range(NUM_GENERATIONS)],
+                [shared_array((num_envs,), np.float32) for _ in range(NUM_GENERATIONS)],
+                [shared_array((num_envs,), np.bool_) for _ in range(NUM_GENERATIONS)])
+        return cls(raws, num_envs, keys, shapes, dtypes)
+
+    def write_obs(self, generation, index, ob):
+        for key in self.keys:
+            self.obs[generation][key][index] = ob if key is None else ob[key]
+
+    def read_obs(self, generation):
+        if self.keys == [None]:
+            return self.obs[generation][None]
+        return OrderedDict((key, self.obs[generation][key]) for key in self.keys)
+
+
+def worker(remote, parent_remote, env_fn_wrapper, index, raws, num_envs, keys, shapes, dtypes):
+    parent_remote.close()
+    env = env_fn_wrapper.x()
+    bufs = SharedBuffers(raws, num_envs, keys, shapes, dtypes)
+    while True:
+        cmd, data = remote.recv()
+        if cmd == 'step':
+            generation, action = data
+            ob, reward, done, info = env.step(action)
+            if done:
+                ob = env.reset()
+            bufs.write_obs(generation, index, ob)
+            bufs.rews[generation][index] = reward
+            bufs.dones[generation][index] = done
+            remote.send(info)
+        elif cmd == 'reset':
+            bufs.write_obs(data, index, env.reset())
+            remote.send(None)
+        elif cmd == 'render':
+            remote.send(env.render(mode='rgb_array'))
+        elif cmd == 'close':
+            remote.close()
+            break
+        else:
+            raise NotImplementedError
+
+
+class ShmemVecEnv(VecEnv):
+    def __init__(self, env_fns, spaces=None):
+        """
+        SubprocVecEnv that moves observations, rewards and dones through shared memory
+        instead of pickling them through the pipes.
+
+        envs: list of gym environments to run in subprocesses
+        spaces: (observation_space, action_space) of the envs; if not given, one env
+            is created in this process to read them
+
+        The arrays returned by step() and reset() are views into the shared buffers.
+        They stay valid through the next step() and are overwritten by the one after,
+        so copy them to keep them longer.
+        """
+        self.waiting = False
+        self.closed = False
+        nenvs = len(env_fns)
+        if spaces is None:
+            env = env_fns[0]()
+            spaces = env.observation_space, env.action_space
+            env.close()
+        observation_space, action_space = spaces
+        VecEnv.__init__(self, nenvs, observation_space, action_space)
+
+        keys, shapes, dtypes = obs_space_info(observation_space)
+        self.bufs = SharedBuffers.allocate(nenvs, keys, shapes, dtypes)
+        self.generation = 0
+
+        self.remotes, self.work_remotes = zip(*[Pipe() for _ in range(nenvs)])
+        self.ps = [Process(target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fn), index,
+                                                self.bufs.raws, nenvs, keys, shapes, dtypes))
+            for index, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns))]
+        for p in self.ps:
+            p.daemon = True # if the main process crashes, we should not cause things to hang
+            p.start()
+        for remote in self.work_remotes:
+            remote.close()
+
+    def _next_generation(self):
+        self.generation = (self.generation + 1) % NUM_GENERATIONS
+        return self.generation
+
+    def step_async(self, actions):
+        generation = self._next_generation()
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', (generation, action)))
+        self.waiting = True
+
+    def step_wait(self):
+        infos = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        return (self.bufs.read_obs(self.generation), self.bufs.rews[self.generation],
+                self.bufs.dones[self.generation], infos)
+
+    def reset(self):
+        generation = self._next_generation()
+        for remote in self.remotes:
+            remote.send(('reset', generation))
+        for remote in self.remotes:
+            remote.recv()
+        return self.bufs.read_obs(generation)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for p in self.ps:
+            p.join()
+        self.closed = True
+
+    def render(self, mode='human'):
+        for pipe in self.remotes:
+            pipe.send(('render', None))
+        imgs = [pipe.recv() for pipe in self.remotes]
+        bigimg = tile_images(imgs)
+        if mode == 'human':
+            import cv2
+            cv2.imshow('vecenv', bigimg[:,:,::-1])
+            cv2.waitKey(1)
+        elif mode == 'rgb_array':
+            return bigimg
+        else:
+            raise NotImplementedError
@@ -1,42 +1,51 @@
 import numpy as np
 from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
 from baselines.common.vec_env import VecEnv, CloudpickleWrapper
 from baselines.common.tile_images import tile_images
 
 
 def worker(remote, parent_remote, env_fn_wrapper):
     parent_remote.close()
-    env = env_fn_wrapper.x()
+    envs = [env_fn() for env_fn in env_fn_wrapper.x]
+
+    def step(env, action):
+        ob, reward, done, info = env.step(action)
+        if done:
+            ob = env.reset()
+        return ob, reward, done, info
+
     while True:
         cmd, data = remote.recv()
         if cmd == 'step':
-            ob, reward, done, info = env.step(data)
-            if done:
-                ob = env.reset()
-            remote.send((ob, reward, done, info))
+            remote.send([step(env, action) for env, action in zip(envs, data)])
         elif cmd == 'reset':
-            ob = env.reset()
-            remote.send(ob)
+            remote.send([env.reset() for env in envs])
         elif cmd == 'render':
-            remote.send(env.render(mode='rgb_array'))
+            remote.send([env.render(mode='rgb_array') for env in envs])
         elif cmd == 'close':
             remote.close()
             break
         elif cmd == 'get_spaces':
-            remote.send((env.observation_space, env.action_space))
+            remote.send((envs[0].observation_space, envs[0].action_space))
         else:
             raise NotImplementedError
 
 
 class SubprocVecEnv(VecEnv):
-    def __init__(self, env_fns, spaces=None):
+    def __init__(self, env_fns, spaces=None, envs_per_worker=1):
         """
         envs: list of gym environments to run in subprocesses
+        envs_per_worker: number of envs run one after the other in each subprocess, so that
+            cheap envs are stepped with one message per worker instead of one per env
         """
         self.waiting = False
         self.closed = False
         nenvs = len(env_fns)
-        self.remotes, self.work_remotes = zip(*[Pipe() for _ in range(nenvs)])
+        assert nenvs % envs_per_worker == 0, "number of envs must be a multiple of envs_per_worker"
+        self.envs_per_worker = envs_per_worker
+        env_fns = [env_fns[i:i + envs_per_worker] for i in range(0, nenvs, envs_per_worker)]
+        self.remotes, self.work_remotes = zip(*[Pipe() for _ in range(len(env_fns))])
         self.ps = [Process(target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)))
             for (work_remote, remote, env_fn) in zip(self.work_remotes, self.remotes, env_fns)]
         for p in self.ps:
@@ -47,15 +56,18 @@ class SubprocVecEnv(VecEnv):
 
         self.remotes[0].send(('get_spaces', None))
         observation_space, action_space = self.remotes[0].recv()
-        VecEnv.__init__(self, len(env_fns), observation_space, action_space)
+        VecEnv.__init__(self, nenvs, observation_space, action_space)
+
+    def _worker_actions(self, actions):
+        return [actions[i:i + self.envs_per_worker] for i in range(0, len(actions), self.envs_per_worker)]
 
     def step_async(self, actions):
-        for remote, action in zip(self.remotes, actions):
+        for remote, action in zip(self.remotes, self._worker_actions(actions)):
             remote.send(('step', action))
         self.waiting = True
 
     def step_wait(self):
-        results = [remote.recv() for remote in self.remotes]
+        results = [result for remote in self.remotes for result in remote.recv()]
         self.waiting = False
         obs, rews, dones, infos = zip(*results)
         return np.stack(obs), np.stack(rews), np.stack(dones), infos
@@ -63,7 +75,7 @@ class SubprocVecEnv(VecEnv):
     def reset(self):
         for remote in self.remotes:
             remote.send(('reset', None))
-        return np.stack([remote.recv() for remote in self.remotes])
+        return np.stack([ob for remote in self.remotes for ob in remote.recv()])
 
     def reset_task(self):
         for remote in self.remotes:
@@ -85,7 +97,7 @@ class SubprocVecEnv(VecEnv):
     def render(self, mode='human'):
         for pipe in self.remotes:
             pipe.send(('render', None))
-        imgs = [pipe.recv() for pipe in self.remotes]
+        imgs = [img for pipe in self.remotes for img in pipe.recv()]
         bigimg = tile_images(imgs)
         if mode == 'human':
             import cv2
@@ -94,4 +106,74 @@ class SubprocVecEnv(VecEnv):
         elif mode == 'rgb_array':
             return bigimg
         else:
-            raise NotImplementedError
\ No newline at end of file
+            raise NotImplementedError
+
+class AsyncSubprocVecEnv(SubprocVecEnv):
+    def __init__(self, env_fns, spaces=None, envs_per_worker=1, min_ready=None):
+        """
+        SubprocVecEnv whose step_wait() returns as soon as min_ready of the envs have stepped,
+        instead of waiting for the slowest one. The others keep stepping and are returned by
+        later calls.
+
+        envs: list of gym environments to run in subprocesses
+        envs_per_worker: number of envs run one after the other in each subprocess; envs are
+            returned a worker at a time, so min_ready is rounded up to a multiple of it
+        min_ready: number of envs to wait for in step_wait(), all of them by default
+
+        After reset() and step_wait(), ready_ids holds the indices of the envs whose results
+        were returned, in increasing order. The actions passed to the next
+        step_async() are for these envs, in the same order:
+
+            obs = venv.reset()
+            while True:
+                obs, rews, dones, infos = venv.step(policy(obs))
+                ids = venv.ready_ids
+        """
+        SubprocVecEnv.__init__(self, env_fns, spaces, envs_per_worker)
+        self.min_ready = min_ready or self.num_envs
+        self.ready_workers = list(range(len(self.remotes)))
+        self.pending_workers = []
+
+    @property
+    def ready_ids(self):
+        return np.array([w * self.envs_per_worker + i
+                         for w in self.ready_workers for i in range(self.envs_per_worker)])
+
+    def step_async(self, actions):
+        assert len(actions) == len(self.ready_workers) * self.envs_per_worker
+        for w, action in zip(self.ready_workers, self._worker_actions(actions)):
+            self.remotes[w].send(('step', action))
+        self.pending_workers += self.ready_workers
+        self.ready_workers = []
+        self.waiting = True
+
+    def step_wait(self):
+        pending = dict((self.remotes[w], w) for w in self.pending_workers)
+        ready = []
+        while len(ready) * self.envs_per_worker < self.min_ready:
+            for remote in wait(list(pending)):
+                if len(ready) * self.envs_per_worker < self.min_ready:
+                    ready.append(pending.pop(remote))
+        ready.sort()
+        results = [result for w in ready for result in self.remotes[w].recv()]
+        self.ready_workers = ready
+        self.pending_workers = list(pending.values())
+        self.waiting = bool(self.pending_workers)
+        obs, rews, dones, infos = zip(*results)
+        return np.stack(obs), np.stack(rews), np.stack(dones), infos
+
+    def _drain(self):
+        for w in self.pending_workers:
+            self.remotes[w].recv()
+        self.pending_workers = []
+        self.waiting = False
+
+    def reset(self):
+        self._drain()
+        self.ready_workers = list(range(len(self.remotes)))
+        return SubprocVecEnv.reset(self)
+
+    def close(self):
+        if not self.closed:
+            self._drain()
+        SubprocVecEnv.close(self)
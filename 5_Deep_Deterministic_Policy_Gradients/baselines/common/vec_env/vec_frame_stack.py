@@ -4,7 +4,18 @@ from gym import spaces
 
 class VecFrameStack(VecEnvWrapper):
     """
-    Vectorized environment base class
+    Stacks the last nstack observations of each env along the last axis.
+
+    The frames are kept in a ring of nstack slots: a step writes the new frame into
+    the slot of the oldest one and moves the head, and the stack is only assembled,
+    oldest frame first, by stacked_obs(). step_wait() and reset() assemble it into
+    one of two buffers in turn, so the observations they return stay valid through
+    the next step and are overwritten by the one after.
+
+    Each step drops the oldest whole frame, i.e. the stack moves by the c channels of
+    an observation. The np.roll stacking this replaced moved it by one channel only,
+    which gives the same stacks for single-channel frames, but mixed the channels of
+    different frames for multi-channel (c > 1) ones.
     """
     def __init__(self, venv, nstack):
         self.venv = venv
@@ -12,27 +23,45 @@ class VecFrameStack(VecEnvWrapper):
         wos = venv.observation_space # wrapped ob space
         low = np.repeat(wos.low, self.nstack, axis=-1)
         high = np.repeat(wos.high, self.nstack, axis=-1)
-        self.stackedobs = np.zeros((venv.num_envs,)+low.shape, low.dtype)
+        self.frames = np.zeros((nstack, venv.num_envs) + wos.shape, wos.dtype)
+        self.head = 0 # slot of the oldest frame
+        self.buffers = [np.zeros((venv.num_envs,)+low.shape, low.dtype) for _ in range(2)]
+        self.stackedobs = self.buffers[0]
         observation_space = spaces.Box(low=low, high=high, dtype=venv.observation_space.dtype)
         VecEnvWrapper.__init__(self, venv, observation_space=observation_space)
 
+    def stacked_obs(self, out=None):
+        """
+        Writes the stacked observations into out, e.g. a preallocated feed buffer,
+        and returns it.
+        """
+        if out is None:
+            out = np.empty_like(self.stackedobs)
+        assert out.flags.c_contiguous
+        out_frames = out.reshape(out.shape[:-1] + (self.nstack, -1))
+        for k in range(self.nstack):
+            out_frames[..., k, :] = self.frames[(self.head + k) % self.nstack]
+        return out
+
+    def _next_stackedobs(self):
+        self.stackedobs = self.buffers[1] if self.stackedobs is self.buffers[0] else self.buffers[0]
+        return self.stacked_obs(self.stackedobs)
+
     def step_wait(self):
         obs, rews, news, infos = self.venv.step_wait()
-        self.stackedobs = np.roll(self.stackedobs, shift=-1, axis=-1)
-        for (i, new) in enumerate(news):
-            if new:
-                self.stackedobs[i] = 0
-        self.stackedobs[..., -obs.shape[-1]:] = obs
-        return self.stackedobs, rews, news, infos
+        self.frames[:, np.asarray(news, dtype=bool)] = 0
+        self.frames[self.head] = obs
+        self.head = (self.head + 1) % self.nstack
+        return self._next_stackedobs(), rews, news, infos
 
     def reset(self):
         """
         Reset all environments
         """
         obs = self.venv.reset()
-        self.stackedobs[...] = 0
-        self.stackedobs[..., -obs.shape[-1]:] = obs
-        return self.stackedobs
+        self.frames[...] = 0
+        self.frames[self.head - 1] = obs
+        return self._next_stackedobs()
 
     def close(self):
         self.venv.close()
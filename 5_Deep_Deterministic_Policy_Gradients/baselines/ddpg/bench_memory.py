@@ -0,0 +1,75 @@
+"""Sampling cost and memory of the DDPG replay Memory.
+
+Fills a Memory with episodes of num_envs parallel envs whose observations
+are Prosthetics-sized state vectors, appended one vector step at a time,
+then times sample() and append_batch(). The memories are float32, float16
+observations, deduplicated next observations, and both.
+
+Peak RSS only grows, so to read the footprint of one memory run one per
+process:
+
+    python -m baselines.ddpg.bench_memory --limit 1000000 --memories float16
+"""
+import argparse
+import resource
+import time
+
+import numpy as np
+
+from baselines.ddpg.memory import Memory
+
+MEMORIES = {
+    'float32': dict(),
+    'float16': dict(observation_dtype='float16'),
+    'dedup': dict(dedup_next_observations=True),
+    'float16+dedup': dict(observation_dtype='float16', dedup_next_observations=True),
+}
+
+
+def fill(memory, limit, num_envs, obs_shape, action_shape, episode_length=1000):
+    obs = np.random.randn(num_envs, *obs_shape)
+    actions = np.random.uniform(-1, 1, size=(num_envs,) + action_shape)
+    rewards = np.random.randn(num_envs)
+    for i in range(limit // num_envs):
+        new_obs = obs + 0.01
+        dones = np.full(num_envs, i % episode_length == episode_length - 1)
+        memory.append_batch(obs, actions, rewards, new_obs, dones)
+        obs = np.random.randn(num_envs, *obs_shape) if dones[0] else new_obs
+    return obs, actions, rewards
+
+
+def time_fn(fn, iters):
+    start = time.time()
+    for _ in range(iters):
+        fn()
+    return (time.time() - start) / iters
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--limit', type=int, default=100000)
+    parser.add_argument('--obs_shape', default='158')
+    parser.add_argument('--action_shape', default='19')
+    parser.add_argument('--num_envs', type=int, default=8)
+    parser.add_argument('--batch_size', type=int, default=64)
+    parser.add_argument('--iters', type=int, default=1000)
+    parser.add_argument('--memories', default=','.join(MEMORIES))
+    args = parser.parse_args()
+    obs_shape = tuple(int(d) for d in args.obs_shape.split(','))
+    action_shape = tuple(int(d) for d in args.action_shape.split(','))
+
+    print('%-14s %14s %16s %14s %14s' % ('memory', 'sample', 'samples/sec', 'append_batch', 'peak RSS'))
+    for name in args.memories.split(','):
+        memory = Memory(args.limit, action_shape, obs_shape, **MEMORIES[name])
+        obs, actions, rewards = fill(memory, args.limit, args.num_envs, obs_shape, action_shape)
+        sample_time = time_fn(lambda: memory.sample(args.batch_size), args.iters)
+        dones = np.zeros(args.num_envs, dtype=bool)
+        append_time = time_fn(lambda: memory.append_batch(obs, actions, rewards, obs, dones), args.iters)
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2. ** 20
+        print('%-14s %11.1f us %16.0f %11.1f us %11.2f GB' % (name, sample_time * 1e6, args.batch_size / sample_time,
+                                                            append_time * 1e6, peak_rss))
+        del memory
+
+
+if __name__ == '__main__':
+    main()
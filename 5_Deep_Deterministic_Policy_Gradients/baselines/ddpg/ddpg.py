@@ -1,4 +1,4 @@
-from copy import copy
+from copy import copy, deepcopy
 from functools import reduce
 
 import numpy as np
@@ -99,6 +99,8 @@ class DDPG(object):
         self.batch_size = batch_size
         self.stats_sample = None
         self.critic_l2_reg = critic_l2_reg
+        self.observation_shape = observation_shape
+        self.env_action_noises = None
 
         # Observation normalization.
         if self.normalize_observations:
@@ -256,31 +258,55 @@ class DDPG(object):
         self.stats_names = names
 
     def pi(self, obs, apply_noise=True, compute_Q=True):
+        """
+        Action (and Q) for one observation, or, for a batch of observations from parallel envs,
+        the batch of actions (and Qs) computed in one run. Each env of a batch gets its own copy
+        of the action noise process.
+        """
         if self.param_noise is not None and apply_noise:
             actor_tf = self.perturbed_actor_tf
         else:
             actor_tf = self.actor_tf
-        feed_dict = {self.obs0: [obs]}
+        batch = np.ndim(obs) > len(self.observation_shape)
+        feed_dict = {self.obs0: obs if batch else [obs]}
         #print(actor_tf)
         if compute_Q:
             action, q = self.sess.run([actor_tf, self.critic_with_actor_tf], feed_dict=feed_dict)
         else:
             action = self.sess.run(actor_tf, feed_dict=feed_dict)
             q = None
-        action = action.flatten()
+        if not batch:
+            action = action.flatten()
         if self.action_noise is not None and apply_noise:
-            noise = self.action_noise()
+            if batch:
+                noise = np.stack([action_noise() for action_noise in self.get_env_action_noises(len(action))])
+            else:
+                noise = self.action_noise()
             assert noise.shape == action.shape
             action += noise
         action = np.clip(action, self.action_range[0], self.action_range[1])
         return action, q
 
+    def get_env_action_noises(self, nenvs):
+        if self.env_action_noises is None or len(self.env_action_noises) != nenvs:
+            self.env_action_noises = [deepcopy(self.action_noise) for _ in range(nenvs)]
+            for action_noise in self.env_action_noises:
+                action_noise.reset()
+        return self.env_action_noises
+
     def store_transition(self, obs0, action, reward, obs1, terminal1):
         reward *= self.reward_scale
         self.memory.append(obs0, action, reward, obs1, terminal1)
         if self.normalize_observations:
             self.obs_rms.update(np.array([obs0]))
 
+    def store_transition_batch(self, obs0, action, reward, obs1, terminal1):
+        """Stores one transition per row, e.g. one step of each of parallel envs."""
+        reward = np.asarray(reward) * self.reward_scale
+        self.memory.append_batch(obs0, action, reward, obs1, terminal1)
+        if self.normalize_observations:
+            self.obs_rms.update(np.asarray(obs0))
+
     def train(self):
         # Get a batch.
         batch = self.memory.sample(batch_size=self.batch_size)
@@ -372,10 +398,15 @@ class DDPG(object):
         self.param_noise.adapt(mean_distance)
         return mean_distance
 
-    def reset(self):
-        # Reset internal state after an episode is complete.
+    def reset(self, env_index=None):
+        # Reset internal state after an episode is complete; with env_index, the episode of
+        # that env of the batches passed to pi.
         if self.action_noise is not None:
-            self.action_noise.reset()
+            if env_index is None:
+                for action_noise in [self.action_noise] + (self.env_action_noises or []):
+                    action_noise.reset()
+            elif self.env_action_noises is not None:
+                self.env_action_noises[env_index].reset()
         if self.param_noise is not None:
             self.sess.run(self.perturb_policy_ops, feed_dict={
                 self.param_noise_stddev: self.param_noise.current_stddev,
@@ -1,12 +1,22 @@
+import json
+import os
+import pickle
+import uuid
+
 import numpy as np
 
+# Version of the checkpoint layout written by Memory.save.
+CHECKPOINT_VERSION = 2
+
 
 class RingBuffer(object):
     def __init__(self, maxlen, shape, dtype='float32'):
         self.maxlen = maxlen
         self.start = 0
         self.length = 0
-        self.data = np.zeros((maxlen,) + shape).astype(dtype)
+        # Number of items ever appended; item k is at data[k % maxlen].
+        self.appended = 0
+        self.data = np.zeros((maxlen,) + shape, dtype=dtype)
 
     def __len__(self):
         return self.length
@@ -16,8 +26,12 @@ class RingBuffer(object):
             raise KeyError()
         return self.data[(self.start + idx) % self.maxlen]
 
+    def slots(self, idxs):
+        # Positions in data of the items idxs.
+        return (self.start + idxs) % self.maxlen
+
     def get_batch(self, idxs):
-        return self.data[(self.start + idxs) % self.maxlen]
+        return self.data[self.slots(idxs)]
 
     def append(self, v):
         if self.length < self.maxlen:
@@ -30,54 +44,307 @@ class RingBuffer(object):
             # This should never happen.
             raise RuntimeError()
         self.data[(self.start + self.length - 1) % self.maxlen] = v
+        self.appended += 1
+
+    def append_batch(self, vs):
+        # Only the last maxlen items can be kept; they go where sequential appends would put them.
+        n = len(vs)
+        kept = vs[-self.maxlen:]
+        idx = (self.start + self.length + n - len(kept)) % self.maxlen
+        first = min(len(kept), self.maxlen - idx)
+        self.data[idx:idx + first] = kept[:first]
+        self.data[:len(kept) - first] = kept[first:]
+        overflow = max(0, self.length + n - self.maxlen)
+        self.length = min(self.length + n, self.maxlen)
+        self.start = (self.start + overflow) % self.maxlen
+        self.appended += n
+
+    def state(self):
+        return {'start': self.start, 'length': self.length, 'appended': self.appended}
 
+    def save(self, filename):
+        """Writes data to the .npy file filename and returns the state to keep with it."""
+        with open(filename + '.tmp', 'wb') as f:
+            np.save(f, self.data)
+        os.replace(filename + '.tmp', filename)
+        return self.state()
 
-def array_min2d(x):
-    x = np.array(x)
-    if x.ndim >= 2:
-        return x
-    return x.reshape(-1, 1)
+    def slots_since(self, since):
+        """
+        Slots written since since items had been appended, or None if all of data may have
+        changed since then.
+        """
+        if not 0 <= self.appended - since < self.maxlen:
+            return None
+        return np.arange(since, self.appended) % self.maxlen
+
+    @staticmethod
+    def write_slots(filename, slots, values):
+        """Writes values into the given slots of the data saved in filename, in place."""
+        data = np.lib.format.open_memmap(filename, mode='r+')
+        data[slots] = values
+        data.flush()
+
+    def load(self, filename, state, in_memory=False):
+        """
+        Restores the buffer saved in filename with the given state. The data is memory-mapped
+        copy-on-write, so it is read lazily and never written back; in_memory copies it into RAM.
+        """
+        data = np.load(filename, mmap_mode='c')
+        if data.dtype != self.data.dtype or data.shape != self.data.shape:
+            raise ValueError('%s holds %s %s, expected %s %s' % (filename, data.shape, data.dtype,
+                                                                self.data.shape, self.data.dtype))
+        self.data = np.array(data) if in_memory else data
+        self.start, self.length, self.appended = state['start'], state['length'], state['appended']
 
 
 class Memory(object):
-    def __init__(self, limit, action_shape, observation_shape):
+    def __init__(self, limit, action_shape, observation_shape, observation_dtype='float32',
+                 dedup_next_observations=False):
+        """
+        Replay memory of (obs0, action, reward, obs1, terminal1) transitions. Each transition is
+        one record of a single ring buffer, so a batch is sampled with one gather.
+
+        observation_dtype: dtype the observations are stored and sampled in, e.g. float16 to
+            halve the memory of large state vectors
+        dedup_next_observations: if True, obs1 is not stored when it is the obs0 of the next
+            transition of the same env (the next append, or the same row of the next
+            append_batch); the record holds the index of that transition instead
+        """
         self.limit = limit
+        self.action_shape = tuple(action_shape)
+        self.observation_shape = tuple(observation_shape)
+        self.observation_dtype = np.dtype(observation_dtype)
+        self.dedup_next_observations = dedup_next_observations
+
+        fields = [('obs0', observation_dtype, observation_shape),
+                  ('actions', 'float32', action_shape),
+                  ('rewards', 'float32', (1,)),
+                  ('terminals1', 'float32', (1,))]
+        if dedup_next_observations:
+            # Slot whose obs0 is obs1, or -1 if obs1 is kept in next_observations.
+            fields.append(('next', 'int64'))
+            self.next_observations = {}
+            self.last_slots = np.zeros(0, dtype=np.int64)
+            self.last_obs1 = None
+        else:
+            fields.append(('obs1', observation_dtype, observation_shape))
+        self.transitions = RingBuffer(limit, shape=(), dtype=np.dtype(fields))
+        # Identifies the transitions of this memory across its checkpoints: save only adds to a
+        # checkpoint of the same lineage, written when it had saved_appended transitions.
+        self.lineage = uuid.uuid4().hex
+        self.saved_appended = None
 
-        self.observations0 = RingBuffer(limit, shape=observation_shape)
-        self.actions = RingBuffer(limit, shape=action_shape)
-        self.rewards = RingBuffer(limit, shape=(1,))
-        self.terminals1 = RingBuffer(limit, shape=(1,))
-        self.observations1 = RingBuffer(limit, shape=observation_shape)
+    def __setstate__(self, state):
+        if 'observations0' in state:
+            raise ValueError('pickled Memory of the old layout with one RingBuffer per field: convert it to a '
+                             'checkpoint with baselines.ddpg.memory.import_legacy_pickle')
+        self.__dict__.update(state)
 
     def sample(self, batch_size):
-        # Draw such that we always have a proceeding element.
-        batch_idxs = np.random.random_integers(self.nb_entries - 2, size=batch_size)
-
-        obs0_batch = self.observations0.get_batch(batch_idxs)
-        obs1_batch = self.observations1.get_batch(batch_idxs)
-        action_batch = self.actions.get_batch(batch_idxs)
-        reward_batch = self.rewards.get_batch(batch_idxs)
-        terminal1_batch = self.terminals1.get_batch(batch_idxs)
-
-        result = {
-            'obs0': array_min2d(obs0_batch),
-            'obs1': array_min2d(obs1_batch),
-            'rewards': array_min2d(reward_batch),
-            'actions': array_min2d(action_batch),
-            'terminals1': array_min2d(terminal1_batch),
-        }
+        slots = self.transitions.slots(np.random.randint(self.nb_entries, size=batch_size))
+        batch = np.take(self.transitions.data, slots)
+
+        result = {key: batch[key] for key in ['obs0', 'actions', 'rewards', 'terminals1']}
+        if self.dedup_next_observations:
+            result['obs1'] = self._get_next_observations(slots, batch['next'])
+        else:
+            result['obs1'] = batch['obs1']
         return result
 
+    def _get_next_observations(self, slots, next_slots):
+        obs1 = np.take(self.transitions.data, next_slots)['obs0']
+        for i in np.flatnonzero(next_slots < 0):
+            obs1[i] = self.next_observations[slots[i]]
+        return obs1
+
     def append(self, obs0, action, reward, obs1, terminal1, training=True):
+        self.append_batch([obs0], [action], [reward], [obs1], [terminal1], training=training)
+
+    def append_batch(self, obs0, action, reward, obs1, terminal1, training=True):
+        """Appends one transition per row of the arguments, e.g. one step of each of parallel envs."""
         if not training:
             return
-        
-        self.observations0.append(obs0)
-        self.actions.append(action)
-        self.rewards.append(reward)
-        self.observations1.append(obs1)
-        self.terminals1.append(terminal1)
+
+        data = self.transitions.data
+        n = len(obs0)
+        records = np.empty(n, dtype=data.dtype)
+        for key, v in [('obs0', obs0), ('actions', action), ('rewards', reward), ('terminals1', terminal1)]:
+            records[key] = np.reshape(v, records[key].shape)
+        if not self.dedup_next_observations:
+            records['obs1'] = np.reshape(obs1, records['obs1'].shape)
+            self.transitions.append_batch(records)
+            return
+
+        slots = self.transitions.slots(self.transitions.length + np.arange(n))
+        obs1 = np.reshape(obs1, records['obs0'].shape).astype(data['obs0'].dtype)
+        # Link the transitions of the previous append whose obs1 is this obs0.
+        if len(self.last_slots) == n:
+            linked = np.all((self.last_obs1 == records['obs0']).reshape(n, -1), axis=1)
+            data['next'][self.last_slots[linked]] = slots[linked]
+            for slot in self.last_slots[linked]:
+                del self.next_observations[slot]
+        records['next'] = -1
+        self.transitions.append_batch(records)
+        for slot, ob in zip(slots[-self.limit:], obs1[-self.limit:]):
+            self.next_observations[slot] = ob
+        self.last_slots, self.last_obs1 = slots[-self.limit:], obs1[-self.limit:]
+
+    def save(self, path, incremental=False):
+        """
+        Checkpoints the memory to the directory path: the transitions as one .npy file, and a
+        JSON header with the layout, the ring buffer state and the names of the data files. New
+        data files get new names and the header is replaced last, so an interrupted save leaves
+        the previous checkpoint in path. With incremental, if path holds the checkpoint this
+        memory saved or loaded last, only the transitions appended since are added to its .npy
+        file. They are first written to a journal with the new header, which load replays if the
+        save was interrupted while updating the file.
+        """
+        os.makedirs(path, exist_ok=True)
+        prev_header = _replay_journal(path)
+        header = self._header()
+        since = None
+        if (incremental and prev_header is not None and prev_header.get('lineage') == self.lineage
+                and prev_header['transitions']['appended'] == self.saved_appended
+                and all(prev_header[key] == value for key, value in header.items())):
+            # With dedup, the records of the last append get linked by the next one.
+            since = prev_header['transitions']['appended'] - prev_header['pending']
+        slots = None if since is None else self.transitions.slots_since(since)
+
+        token = uuid.uuid4().hex[:8]
+        header['pending'] = len(self.last_slots) if self.dedup_next_observations else 0
+        if self.dedup_next_observations:
+            header['next_observations_file'] = 'next_observations-%s.npz' % token
+            slots_obs = np.array(list(self.next_observations.keys()), dtype=np.int64)
+            obs = np.array(list(self.next_observations.values()), dtype=self.observation_dtype)
+            last_obs1 = self.last_obs1 if self.last_obs1 is not None else obs[:0]
+            with open(os.path.join(path, header['next_observations_file']), 'wb') as f:
+                np.savez(f, slots=slots_obs, obs=obs.reshape((-1,) + self.observation_shape),
+                         last_slots=self.last_slots, last_obs1=last_obs1, appended=self.transitions.appended)
+        if slots is None:
+            header['transitions_file'] = 'transitions-%s.npy' % token
+            header['transitions'] = self.transitions.save(os.path.join(path, header['transitions_file']))
+        else:
+            header['transitions_file'] = prev_header['transitions_file']
+            header['transitions'] = self.transitions.state()
+            journal_file = os.path.join(path, 'journal.npz')
+            with open(journal_file + '.tmp', 'wb') as f:
+                np.savez(f, slots=slots, records=self.transitions.data[slots],
+                         base=json.dumps(prev_header), header=json.dumps(header))
+            os.replace(journal_file + '.tmp', journal_file)
+            RingBuffer.write_slots(os.path.join(path, header['transitions_file']), slots,
+                                   self.transitions.data[slots])
+        _write_header(path, header)
+        self.saved_appended = self.transitions.appended
+        _remove_stale_files(path, header)
+
+    @classmethod
+    def load(cls, path, in_memory=False):
+        """
+        Loads a memory saved with save. The transitions are memory-mapped and read lazily,
+        unless in_memory.
+        """
+        header = _replay_journal(path)
+        if header is None:
+            raise ValueError('%s holds no checkpoint' % path)
+        if header.get('version') != CHECKPOINT_VERSION:
+            raise ValueError('%s is a version %s checkpoint, expected version %d' % (
+                path, header.get('version'), CHECKPOINT_VERSION))
+        memory = cls(header['limit'], header['action_shape'], header['observation_shape'],
+                     observation_dtype=header['observation_dtype'],
+                     dedup_next_observations=header['dedup_next_observations'])
+        memory.transitions.load(os.path.join(path, header['transitions_file']), header['transitions'], in_memory)
+        if memory.dedup_next_observations:
+            with np.load(os.path.join(path, header['next_observations_file'])) as f:
+                if f['appended'] != header['transitions']['appended']:
+                    raise ValueError('%s/%s does not match the header' % (path, header['next_observations_file']))
+                memory.next_observations = dict(zip(f['slots'].tolist(), f['obs']))
+                memory.last_slots, memory.last_obs1 = f['last_slots'], f['last_obs1']
+        memory.lineage = header['lineage']
+        memory.saved_appended = header['transitions']['appended']
+        return memory
+
+    def _header(self):
+        return {
+            'version': CHECKPOINT_VERSION,
+            'lineage': self.lineage,
+            'limit': self.limit,
+            'action_shape': list(self.action_shape),
+            'observation_shape': list(self.observation_shape),
+            'observation_dtype': self.observation_dtype.str,
+            'dedup_next_observations': self.dedup_next_observations,
+        }
 
     @property
     def nb_entries(self):
-        return len(self.observations0)
+        return len(self.transitions)
+
+
+class _LegacyObject(object):
+    pass
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """Reads the Memory and RingBuffer objects of old pickles as plain attribute holders."""
+    def find_class(self, module, name):
+        if module == __name__ and name in ('Memory', 'RingBuffer'):
+            return _LegacyObject
+        return super(_LegacyUnpickler, self).find_class(module, name)
+
+
+def import_legacy_pickle(filename, path, **kwargs):
+    """
+    Converts a pickled Memory of the old layout, with one RingBuffer per field, into a checkpoint
+    in the directory path, which Memory.load reads, and returns the memory. kwargs are passed on
+    to Memory, e.g. observation_dtype or dedup_next_observations.
+    """
+    with open(filename, 'rb') as f:
+        legacy = _LegacyUnpickler(f).load()
+    fields = [legacy.observations0, legacy.actions, legacy.rewards, legacy.observations1, legacy.terminals1]
+    order = (fields[0].start + np.arange(fields[0].length)) % fields[0].maxlen
+    obs0, actions, rewards, obs1, terminals1 = [field.data[order] for field in fields]
+    memory = Memory(legacy.limit, actions.shape[1:], obs0.shape[1:], **kwargs)
+    if memory.dedup_next_observations:
+        # one transition per append, so each obs1 can be linked to the next obs0
+        for transition in zip(obs0, actions, rewards, obs1, terminals1):
+            memory.append(*transition)
+    else:
+        memory.append_batch(obs0, actions, rewards, obs1, terminals1)
+    memory.save(path)
+    return memory
+
+
+def _write_header(path, header):
+    header_file = os.path.join(path, 'header.json')
+    with open(header_file + '.tmp', 'w') as f:
+        json.dump(header, f, indent=2)
+    os.replace(header_file + '.tmp', header_file)
+
+
+def _replay_journal(path):
+    """
+    Finishes the incremental save whose journal is in path, if it was interrupted, and returns
+    the header of the checkpoint in path, or None if there is none.
+    """
+    header_file = os.path.join(path, 'header.json')
+    if not os.path.exists(header_file):
+        return None
+    with open(header_file) as f:
+        header = json.load(f)
+    journal_file = os.path.join(path, 'journal.npz')
+    if os.path.exists(journal_file):
+        with np.load(journal_file) as f:
+            if json.loads(str(f['base'])) == header:
+                header = json.loads(str(f['header']))
+                RingBuffer.write_slots(os.path.join(path, header['transitions_file']), f['slots'], f['records'])
+                _write_header(path, header)
+        os.remove(journal_file)
+    return header
+
+
+def _remove_stale_files(path, header):
+    """Removes the journal and the data files of path that header does not name."""
+    keep = {'header.json', header['transitions_file'], header.get('next_observations_file')}
+    for name in os.listdir(path):
+        if name not in keep and name.startswith(('journal.npz', 'transitions-', 'next_observations-')):
+            os.remove(os.path.join(path, name))
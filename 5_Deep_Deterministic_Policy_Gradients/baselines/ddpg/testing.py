@@ -4,6 +4,7 @@ from collections import deque
 import pickle
 
 from baselines.ddpg.ddpg import DDPG
+from baselines.ddpg.memory import Memory
 import baselines.common.tf_util as U
 
 from baselines import logger
@@ -32,7 +33,8 @@ def train(env, nb_epochs, nb_epoch_cycles, render_eval, reward_scale, render, pa
     print(env.observation_space)
     #logger.info('scaling actions by {} before executing in env'.format(max_action))
     if load_memory:
-        memory=pickle.load(open("/home/vaisakhs_shaj/Desktop/BIG-DATA/memory1000000.pickle","rb"))
+        # pickles of the old Memory convert with baselines.ddpg.memory.import_legacy_pickle
+        memory=Memory.load("/home/vaisakhs_shaj/Desktop/BIG-DATA/memory1000000")
 
 
     agent = DDPG(actor, critic, memory, env.observation_space.shape, env.action_space.shape,
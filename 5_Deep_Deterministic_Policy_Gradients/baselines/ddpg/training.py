@@ -4,6 +4,7 @@ from collections import deque
 import pickle
 
 from baselines.ddpg.ddpg import DDPG
+from baselines.ddpg.memory import Memory
 import baselines.common.tf_util as U
 
 from baselines import logger
@@ -33,7 +34,8 @@ def train(env, nb_epochs, nb_epoch_cycles, render_eval, reward_scale, render, pa
 
     logger.info('scaling actions by {} before executing in env'.format(max_action))
     if load_memory:
-        memory=pickle.load(open("/home/vaisakhs_shaj/Desktop/BIG-DATA/memory1000000.pickle","rb"))
+        # pickles of the old Memory convert with baselines.ddpg.memory.import_legacy_pickle
+        memory=Memory.load("/home/vaisakhs_shaj/Desktop/BIG-DATA/memory1000000")
         
 
 
@@ -151,8 +153,7 @@ def train(env, nb_epochs, nb_epoch_cycles, render_eval, reward_scale, render, pa
                     '''
                         if memory.nb_entries >= learning_starts:
                             if memory.nb_entries % learning_starts==0:
-                                fname="/home/vaisakhs_shaj/Desktop/BIG-DATA/memory"+str(memory.nb_entries)+".pickle"
-                                pickle.dump(memory,open(fname,"wb"),protocol=-1)
+                                memory.save("/home/vaisakhs_shaj/Desktop/BIG-DATA/memory"+str(memory.nb_entries))
                                 filename="/home/vaisakhs_shaj/Desktop/MODEL/tf"+str(memory.nb_entries)+".model"
                                 saver.save(sess,filename)
                                 break
@@ -4,6 +4,7 @@ from collections import deque
 import pickle
 
 from baselines.ddpg.ddpg import DDPG
+from baselines.ddpg.memory import Memory
 import baselines.common.tf_util as U
 
 from baselines import logger
@@ -62,7 +63,7 @@ def train(env, nb_epochs, nb_epoch_cycles, render_eval, reward_scale, render, pa
 
     logger.info('scaling actions by {} before executing in env'.format(max_action))
     if load_memory:
-        memory=pickle.load(open("/home/vaisakhs_shaj/Desktop/BIG-DATA/memoryNorm300000.pickle","rb"))
+        memory=Memory.load("/home/vaisakhs_shaj/Desktop/BIG-DATA/memoryNorm300000")
         '''
         samps = memoryPrev.sample(batch_size=memoryPrev.nb_entries)
         print(len(samps['obs0'][1]))
@@ -140,9 +141,7 @@ def train(env, nb_epochs, nb_epoch_cycles, render_eval, reward_scale, render, pa
                 # Perform rollouts.
                 for t_rollout in range(nb_rollout_steps):
                     # Predict next action.
-                    action = np.stack([agent.pi(obs[i], apply_noise=True, compute_Q=False)[0] for i in range(nproc)])
-                    q = np.stack([agent.pi(obs[i], apply_noise=True, compute_Q=True)[1] for i in range(nproc)])
-                    # action, q = agent.pi(obs, apply_noise=True, compute_Q=True)
+                    action, q = agent.pi(obs, apply_noise=True, compute_Q=True)
                     #assert action.shape == env.action_space.shape
                     #print(i)
                     # Execute next action in parallel.
@@ -177,8 +176,8 @@ def train(env, nb_epochs, nb_epoch_cycles, render_eval, reward_scale, render, pa
                     # Book-keeping in parallel.
                     epoch_actions.append(np.mean(action))
                     epoch_qs.append(np.mean(q))
+                    agent.store_transition_batch(book_keeping_obs, action, r, new_obs, done)
                     for i in range(nproc):
-                        agent.store_transition(book_keeping_obs[i], action[i], r[i], new_obs[i], done[i])
                         #print(done)
                         if done[i]:
                             # Episode done.
@@ -205,7 +204,7 @@ def train(env, nb_epochs, nb_epoch_cycles, render_eval, reward_scale, render, pa
                                 episode_step3 = 0
                             '''    
 
-                            agent.reset()
+                            agent.reset(i)
                             temp = envs.reset()
                             obs[i]=temp[i]
                             
@@ -259,8 +258,8 @@ def train(env, nb_epochs, nb_epoch_cycles, render_eval, reward_scale, render, pa
                             eval_episode_reward = 0.
                 #print(episode_rewards_history) 
             if (t)%7500 == 0:
-                fname="/home/vaisakhs_shaj/Desktop/BIG-DATA/memoryNorm"+str(memory.nb_entries)+".pickle"
-                pickle.dump(memory,open(fname,"wb"),protocol=-1)
+                # Adds the transitions since the last save to the checkpoint.
+                memory.save("/home/vaisakhs_shaj/Desktop/BIG-DATA/memoryNorm", incremental=True)
             if t % 5000 == 0:
                 print("=======saving interim model==========")
                 filename="/home/vaisakhs_shaj/Desktop/MODEL/normal/tfSteps"+str(t)+".model"
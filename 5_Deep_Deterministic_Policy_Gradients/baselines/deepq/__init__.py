@@ -5,4 +5,5 @@ from baselines.deepq.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
 
 def wrap_atari_dqn(env):
     from baselines.common.atari_wrappers import wrap_deepmind
-    return wrap_deepmind(env, frame_stack=True, scale=True)
\ No newline at end of file
+    # frames stay uint8 so that the replay buffer stores them as such; ObservationInput scales them
+    return wrap_deepmind(env, frame_stack=True, scale=False)
\ No newline at end of file
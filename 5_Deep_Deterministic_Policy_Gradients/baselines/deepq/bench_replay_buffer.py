@@ -0,0 +1,84 @@
+"""Sampling cost and memory of the deepq replay buffers.
+
+Fills a ReplayBuffer and a PrioritizedReplayBuffer (with and without
+stratified sampling) with episodes of random uint8 frames and random
+priorities, then times sample() and update_priorities() at the given batch
+size. Every observation is a fresh array, as it would be from an env. With
+--frame_history_len k, observations are stacks of k frames as FrameStack
+returns them, and the buffers store one frame per transition.
+
+Peak RSS only grows, so to read the footprint of one buffer run one per
+process:
+
+    python -m baselines.deepq.bench_replay_buffer --size 1000000 --obs_shape 32,32 --buffers uniform
+    python -m baselines.deepq.bench_replay_buffer --size 100000 --obs_shape 84,84,1 --frame_history_len 4
+"""
+import argparse
+import resource
+import time
+
+import numpy as np
+
+from baselines.deepq.replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
+
+
+def fill(buffer, size, obs_shape, frame_history_len=1, episode_length=1000):
+    frames = np.random.randint(0, 256, size=(64,) + obs_shape, dtype=np.uint8)
+
+    def stack(i, episode):
+        # frames i - frame_history_len + 1 to i of the episode, those before its start repeating
+        # its first one, as FrameStack does; each episode starts from another frame
+        start = episode * episode_length
+        return np.concatenate([frames[(max(j, start) + episode) % 64]
+                               for j in range(i - frame_history_len + 1, i + 1)], axis=-1)
+
+    for i in range(size):
+        episode = i // episode_length
+        done = i % episode_length == episode_length - 1
+        buffer.add(stack(i, episode), i % 4, 1.0, stack(i + 1, episode), float(done))
+    if isinstance(buffer, PrioritizedReplayBuffer):
+        buffer.update_priorities(np.arange(size), np.random.rand(size) + 0.01)
+
+
+def time_fn(fn, iters):
+    start = time.time()
+    for _ in range(iters):
+        fn()
+    return (time.time() - start) / iters
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--obs_shape', default='84,84')
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--iters', type=int, default=1000)
+    parser.add_argument('--buffers', default='uniform,prioritized,stratified')
+    parser.add_argument('--frame_history_len', type=int, default=1)
+    args = parser.parse_args()
+    obs_shape = tuple(int(d) for d in args.obs_shape.split(','))
+
+    print('%-12s %14s %16s %14s %14s' % ('buffer', 'sample', 'samples/sec', 'update', 'peak RSS'))
+    for name in args.buffers.split(','):
+        if name == 'uniform':
+            buffer = ReplayBuffer(args.size, args.frame_history_len)
+        else:
+            buffer = PrioritizedReplayBuffer(args.size, alpha=0.6, stratified=name == 'stratified',
+                                             frame_history_len=args.frame_history_len)
+        fill(buffer, args.size, obs_shape, args.frame_history_len)
+        if name == 'uniform':
+            sample_time = time_fn(lambda: buffer.sample(args.batch_size), args.iters)
+            update = '-'
+        else:
+            sample_time = time_fn(lambda: buffer.sample(args.batch_size, beta=0.4), args.iters)
+            idxes = buffer.sample(args.batch_size, beta=0.4)[-1]
+            priorities = np.random.rand(args.batch_size) + 0.01
+            update = '%.1f us' % (time_fn(lambda: buffer.update_priorities(idxes, priorities), args.iters) * 1e6)
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2. ** 20
+        print('%-12s %11.1f us %16.0f %14s %11.2f GB' % (name, sample_time * 1e6, args.batch_size / sample_time,
+                                                         update, peak_rss))
+        del buffer
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,10 @@
 import numpy as np
-import random
 
 from baselines.common.segment_tree import SumSegmentTree, MinSegmentTree
 
 
 class ReplayBuffer(object):
-    def __init__(self, size):
+    def __init__(self, size, frame_history_len=1):
         """Create Replay buffer.
 
         Parameters
@@ -13,34 +12,119 @@ class ReplayBuffer(object):
         size: int
             Max number of transitions to store in the buffer. When the buffer
             overflows the old memories are dropped.
+        frame_history_len: int
+            Number of frames stacked along the last axis of each observation,
+            oldest first, as FrameStack does: an episode starts with its first
+            frame repeated, and each step drops the oldest frame and appends a
+            new one. The buffer then stores every frame once and rebuilds the
+            stacks on sampling. 1 for observations that are not stacked.
+
+        Observations are kept as frames in one preallocated array, typed after
+        the first transition added, so uint8 frames (e.g. LazyFrames) stay
+        uint8. Each transition stores the newest frame of its observation, and
+        the stack is rebuilt from the frames of the transitions before it in
+        the same episode. The next observation of a transition is read from
+        the one stored after it; only its newest frame is kept separately when
+        that one does not continue from it (episode ends, and the latest
+        transition).
         """
-        self._storage = []
+        self._frame_history_len = frame_history_len
+        self._frames = None
+        self._actions = None
+        self._rewards = None
+        self._dones = None
+        # number of transitions added before each one, and of distinct frames in its observation
+        self._counts = np.zeros(size, dtype=np.int64)
+        self._stack_len = np.zeros(size, dtype=np.int64)
+        # newest frames of the next observations that are not the observation of the following slot
+        self._next_obs = {}
+        self._has_next_obs = np.zeros(size, dtype=bool)
+        self._last_obs_tp1 = None
         self._maxsize = size
         self._next_idx = 0
+        self._num_in_buffer = 0
+        self._num_added = 0
 
     def __len__(self):
-        return len(self._storage)
+        return self._num_in_buffer
+
+    def _split_frames(self, obs):
+        """The frames of a stacked observation, of shape (frame_history_len,) + frame shape."""
+        k = self._frame_history_len
+        if k == 1:
+            return obs[None]
+        frames = obs.reshape(obs.shape[:-1] + (k, obs.shape[-1] // k))
+        return np.moveaxis(frames, -2, 0)
 
     def add(self, obs_t, action, reward, obs_tp1, done):
-        data = (obs_t, action, reward, obs_tp1, done)
+        idx = self._next_idx
+        obs_t = np.asarray(obs_t)
+        obs_tp1 = np.asarray(obs_tp1, dtype=obs_t.dtype)
+        frames_t, frames_tp1 = self._split_frames(obs_t), self._split_frames(obs_tp1)
+        if not np.array_equal(frames_tp1[:-1], frames_t[1:]):
+            raise ValueError("the next observation does not continue the stack of %d frames of the observation"
+                             % self._frame_history_len)
 
-        if self._next_idx >= len(self._storage):
-            self._storage.append(data)
+        if self._frames is None:
+            # the oldest transition's stack reaches frame_history_len - 1 transitions further back
+            self._frames = np.empty((self._maxsize + self._frame_history_len - 1,) + frames_t.shape[1:],
+                                    dtype=obs_t.dtype)
+            self._actions, self._rewards, self._dones = [np.empty((self._maxsize,) + np.shape(x), dtype=np.asarray(x).dtype)
+                                                         for x in (action, reward, done)]
+
+        # the previous transition continues into this one: its next observation is obs_t
+        prev = (idx - 1) % self._maxsize
+        if self._num_added > 0 and np.array_equal(self._last_obs_tp1, obs_t):
+            del self._next_obs[prev]
+            self._has_next_obs[prev] = False
+            stack_len = min(self._stack_len[prev] + 1, self._frame_history_len)
+        elif (frames_t == frames_t[-1]).all():
+            # a new episode, its first frame repeated
+            stack_len = 1
         else:
-            self._storage[self._next_idx] = data
+            raise ValueError("observation neither continues the previous next observation "
+                             "nor repeats a single frame")
+        self._next_obs.pop(idx, None)
+
+        self._frames[self._num_added % len(self._frames)] = frames_t[-1]
+        self._counts[idx] = self._num_added
+        self._stack_len[idx] = stack_len
+        self._actions[idx] = action
+        self._rewards[idx] = reward
+        self._dones[idx] = done
+        self._next_obs[idx] = frames_tp1[-1].copy()
+        self._has_next_obs[idx] = True
+        self._last_obs_tp1 = obs_tp1
+
         self._next_idx = (self._next_idx + 1) % self._maxsize
+        self._num_in_buffer = min(self._num_in_buffer + 1, self._maxsize)
+        self._num_added += 1
+
+    def _stack_frames(self, counts, stack_lens):
+        """Frames of the observations of the transitions added after counts others, whose stacks
+        hold stack_lens distinct frames: slot j holds the frame added k - 1 - j transitions back,
+        or the first frame of the episode."""
+        k = self._frame_history_len
+        back = np.minimum(np.arange(k - 1, -1, -1)[None, :], stack_lens[:, None] - 1)
+        return self._frames[(counts[:, None] - back) % len(self._frames)]
+
+    def _join_frames(self, frames):
+        """Observations of shape (batch,) + obs shape from frames of shape (batch, k) + frame shape."""
+        if self._frame_history_len == 1:
+            return frames[:, 0]
+        return np.moveaxis(frames, 1, -2).reshape(frames.shape[:1] + frames.shape[2:-1] + (-1,))
 
     def _encode_sample(self, idxes):
-        obses_t, actions, rewards, obses_tp1, dones = [], [], [], [], []
-        for i in idxes:
-            data = self._storage[i]
-            obs_t, action, reward, obs_tp1, done = data
-            obses_t.append(np.array(obs_t, copy=False))
-            actions.append(np.array(action, copy=False))
-            rewards.append(reward)
-            obses_tp1.append(np.array(obs_tp1, copy=False))
-            dones.append(done)
-        return np.array(obses_t), np.array(actions), np.array(rewards), np.array(obses_tp1), np.array(dones)
+        idxes = np.asarray(idxes)
+        counts, stack_lens = self._counts[idxes], self._stack_len[idxes]
+        frames_t = self._stack_frames(counts, stack_lens)
+        # the next observation is the stack of the following transition; its newest frame is
+        # patched in from the side store when that one does not follow
+        frames_tp1 = self._stack_frames(counts + 1, np.minimum(stack_lens + 1, self._frame_history_len))
+        for i in np.flatnonzero(self._has_next_obs[idxes]):
+            frames_tp1[i, -1] = self._next_obs[idxes[i]]
+        return (self._join_frames(frames_t), self._actions[idxes], self._rewards[idxes],
+                self._join_frames(frames_tp1), self._dones[idxes])
 
     def sample(self, batch_size):
         """Sample a batch of experiences.
@@ -64,12 +148,12 @@ class ReplayBuffer(object):
             done_mask[i] = 1 if executing act_batch[i] resulted in
             the end of an episode and 0 otherwise.
         """
-        idxes = [random.randint(0, len(self._storage) - 1) for _ in range(batch_size)]
+        idxes = np.random.randint(0, len(self), size=batch_size)
         return self._encode_sample(idxes)
 
 
 class PrioritizedReplayBuffer(ReplayBuffer):
-    def __init__(self, size, alpha):
+    def __init__(self, size, alpha, stratified=False, frame_history_len=1):
         """Create Prioritized Replay buffer.
 
         Parameters
@@ -80,14 +164,21 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         alpha: float
             how much prioritization is used
             (0 - no prioritization, 1 - full prioritization)
+        stratified: bool
+            if True, split the total priority mass into batch_size equal
+            strata and draw one sample from each, instead of drawing every
+            sample independently
+        frame_history_len: int
+            see ReplayBuffer.__init__
 
         See Also
         --------
         ReplayBuffer.__init__
         """
-        super(PrioritizedReplayBuffer, self).__init__(size)
+        super(PrioritizedReplayBuffer, self).__init__(size, frame_history_len)
         assert alpha >= 0
         self._alpha = alpha
+        self._stratified = stratified
 
         it_capacity = 1
         while it_capacity < size:
@@ -105,13 +196,15 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         self._it_min[idx] = self._max_priority ** self._alpha
 
     def _sample_proportional(self, batch_size):
-        res = []
-        for _ in range(batch_size):
-            # TODO(szymon): should we ensure no repeats?
-            mass = random.random() * self._it_sum.sum(0, len(self._storage) - 1)
-            idx = self._it_sum.find_prefixsum_idx(mass)
-            res.append(idx)
-        return res
+        # TODO(szymon): should we ensure no repeats?
+        total = self._it_sum.sum(0, len(self))
+        if self._stratified:
+            mass = (np.arange(batch_size) + np.random.random(batch_size)) * (total / batch_size)
+        else:
+            mass = np.random.random(batch_size) * total
+        idxes = self._it_sum.find_prefixsum_idx(mass)
+        # rounding may carry a mass at the very top past the last filled leaf
+        return np.minimum(idxes, len(self) - 1)
 
     def sample(self, batch_size, beta):
         """Sample a batch of experiences.
@@ -153,15 +246,12 @@ class PrioritizedReplayBuffer(ReplayBuffer):
 
         idxes = self._sample_proportional(batch_size)
 
-        weights = []
-        p_min = self._it_min.min() / self._it_sum.sum()
-        max_weight = (p_min * len(self._storage)) ** (-beta)
+        total = self._it_sum.sum()
+        p_min = self._it_min.min() / total
+        max_weight = (p_min * len(self)) ** (-beta)
 
-        for idx in idxes:
-            p_sample = self._it_sum[idx] / self._it_sum.sum()
-            weight = (p_sample * len(self._storage)) ** (-beta)
-            weights.append(weight / max_weight)
-        weights = np.array(weights)
+        p_sample = self._it_sum[idxes] / total
+        weights = (p_sample * len(self)) ** (-beta) / max_weight
         encoded_sample = self._encode_sample(idxes)
         return tuple(list(encoded_sample) + [weights, idxes])
 
@@ -181,10 +271,11 @@ class PrioritizedReplayBuffer(ReplayBuffer):
             variable `idxes`.
         """
         assert len(idxes) == len(priorities)
-        for idx, priority in zip(idxes, priorities):
-            assert priority > 0
-            assert 0 <= idx < len(self._storage)
-            self._it_sum[idx] = priority ** self._alpha
-            self._it_min[idx] = priority ** self._alpha
+        idxes = np.asarray(idxes)
+        priorities = np.asarray(priorities)
+        assert np.all(priorities > 0)
+        assert np.all(0 <= idxes) and np.all(idxes < len(self))
+        self._it_sum[idxes] = priorities ** self._alpha
+        self._it_min[idxes] = priorities ** self._alpha
 
-            self._max_priority = max(self._max_priority, priority)
+        self._max_priority = max(self._max_priority, np.max(priorities, initial=0))
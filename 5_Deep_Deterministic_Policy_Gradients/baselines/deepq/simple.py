@@ -1,6 +1,7 @@
 import os
 import tempfile
 
+import gym
 import tensorflow as tf
 import zipfile
 import cloudpickle
@@ -99,6 +100,7 @@ def learn(env,
           prioritized_replay_beta0=0.4,
           prioritized_replay_beta_iters=None,
           prioritized_replay_eps=1e-6,
+          prioritized_replay_stratified=False,
           param_noise=False,
           callback=None):
     """Train a deepq model.
@@ -122,7 +124,8 @@ def learn(env,
     max_timesteps: int
         number of env steps to optimizer for
     buffer_size: int
-        size of the replay buffer
+        size of the replay buffer. Observations stacked by a FrameStack wrapper
+        are stored one frame per transition.
     exploration_fraction: float
         fraction of entire training period over which the exploration rate is annealed
     exploration_final_eps: float
@@ -156,6 +159,9 @@ def learn(env,
         to 1.0. If set to None equals to max_timesteps.
     prioritized_replay_eps: float
         epsilon to add to the TD errors when updating priorities.
+    prioritized_replay_stratified: bool
+        if True, each batch draws one sample from each of batch_size equal
+        slices of the total priority mass.
     callback: (locals, globals) -> None
         function called at every steps with state of the algorithm.
         If callback returns true training stops.
@@ -196,15 +202,23 @@ def learn(env,
     act = ActWrapper(act, act_params)
 
     # Create the replay buffer
+    frame_history_len = 1
+    wrapper = env
+    while isinstance(wrapper, gym.Wrapper):
+        if type(wrapper).__name__ == 'FrameStack':
+            frame_history_len = wrapper.k
+        wrapper = wrapper.env
     if prioritized_replay:
-        replay_buffer = PrioritizedReplayBuffer(buffer_size, alpha=prioritized_replay_alpha)
+        replay_buffer = PrioritizedReplayBuffer(buffer_size, alpha=prioritized_replay_alpha,
+                                                stratified=prioritized_replay_stratified,
+                                                frame_history_len=frame_history_len)
         if prioritized_replay_beta_iters is None:
             prioritized_replay_beta_iters = max_timesteps
         beta_schedule = LinearSchedule(prioritized_replay_beta_iters,
                                        initial_p=prioritized_replay_beta0,
                                        final_p=1.0)
     else:
-        replay_buffer = ReplayBuffer(buffer_size)
+        replay_buffer = ReplayBuffer(buffer_size, frame_history_len)
         beta_schedule = None
     # Create the schedule for exploration starting from 1.
     exploration = LinearSchedule(schedule_timesteps=int(exploration_fraction * max_timesteps),
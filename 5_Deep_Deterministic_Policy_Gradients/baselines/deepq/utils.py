@@ -73,8 +73,13 @@ class ObservationInput(PlaceholderTfInput):
                 observation space of the environment. Should be one of the gym.spaces types
         name: str 
                 tensorflow name of the underlying placeholder
+
+        uint8 observations (Atari frames) are fed as uint8 and scaled to
+        [0, 1] in the graph, as in Uint8Input.
         """
         inpt, self.processed_inpt = observation_input(observation_space, name=name)
+        if inpt.dtype == tf.uint8:
+            self.processed_inpt = self.processed_inpt / 255.0
         super().__init__(inpt)
 
     def get(self):
@@ -8,7 +8,7 @@ from baselines import logger
 from baselines.her.util import (
     import_function, store_args, flatten_grads, transitions_in_episode_batch)
 from baselines.her.normalizer import Normalizer
-from baselines.her.replay_buffer import ReplayBuffer
+from baselines.her.replay_buffer import ReplayBuffer, BatchPrefetcher
 from baselines.common.mpi_adam import MpiAdam
 
 
@@ -21,7 +21,7 @@ class DDPG(object):
     def __init__(self, input_dims, buffer_size, hidden, layers, network_class, polyak, batch_size,
                  Q_lr, pi_lr, norm_eps, norm_clip, max_u, action_l2, clip_obs, scope, T,
                  rollout_batch_size, subtract_goals, relative_goals, clip_pos_returns, clip_return,
-                 sample_transitions, gamma, reuse=False, **kwargs):
+                 sample_transitions, gamma, reuse=False, prefetch_batches=0, **kwargs):
         """Implementation of DDPG that is used in combination with Hindsight Experience Replay (HER).
 
         Args:
@@ -50,6 +50,8 @@ class DDPG(object):
             sample_transitions (function) function that samples from the replay buffer
             gamma (float): gamma used for Q learning updates
             reuse (boolean): whether or not the networks should be reused
+            prefetch_batches (int): if positive, sample and relabel this many batches ahead in a
+                background thread while the networks train
         """
         if self.clip_return is None:
             self.clip_return = np.inf
@@ -91,6 +93,7 @@ class DDPG(object):
 
         buffer_size = (self.buffer_size // self.rollout_batch_size) * self.rollout_batch_size
         self.buffer = ReplayBuffer(buffer_shapes, buffer_size, self.T, self.sample_transitions)
+        self.buffer_prefetcher = None
 
     def _random_action(self, n):
         return np.random.uniform(low=-self.max_u, high=self.max_u, size=(n, self.dimu))
@@ -185,6 +188,13 @@ class DDPG(object):
         self.pi_adam.update(pi_grad, self.pi_lr)
 
     def sample_batch(self):
+        if self.prefetch_batches > 0:
+            if self.buffer_prefetcher is None:
+                self.buffer_prefetcher = BatchPrefetcher(self._sample_batch, self.prefetch_batches)
+            return self.buffer_prefetcher.get()
+        return self._sample_batch()
+
+    def _sample_batch(self):
         transitions = self.buffer.sample(self.batch_size)
         o, o_2, g = transitions['o'], transitions['o_2'], transitions['g']
         ag, ag_2 = transitions['ag'], transitions['ag_2']
@@ -214,6 +224,9 @@ class DDPG(object):
         self.sess.run(self.update_target_net_op)
 
     def clear_buffer(self):
+        if self.buffer_prefetcher is not None:
+            self.buffer_prefetcher.close()
+            self.buffer_prefetcher = None
         self.buffer.clear_buffer()
 
     def _vars(self, scope):
@@ -35,11 +35,12 @@ DEFAULT_PARAMS = {
     'batch_size': 256,  # per mpi thread, measured in transitions and reduced to even multiple of chunk_length.
     'n_test_rollouts': 10,  # number of test rollouts per epoch, each consists of rollout_batch_size rollouts
     'test_with_polyak': False,  # run test episodes with the target network
+    'prefetch_batches': 0,  # training batches sampled ahead in a background thread, 0 to sample inline
     # exploration
     'random_eps': 0.3,  # percentage of time a random action is taken
     'noise_eps': 0.2,  # std of gaussian noise added to not-completely-random actions as a percentage of max_u
     # HER
-    'replay_strategy': 'future',  # supported modes: future, none
+    'replay_strategy': 'future',  # supported modes: future, final, episode, random, none
     'replay_k': 4,  # number of additional goals used for replay, only used if off_policy_data=future
     # normalization
     'norm_eps': 0.01,  # epsilon used for observation normalization
@@ -86,7 +87,8 @@ def prepare_params(kwargs):
                  'polyak',
                  'batch_size', 'Q_lr', 'pi_lr',
                  'norm_eps', 'norm_clip', 'max_u',
-                 'action_l2', 'clip_obs', 'scope', 'relative_goals']:
+                 'action_l2', 'clip_obs', 'scope', 'relative_goals',
+                 'prefetch_batches']:
         ddpg_params[name] = kwargs[name]
         kwargs['_' + name] = kwargs[name]
         del kwargs[name]
@@ -110,6 +112,7 @@ def configure_her(params):
     # Prepare configuration for HER.
     her_params = {
         'reward_fun': reward_fun,
+        'distance_threshold': goal_distance_threshold(env),
     }
     for name in ['replay_strategy', 'replay_k']:
         her_params[name] = params[name]
@@ -120,6 +123,16 @@ def configure_her(params):
     return sample_her_transitions
 
 
+def goal_distance_threshold(env):
+    """Returns the distance threshold of envs whose reward is -(|achieved_goal - desired_goal| >
+    distance_threshold), such as the sparse Fetch and HandReach tasks, and None for other envs.
+    """
+    env = env.unwrapped
+    if getattr(env, 'reward_type', None) != 'sparse' or hasattr(env, 'rotation_threshold'):
+        return None
+    return getattr(env, 'distance_threshold', None)
+
+
 def simple_goal_subtract(a, b):
     assert a.shape == b.shape
     return a - b
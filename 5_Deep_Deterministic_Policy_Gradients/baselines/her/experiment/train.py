@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 
 import click
 import numpy as np
@@ -38,11 +39,14 @@ def train(policy, rollout_worker, evaluator,
     for epoch in range(n_epochs):
         # train
         rollout_worker.clear_history()
+        train_time = 0.
         for _ in range(n_cycles):
             episode = rollout_worker.generate_rollouts()
             policy.store_episode(episode)
+            train_start = time.time()
             for _ in range(n_batches):
                 policy.train()
+            train_time += time.time() - train_start
             policy.update_target_net()
 
         # test
@@ -52,6 +56,7 @@ def train(policy, rollout_worker, evaluator,
 
         # record logs
         logger.record_tabular('epoch', epoch)
+        logger.record_tabular('train/updates_per_sec', n_cycles * n_batches / train_time)
         for key, val in evaluator.logs('test'):
             logger.record_tabular(key, mpi_average(val))
         for key, val in rollout_worker.logs('train'):
@@ -84,7 +89,7 @@ def train(policy, rollout_worker, evaluator,
 
 def launch(
     env, logdir, n_epochs, num_cpu, seed, replay_strategy, policy_save_interval, clip_return,
-    override_params={}, save_policies=True
+    prefetch_batches=0, override_params={}, save_policies=True
 ):
     # Fork for multi-CPU MPI implementation.
     if num_cpu > 1:
@@ -118,6 +123,7 @@ def launch(
     params = config.DEFAULT_PARAMS
     params['env_name'] = env
     params['replay_strategy'] = replay_strategy
+    params['prefetch_batches'] = prefetch_batches
     if env in config.DEFAULT_ENV_PARAMS:
         params.update(config.DEFAULT_ENV_PARAMS[env])  # merge env-specific parameters in
     params.update(**override_params)  # makes it possible to override any parameter
@@ -181,8 +187,9 @@ def launch(
 @click.option('--num_cpu', type=int, default=1, help='the number of CPU cores to use (using MPI)')
 @click.option('--seed', type=int, default=0, help='the random seed used to seed both the environment and the training code')
 @click.option('--policy_save_interval', type=int, default=5, help='the interval with which policy pickles are saved. If set to 0, only the best and latest policy will be pickled.')
-@click.option('--replay_strategy', type=click.Choice(['future', 'none']), default='future', help='the HER replay strategy to be used. "future" uses HER, "none" disables HER.')
+@click.option('--replay_strategy', type=click.Choice(['future', 'final', 'episode', 'random', 'none']), default='future', help='the HER replay strategy to be used. "future", "final", "episode" and "random" use HER with goals achieved later in the episode, at its end, anywhere in it or anywhere in the buffer, "none" disables HER.')
 @click.option('--clip_return', type=int, default=1, help='whether or not returns should be clipped')
+@click.option('--prefetch_batches', type=int, default=0, help='the number of training batches to sample and relabel ahead in a background thread. If set to 0, batches are sampled when needed.')
 def main(**kwargs):
     launch(**kwargs)
 
@@ -1,17 +1,30 @@
 import numpy as np
 
 
-def make_sample_her_transitions(replay_strategy, replay_k, reward_fun):
+def _gather(x, episode_idxs, t):
+    """Returns x[episode_idxs, t], as one take on the flattened array when x is stored
+    episode-major and contiguous (as the replay buffers are).
+    """
+    if x.flags.c_contiguous:
+        return np.take(x.reshape(-1, *x.shape[2:]), episode_idxs * x.shape[1] + t, axis=0)
+    return x[episode_idxs, t]
+
+
+def make_sample_her_transitions(replay_strategy, replay_k, reward_fun, distance_threshold=None):
     """Creates a sample function that can be used for HER experience replay.
 
     Args:
-        replay_strategy (in ['future', 'none']): the HER replay strategy; if set to 'none',
-            regular DDPG experience replay is used
+        replay_strategy (in ['future', 'final', 'episode', 'random', 'none']): the HER replay
+            strategy, i.e. where substituted goals are achieved: later in the same episode, at its
+            end, anywhere in it, or anywhere in the buffer; if set to 'none', regular DDPG
+            experience replay is used
         replay_k (int): the ratio between HER replays and regular replays (e.g. k = 4 -> 4 times
             as many HER replays as regular replays are used)
         reward_fun (function): function to re-compute the reward with substituted goals
+        distance_threshold (float): if given, the reward is -(|ag_2 - g| > distance_threshold),
+            computed for the whole batch here instead of through reward_fun
     """
-    if replay_strategy == 'future':
+    if replay_strategy in ['future', 'final', 'episode', 'random']:
         future_p = 1 - (1. / (1 + replay_k))
     else:  # 'replay_strategy' == 'none'
         future_p = 0
@@ -26,32 +39,44 @@ def make_sample_her_transitions(replay_strategy, replay_k, reward_fun):
         # Select which episodes and time steps to use.
         episode_idxs = np.random.randint(0, rollout_batch_size, batch_size)
         t_samples = np.random.randint(T, size=batch_size)
-        transitions = {key: episode_batch[key][episode_idxs, t_samples].copy()
-                       for key in episode_batch.keys()}
+        transitions = {key: _gather(episode_batch[key], episode_idxs, t_samples)
+                       for key in episode_batch.keys() if key not in ['o_2', 'ag_2']}
+        # o_2 and ag_2 are o[:, 1:] and ag[:, 1:]; gather them from the contiguous arrays.
+        for key in ['o', 'ag']:
+            transitions[key + '_2'] = _gather(episode_batch[key], episode_idxs, t_samples + 1)
 
-        # Select future time indexes proportional with probability future_p. These
-        # will be used for HER replay by substituting in future goals.
-        her_indexes = np.where(np.random.uniform(size=batch_size) < future_p)
-        future_offset = np.random.uniform(size=batch_size) * (T - t_samples)
-        future_offset = future_offset.astype(int)
-        future_t = (t_samples + 1 + future_offset)[her_indexes]
+        # Select HER transitions with probability future_p and the time index of the achieved
+        # goal that replaces their goal; ag[t + 1] is the goal achieved by the transition at t.
+        her_indexes = np.flatnonzero(np.random.uniform(size=batch_size) < future_p)
+        her_episode_idxs = episode_idxs[her_indexes]
+        if replay_strategy == 'future':
+            her_t = np.random.randint(t_samples[her_indexes] + 1, T + 1)
+        elif replay_strategy == 'final':
+            her_t = np.full(len(her_indexes), T)
+        else:
+            if replay_strategy == 'random':
+                her_episode_idxs = np.random.randint(0, rollout_batch_size, len(her_indexes))
+            her_t = np.random.randint(1, T + 1, size=len(her_indexes))
 
         # Replace goal with achieved goal but only for the previously-selected
         # HER transitions (as defined by her_indexes). For the other transitions,
         # keep the original goal.
-        future_ag = episode_batch['ag'][episode_idxs[her_indexes], future_t]
-        transitions['g'][her_indexes] = future_ag
-
-        # Reconstruct info dictionary for reward  computation.
-        info = {}
-        for key, value in transitions.items():
-            if key.startswith('info_'):
-                info[key.replace('info_', '')] = value
+        transitions['g'][her_indexes] = _gather(episode_batch['ag'], her_episode_idxs, her_t)
 
         # Re-compute reward since we may have substituted the goal.
-        reward_params = {k: transitions[k] for k in ['ag_2', 'g']}
-        reward_params['info'] = info
-        transitions['r'] = reward_fun(**reward_params)
+        if distance_threshold is not None:
+            d2 = np.sum(np.square(transitions['ag_2'] - transitions['g']), axis=-1)
+            transitions['r'] = -(d2 > distance_threshold ** 2).astype(np.float32)
+        else:
+            # Reconstruct info dictionary for reward  computation.
+            info = {}
+            for key, value in transitions.items():
+                if key.startswith('info_'):
+                    info[key.replace('info_', '')] = value
+
+            reward_params = {k: transitions[k] for k in ['ag_2', 'g']}
+            reward_params['info'] = info
+            transitions['r'] = reward_fun(**reward_params)
 
         transitions = {k: transitions[k].reshape(batch_size, *transitions[k].shape[1:])
                        for k in transitions.keys()}
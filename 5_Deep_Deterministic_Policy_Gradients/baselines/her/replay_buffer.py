@@ -1,3 +1,4 @@
+import queue
 import threading
 
 import numpy as np
@@ -27,27 +28,30 @@ class ReplayBuffer:
         self.current_size = 0
         self.n_transitions_stored = 0
 
+        # Writers hold the lock and make the version odd while they write; readers do not lock,
+        # they sample again if the version was odd or has changed by the time they are done.
         self.lock = threading.Lock()
+        self.version = 0
 
     @property
     def full(self):
-        with self.lock:
-            return self.current_size == self.size
+        return self.current_size == self.size
 
     def sample(self, batch_size):
         """Returns a dict {key: array(batch_size x shapes[key])}
         """
-        buffers = {}
-
-        with self.lock:
-            assert self.current_size > 0
-            for key in self.buffers.keys():
-                buffers[key] = self.buffers[key][:self.current_size]
-
-        buffers['o_2'] = buffers['o'][:, 1:, :]
-        buffers['ag_2'] = buffers['ag'][:, 1:, :]
-
-        transitions = self.sample_transitions(buffers, batch_size)
+        while True:
+            version = self.version
+            if version % 2 == 0:
+                current_size = self.current_size
+                assert current_size > 0
+                buffers = {key: self.buffers[key][:current_size] for key in self.buffers.keys()}
+                buffers['o_2'] = buffers['o'][:, 1:, :]
+                buffers['ag_2'] = buffers['ag'][:, 1:, :]
+
+                transitions = self.sample_transitions(buffers, batch_size)
+                if self.version == version:
+                    break
 
         for key in (['r', 'o_2', 'ag_2'] + list(self.buffers.keys())):
             assert key in transitions, "key %s missing from transitions" % key
@@ -62,6 +66,7 @@ class ReplayBuffer:
         batch_size = batch_sizes[0]
 
         with self.lock:
+            self.version += 1
             idxs = self._get_storage_idx(batch_size)
 
             # load inputs into buffers
@@ -69,22 +74,22 @@ class ReplayBuffer:
                 self.buffers[key][idxs] = episode_batch[key]
 
             self.n_transitions_stored += batch_size * self.T
+            self.version += 1
 
     def get_current_episode_size(self):
-        with self.lock:
-            return self.current_size
+        return self.current_size
 
     def get_current_size(self):
-        with self.lock:
-            return self.current_size * self.T
+        return self.current_size * self.T
 
     def get_transitions_stored(self):
-        with self.lock:
-            return self.n_transitions_stored
+        return self.n_transitions_stored
 
     def clear_buffer(self):
         with self.lock:
+            self.version += 1
             self.current_size = 0
+            self.version += 1
 
     def _get_storage_idx(self, inc=None):
         inc = inc or 1   # size increment
@@ -106,3 +111,43 @@ class ReplayBuffer:
         if inc == 1:
             idx = idx[0]
         return idx
+
+
+class BatchPrefetcher:
+    def __init__(self, sample_batch, size):
+        """Samples batches in a background thread and keeps up to size of them ready.
+
+        Args:
+            sample_batch (function): returns one batch; called from the background thread only
+            size (int): the number of batches to keep ready
+        """
+        self.sample_batch = sample_batch
+        self.queue = queue.Queue(maxsize=size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                item = (self.sample_batch(), None)
+            except Exception as e:
+                item = (None, e)
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if item[1] is not None:
+                return
+
+    def get(self):
+        batch, error = self.queue.get()
+        if error is not None:
+            raise error
+        return batch
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
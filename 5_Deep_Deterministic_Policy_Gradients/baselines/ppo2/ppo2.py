@@ -6,12 +6,19 @@ import os.path as osp
 import tensorflow as tf
 from baselines import logger
 from collections import deque
-from baselines.common import explained_variance
+from baselines.common import explained_variance, generalized_advantages
+from baselines.common.input import observation_input
 from baselines.common.runners import AbstractEnvRunner
 
 class Model(object):
     def __init__(self, *, policy, ob_space, ac_space, nbatch_act, nbatch_train,
-                nsteps, ent_coef, vf_coef, max_grad_norm):
+                nsteps, ent_coef, vf_coef, max_grad_norm, nminibatches=1, noptepochs=None):
+        """
+        With noptepochs, the model also builds train_epochs, which takes the whole rollout in
+        one sess.run and runs the noptepochs epochs of shuffled minibatch updates in a
+        tf.while_loop, so the minibatches are gathered in the graph instead of being sliced
+        and fed one by one.
+        """
         sess = tf.get_default_session()
 
         act_model = policy(sess, ob_space, ac_space, nbatch_act, 1, reuse=False)
@@ -25,29 +32,37 @@ class Model(object):
         LR = tf.placeholder(tf.float32, [])
         CLIPRANGE = tf.placeholder(tf.float32, [])
 
-        neglogpac = train_model.pd.neglogp(A)
-        entropy = tf.reduce_mean(train_model.pd.entropy())
-
-        vpred = train_model.vf
-        vpredclipped = OLDVPRED + tf.clip_by_value(train_model.vf - OLDVPRED, - CLIPRANGE, CLIPRANGE)
-        vf_losses1 = tf.square(vpred - R)
-        vf_losses2 = tf.square(vpredclipped - R)
-        vf_loss = .5 * tf.reduce_mean(tf.maximum(vf_losses1, vf_losses2))
-        ratio = tf.exp(OLDNEGLOGPAC - neglogpac)
-        pg_losses = -ADV * ratio
-        pg_losses2 = -ADV * tf.clip_by_value(ratio, 1.0 - CLIPRANGE, 1.0 + CLIPRANGE)
-        pg_loss = tf.reduce_mean(tf.maximum(pg_losses, pg_losses2))
-        approxkl = .5 * tf.reduce_mean(tf.square(neglogpac - OLDNEGLOGPAC))
-        clipfrac = tf.reduce_mean(tf.to_float(tf.greater(tf.abs(ratio - 1.0), CLIPRANGE)))
-        loss = pg_loss - entropy * ent_coef + vf_loss * vf_coef
+        def ppo_losses(train_model, A, ADV, R, OLDNEGLOGPAC, OLDVPRED):
+            neglogpac = train_model.pd.neglogp(A)
+            entropy = tf.reduce_mean(train_model.pd.entropy())
+
+            vpred = train_model.vf
+            vpredclipped = OLDVPRED + tf.clip_by_value(train_model.vf - OLDVPRED, - CLIPRANGE, CLIPRANGE)
+            vf_losses1 = tf.square(vpred - R)
+            vf_losses2 = tf.square(vpredclipped - R)
+            vf_loss = .5 * tf.reduce_mean(tf.maximum(vf_losses1, vf_losses2))
+            ratio = tf.exp(OLDNEGLOGPAC - neglogpac)
+            pg_losses = -ADV * ratio
+            pg_losses2 = -ADV * tf.clip_by_value(ratio, 1.0 - CLIPRANGE, 1.0 + CLIPRANGE)
+            pg_loss = tf.reduce_mean(tf.maximum(pg_losses, pg_losses2))
+            approxkl = .5 * tf.reduce_mean(tf.square(neglogpac - OLDNEGLOGPAC))
+            clipfrac = tf.reduce_mean(tf.to_float(tf.greater(tf.abs(ratio - 1.0), CLIPRANGE)))
+            loss = pg_loss - entropy * ent_coef + vf_loss * vf_coef
+            return [pg_loss, vf_loss, entropy, approxkl, clipfrac], loss
+
         with tf.variable_scope('model'):
             params = tf.trainable_variables()
-        grads = tf.gradients(loss, params)
-        if max_grad_norm is not None:
-            grads, _grad_norm = tf.clip_by_global_norm(grads, max_grad_norm)
-        grads = list(zip(grads, params))
         trainer = tf.train.AdamOptimizer(learning_rate=LR, epsilon=1e-5)
-        _train = trainer.apply_gradients(grads)
+
+        def apply_gradients(loss):
+            grads = tf.gradients(loss, params)
+            if max_grad_norm is not None:
+                grads, _grad_norm = tf.clip_by_global_norm(grads, max_grad_norm)
+            grads = list(zip(grads, params))
+            return trainer.apply_gradients(grads)
+
+        stats, loss = ppo_losses(train_model, A, ADV, R, OLDNEGLOGPAC, OLDVPRED)
+        _train = apply_gradients(loss)
 
         def train(lr, cliprange, obs, returns, masks, actions, values, neglogpacs, states=None):
             advs = returns - values
@@ -58,11 +73,59 @@ class Model(object):
                 td_map[train_model.S] = states
                 td_map[train_model.M] = masks
             return sess.run(
-                [pg_loss, vf_loss, entropy, approxkl, clipfrac, _train],
+                stats + [_train],
                 td_map
             )[:-1]
         self.loss_names = ['policy_loss', 'value_loss', 'policy_entropy', 'approxkl', 'clipfrac']
 
+        if noptepochs is not None:
+            nbatch = nbatch_train * nminibatches
+            recurrent = act_model.initial_state is not None
+            OBS, _ = observation_input(ob_space, nbatch, name='Obs')
+            ACTIONS = train_model.pdtype.sample_placeholder([nbatch])
+            RETURNS, MASKS, VALUES, NEGLOGPACS = [tf.placeholder(tf.float32, [nbatch]) for _ in range(4)]
+            # recurrent policies are trained on the whole sequences of a shuffled subset of envs
+            nunits = nbatch // nsteps if recurrent else nbatch
+            if recurrent:
+                STATES = tf.placeholder(tf.float32, (nunits,) + act_model.initial_state.shape[1:])
+            nupdates = noptepochs * nminibatches
+            perms = tf.reshape(tf.stack([tf.random_shuffle(tf.range(nunits)) for _ in range(noptepochs)]),
+                               [nupdates, nunits // nminibatches])
+
+            def minibatch_update(i, lossvals):
+                units = perms[i]
+                if recurrent:
+                    inds = tf.reshape(units[:, None] * nsteps + tf.range(nsteps)[None, :], [-1])
+                    mb_model = policy(sess, ob_space, ac_space, nbatch_train, nsteps, reuse=True,
+                                      X=tf.gather(OBS, inds), M=tf.gather(MASKS, inds), S=tf.gather(STATES, units))
+                else:
+                    inds = units
+                    mb_model = policy(sess, ob_space, ac_space, nbatch_train, nsteps, reuse=True,
+                                      X=tf.gather(OBS, inds))
+                returns, values = tf.gather(RETURNS, inds), tf.gather(VALUES, inds)
+                advs_mean, advs_var = tf.nn.moments(returns - values, axes=[0])
+                advs = (returns - values - advs_mean) / (tf.sqrt(advs_var) + 1e-8)
+                mb_stats, mb_loss = ppo_losses(mb_model, tf.gather(ACTIONS, inds), advs, returns,
+                                               tf.gather(NEGLOGPACS, inds), values)
+                # shares the Adam slots created for _train
+                with tf.control_dependencies([apply_gradients(mb_loss)]):
+                    return i + 1, lossvals.write(i, tf.stack(mb_stats))
+
+            _, lossvals = tf.while_loop(lambda i, _: i < nupdates, minibatch_update,
+                                        [tf.constant(0), tf.TensorArray(tf.float32, nupdates)],
+                                        parallel_iterations=1, back_prop=False)
+            epoch_lossvals = lossvals.stack()
+
+            def train_epochs(lr, cliprange, obs, returns, masks, actions, values, neglogpacs, states=None):
+                """Runs all the minibatch updates of the rollout; returns the losses of each, in order."""
+                td_map = {OBS:obs, ACTIONS:actions, RETURNS:returns, VALUES:values, NEGLOGPACS:neglogpacs,
+                          LR:lr, CLIPRANGE:cliprange}
+                if states is not None:
+                    td_map[STATES] = states
+                    td_map[MASKS] = masks
+                return sess.run(epoch_lossvals, td_map)
+            self.train_epochs = train_epochs
+
         def save(save_path):
             ps = sess.run(params)
             joblib.dump(ps, save_path)
@@ -85,61 +148,80 @@ class Model(object):
         self.load = load
         tf.global_variables_initializer().run(session=sess) #pylint: disable=E1101
 
+class RolloutStorage(object):
+    """
+    Arrays of one rollout of nsteps steps of nenvs envs, preallocated env-major as
+    (nenvs, nsteps, ...) so that the batch the trainer takes, flattened env-major,
+    is a view of them. Each array is allocated on its first write, with the given
+    dtype or that of the values written. The arrays are reused by the next rollout.
+    """
+    def __init__(self, nenvs, nsteps, dtypes):
+        self.nenvs = nenvs
+        self.nsteps = nsteps
+        self.dtypes = dtypes
+        self.arrays = {}
+
+    def store(self, t, **values):
+        for key, value in values.items():
+            if key not in self.arrays:
+                value = np.asarray(value, dtype=self.dtypes.get(key))
+                self.arrays[key] = np.zeros((self.nenvs, self.nsteps) + value.shape[1:], dtype=value.dtype)
+            self.arrays[key][:, t] = value
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def __setitem__(self, key, value):
+        self.arrays[key] = np.ascontiguousarray(value, dtype=self.dtypes.get(key))
+
+    def flat(self, key):
+        """Array key with its env and step axes flattened, env-major; a view."""
+        arr = self.arrays[key]
+        return arr.reshape(self.nenvs * self.nsteps, *arr.shape[2:])
+
 class Runner(AbstractEnvRunner):
 
     def __init__(self, *, env, model, nsteps, gamma, lam):
         super().__init__(env=env, model=model, nsteps=nsteps)
         self.lam = lam
         self.gamma = gamma
+        self.rollout = RolloutStorage(env.num_envs, nsteps, dtypes={
+            'obs': self.obs.dtype, 'rewards': np.float32, 'values': np.float32, 'neglogpacs': np.float32,
+            'dones': np.bool_})
+        # seconds of the last run spent stepping the envs, in the model, and in the runner itself
+        self.times = {}
 
     def run(self):
-        mb_obs, mb_rewards, mb_actions, mb_values, mb_dones, mb_neglogpacs = [],[],[],[],[],[]
         mb_states = self.states
         epinfos = []
-        for _ in range(self.nsteps):
+        env_time = model_time = 0.
+        tstart = time.time()
+        for t in range(self.nsteps):
+            tmodel = time.time()
             actions, values, self.states, neglogpacs = self.model.step(self.obs, self.states, self.dones)
-            mb_obs.append(self.obs.copy())
-            mb_actions.append(actions)
-            mb_values.append(values)
-            mb_neglogpacs.append(neglogpacs)
-            mb_dones.append(self.dones)
+            model_time += time.time() - tmodel
+            self.rollout.store(t, obs=self.obs, actions=actions, values=values, neglogpacs=neglogpacs,
+                               dones=self.dones)
+            tenv = time.time()
             self.obs[:], rewards, self.dones, infos = self.env.step(actions)
+            env_time += time.time() - tenv
             for info in infos:
                 maybeepinfo = info.get('episode')
                 if maybeepinfo: epinfos.append(maybeepinfo)
-            mb_rewards.append(rewards)
-        #batch of steps to batch of rollouts
-        mb_obs = np.asarray(mb_obs, dtype=self.obs.dtype)
-        mb_rewards = np.asarray(mb_rewards, dtype=np.float32)
-        mb_actions = np.asarray(mb_actions)
-        mb_values = np.asarray(mb_values, dtype=np.float32)
-        mb_neglogpacs = np.asarray(mb_neglogpacs, dtype=np.float32)
-        mb_dones = np.asarray(mb_dones, dtype=np.bool)
+            self.rollout.store(t, rewards=rewards)
+        tmodel = time.time()
         last_values = self.model.value(self.obs, self.states, self.dones)
-        #discount/bootstrap off value fn
-        mb_returns = np.zeros_like(mb_rewards)
-        mb_advs = np.zeros_like(mb_rewards)
-        lastgaelam = 0
-        for t in reversed(range(self.nsteps)):
-            if t == self.nsteps - 1:
-                nextnonterminal = 1.0 - self.dones
-                nextvalues = last_values
-            else:
-                nextnonterminal = 1.0 - mb_dones[t+1]
-                nextvalues = mb_values[t+1]
-            delta = mb_rewards[t] + self.gamma * nextvalues * nextnonterminal - mb_values[t]
-            mb_advs[t] = lastgaelam = delta + self.gamma * self.lam * nextnonterminal * lastgaelam
-        mb_returns = mb_advs + mb_values
-        return (*map(sf01, (mb_obs, mb_returns, mb_dones, mb_actions, mb_values, mb_neglogpacs)),
+        model_time += time.time() - tmodel
+        #discount/bootstrap off value fn, over the steps of all envs at once
+        rollout = self.rollout
+        _, mb_returns = generalized_advantages(rollout['rewards'].T, rollout['values'].T, rollout['dones'].T,
+                                               last_values, self.dones, self.gamma, self.lam)
+        rollout['returns'] = mb_returns.T
+        self.times = {'env': env_time, 'model': model_time,
+                      'runner': time.time() - tstart - env_time - model_time}
+        return (*map(rollout.flat, ('obs', 'returns', 'dones', 'actions', 'values', 'neglogpacs')),
             mb_states, epinfos)
 # obs, returns, masks, actions, values, neglogpacs, states = runner.run()
-def sf01(arr):
-    """
-    swap and then flatten axes 0 and 1
-    """
-    s = arr.shape
-    return arr.swapaxes(0, 1).reshape(s[0] * s[1], *s[2:])
-
 def constfn(val):
     def f(_):
         return val
@@ -148,7 +230,11 @@ def constfn(val):
 def learn(*, policy, env, nsteps, total_timesteps, ent_coef, lr,
             vf_coef=0.5,  max_grad_norm=0.5, gamma=0.99, lam=0.95,
             log_interval=10, nminibatches=4, noptepochs=4, cliprange=0.2,
-            save_interval=0, load_path=None):
+            save_interval=0, load_path=None, ingraph_epochs=False):
+    """
+    ingraph_epochs: run the noptepochs epochs of minibatch updates of each rollout inside
+        the TF graph, with one sess.run per update, instead of feeding each minibatch
+    """
 
     if isinstance(lr, float): lr = constfn(lr)
     else: assert callable(lr)
@@ -164,7 +250,8 @@ def learn(*, policy, env, nsteps, total_timesteps, ent_coef, lr,
 
     make_model = lambda : Model(policy=policy, ob_space=ob_space, ac_space=ac_space, nbatch_act=nenvs, nbatch_train=nbatch_train,
                     nsteps=nsteps, ent_coef=ent_coef, vf_coef=vf_coef,
-                    max_grad_norm=max_grad_norm)
+                    max_grad_norm=max_grad_norm, nminibatches=nminibatches,
+                    noptepochs=noptepochs if ingraph_epochs else None)
     if save_interval and logger.get_dir():
         import cloudpickle
         with open(osp.join(logger.get_dir(), 'make_model.pkl'), 'wb') as fh:
@@ -188,7 +275,10 @@ def learn(*, policy, env, nsteps, total_timesteps, ent_coef, lr,
         obs, returns, masks, actions, values, neglogpacs, states, epinfos = runner.run() #pylint: disable=E0632
         epinfobuf.extend(epinfos)
         mblossvals = []
-        if states is None: # nonrecurrent version
+        if ingraph_epochs:
+            mblossvals = model.train_epochs(lrnow, cliprangenow, obs, returns, masks, actions, values, neglogpacs,
+                                            states)
+        elif states is None: # nonrecurrent version
             inds = np.arange(nbatch)
             for _ in range(noptepochs):
                 np.random.shuffle(inds)
@@ -223,6 +313,8 @@ def learn(*, policy, env, nsteps, total_timesteps, ent_coef, lr,
             logger.logkv("total_timesteps", update*nbatch)
             logger.logkv("fps", fps)
             logger.logkv("explained_variance", float(ev))
+            for name, seconds in runner.times.items():
+                logger.logkv('time_rollout_' + name, seconds)
             logger.logkv('eprewmean', safemean([epinfo['r'] for epinfo in epinfobuf]))
             logger.logkv('eplenmean', safemean([epinfo['l'] for epinfo in epinfobuf]))
             logger.logkv('time_elapsed', tnow - tfirststart)
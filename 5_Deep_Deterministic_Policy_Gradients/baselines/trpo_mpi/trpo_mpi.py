@@ -1,4 +1,4 @@
-from baselines.common import explained_variance, zipsame, dataset
+from baselines.common import explained_variance, generalized_advantages, zipsame, dataset
 from baselines import logger
 import baselines.common.tf_util as U
 import tensorflow as tf, numpy as np
@@ -67,17 +67,9 @@ def traj_segment_generator(pi, env, horizon, stochastic):
         t += 1
 
 def add_vtarg_and_adv(seg, gamma, lam):
-    new = np.append(seg["new"], 0) # last element is only used for last vtarg, but we already zeroed it if last new = 1
-    vpred = np.append(seg["vpred"], seg["nextvpred"])
-    T = len(seg["rew"])
-    seg["adv"] = gaelam = np.empty(T, 'float32')
-    rew = seg["rew"]
-    lastgaelam = 0
-    for t in reversed(range(T)):
-        nonterminal = 1-new[t+1]
-        delta = rew[t] + gamma * vpred[t+1] * nonterminal - vpred[t]
-        gaelam[t] = lastgaelam = delta + gamma * lam * nonterminal * lastgaelam
-    seg["tdlamret"] = seg["adv"] + seg["vpred"]
+    # the new flag after the last step is only used for the last vtarg, but we already zeroed nextvpred if last new = 1
+    seg["adv"], seg["tdlamret"] = generalized_advantages(seg["rew"], seg["vpred"], seg["new"], seg["nextvpred"], 0,
+                                                         gamma, lam)
 
 def learn(env, policy_fn, *,
         timesteps_per_batch, # what to train on
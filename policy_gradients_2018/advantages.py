@@ -0,0 +1,61 @@
+"""
+
+Returns and advantages over a flat batch of concatenated paths
+
+All functions take the per-timestep values of every path of a batch concatenated
+into one array, plus the length of each path, and work on the whole batch at once:
+the discounted sums are computed by a single scipy.signal.lfilter pass over the
+batch, after which the part of each sum that leaks across a path boundary is
+subtracted again.
+
+    q_n = reward_to_go(rew_n, path_lengths, gamma)
+    adv_n = gae(rew_n + gamma*next_values - current_values, path_lengths, gamma, lam)
+
+"""
+import numpy as np
+import scipy.signal
+
+
+def discount(x, gamma):
+    """
+    Discounted sums along the 0th dimension of x, ignoring path boundaries:
+
+        y[t] = x[t] + gamma*x[t+1] + gamma^2*x[t+2] + ... + gamma^k x[t+k],
+                where k = len(x) - t - 1
+    """
+    return scipy.signal.lfilter([1], [1, -gamma], x[::-1], axis=0)[::-1]
+
+def discount_paths(x, path_lengths, gamma):
+    """
+    Discounted sums of x restarted at every path boundary: for t in a path ending at index end,
+
+        y[t] = x[t] + gamma*x[t+1] + ... + gamma^(end-t) x[end]
+    """
+    x = np.asarray(x, dtype=np.float64)
+    path_lengths = np.asarray(path_lengths)
+    assert path_lengths.sum() == len(x)
+    ends = np.cumsum(path_lengths) # start of the following path
+    # sum over the batch, then remove the discounted sum from the following path onwards
+    y = discount(x, gamma)
+    y_next = np.append(y, 0.)[np.repeat(ends, path_lengths)]
+    steps_to_end = np.repeat(ends, path_lengths) - np.arange(len(x))
+    return y - gamma ** steps_to_end * y_next
+
+def reward_to_go(rewards, path_lengths, gamma):
+    """ Q_t = sum_{t'=t}^T gamma^(t'-t) * r_{t'}, within each path """
+    return discount_paths(rewards, path_lengths, gamma)
+
+def discounted_returns(rewards, path_lengths, gamma):
+    """ Ret(tau) = sum_{t'=0}^T gamma^t' r_{t'}, repeated for every timestep of its path """
+    path_lengths = np.asarray(path_lengths)
+    starts = np.cumsum(path_lengths) - path_lengths
+    return np.repeat(reward_to_go(rewards, path_lengths, gamma)[starts], path_lengths)
+
+def gae(deltas, path_lengths, gamma, lam):
+    """
+    Generalized advantage estimates from the TD errors
+    delta_t = r(s_t, a_t) + gamma*V(s_{t+1}) - V(s_t):
+
+        A(s_t, a_t) = sum_{t'=t}^T (gamma*lam)^(t'-t) delta_{t'}, within each path
+    """
+    return discount_paths(deltas, path_lengths, gamma * lam)
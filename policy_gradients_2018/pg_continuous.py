@@ -16,6 +16,8 @@ import numpy as np
 import tensorflow as tf
 import gym
 import logz
+import sampler
+import advantages
 import os
 import time
 import inspect
@@ -78,6 +80,9 @@ def train_PG(exp_name='',
              normalize_advantages=True,
              nn_baseline=False,
              seed=0,
+             env_fn=None,
+             num_envs=1,
+             subproc_envs=False,
              # network arguments
              n_layers=1,
              size=32,
@@ -109,6 +114,9 @@ def train_PG(exp_name='',
     # Maximum length for episodes
     max_path_length = max_path_length or env.spec.timestep_limit
 
+    # Environments stepped together to collect each batch
+    envs = sampler.make_envs(env, env_fn, num_envs, subprocess=subproc_envs, seed=seed)
+
     # ========================================================================================#
     # Notes on notation:
     #
@@ -359,55 +367,19 @@ def train_PG(exp_name='',
         return
 
     _, best_rew = testing()
+    policy_fn = lambda ob: sess.run(sy_sampled_ac, feed_dict={sy_ob_no: ob})
     for itr in range(n_iter):
         print("********** Iteration %i ************" % itr)
 
         # Collect paths until we have enough timesteps
-        timesteps_this_batch = 0
-        paths = []
-        while True:
-            ob = env.reset()
-            obs, acs, rewards = [], [], []
-            animate_this_episode = (len(paths) == 0 and (itr % 30 == 0) and animate)
-            steps = 0
-            total_r = 0
-            while True:
-                if animate_this_episode:
-                    env.render()
-                    time.sleep(0.05)
-                obs.append(ob)
-                k = np.reshape(np.array(ob), newshape=(-1, len(ob)))
-                # print(k.shape)
-                # print('sampling an action...')
-                one_hot_ac = sess.run(sy_sampled_ac, feed_dict={sy_ob_no: k})
-
-                if discrete:
-                    ac = int(np.argmax(one_hot_ac))
-                else:
-                    ac = one_hot_ac
-
-                acs.append(one_hot_ac)
-                max_action = env.action_space.high
-                ac = np.reshape(ac, newshape=(ac.shape[1]))
-                # print('getting observations from env ..')
-                ob, rew, done, _ = env.step(ac)  # transition dynamics P(s_t+1/s_t,a_t), r(s_t+1/s_t,a_t)
-                total_r += rew
-                rew = rew*4
-                rewards.append(rew)
-                steps += 1
-                if done or steps > max_path_length:
-                    break
-            path = {"observation": np.array(obs),
-                    "reward": np.array(rewards),
-                    "action": np.array(acs)}
-
-            if total_r > 0:
-                paths.append(path)
-                timesteps_this_batch += pathlength(path)
-                print(total_r)
-
-            if timesteps_this_batch > min_timesteps_per_batch:
-                break
+        sample_start = time.time()
+        paths, env_steps = sampler.sample_paths(envs, policy_fn, min_timesteps_per_batch, max_path_length, discrete,
+                                                accept=lambda path: path["reward"].sum() > 0,
+                                                render=(itr % 30 == 0) and animate)
+        env_steps_per_sec = env_steps / (time.time() - sample_start)
+        for path in paths:
+            path["reward"] = path["reward"] * 4
+        timesteps_this_batch = sum(pathlength(path) for path in paths)
         total_timesteps += timesteps_this_batch
 
         # Build arrays for observation, action for the policy gradient update by concatenating
@@ -475,25 +447,12 @@ def train_PG(exp_name='',
         # ====================================================================================#
 
         # DYNAMIC PROGRAMMING
+        rew_n = np.concatenate([path['reward'] for path in paths])
+        path_lengths = [pathlength(path) for path in paths]
         if reward_to_go:
-            q_n = list()
-            for path in paths:
-                pLen = pathlength(path)
-                q_p = np.zeros(pLen)
-                q_p[pLen - 1] = path['reward'][pLen - 1]
-                for t in reversed(range(pLen - 1)):
-                    q_p[t] = path['reward'][t] + gamma * q_p[t + 1]
-                q_p = np.array(q_p)
-                q_n.append(q_p)
+            q_n = advantages.reward_to_go(rew_n, path_lengths, gamma)
         else:
-            q_n = list()
-            for path in paths:
-                pLen = pathlength(path)
-                q_p = 0
-                for t in range(pLen):
-                    q_p = q_p + (gamma ** t) * (path['reward'][t])
-                q_n.append(q_p * np.ones(pLen))
-        q_n = np.concatenate(q_n)
+            q_n = advantages.discounted_returns(rew_n, path_lengths, gamma)
         # print(q_n.shape)
         # ====================================================================================#
         #                           ----------SECTION 5----------
@@ -580,8 +539,10 @@ def train_PG(exp_name='',
         logz.log_tabular("EpLenStd", np.std(ep_lengths))
         logz.log_tabular("TimestepsThisBatch", timesteps_this_batch)
         logz.log_tabular("TimestepsSoFar", total_timesteps)
+        logz.log_tabular("EnvStepsPerSec", env_steps_per_sec)
         logz.dump_tabular()
         logz.pickle_tf_vars()
+    envs.close()
 
 def main():
     import argparse
@@ -601,6 +562,8 @@ def main():
     parser.add_argument('--n_experiments', '-e', type=int, default=1)
     parser.add_argument('--n_layers', '-l', type=int, default=4)
     parser.add_argument('--size', '-s', type=int, default=150)
+    parser.add_argument('--num_envs', type=int, default=1)
+    parser.add_argument('--subproc_envs', action='store_true')
     args = parser.parse_args()
 
     print('test: ', args.test)
@@ -611,8 +574,12 @@ def main():
     if not (os.path.exists(logdir)):
         os.makedirs(logdir)
 
-    env = ProstheticsEnv(visualize=False, integrator_accuracy=3e-4)
-    env.change_model(model='3D', difficulty=2, prosthetic=True, seed=0)
+    def make_env():
+        env = ProstheticsEnv(visualize=False, integrator_accuracy=3e-4)
+        env.change_model(model='3D', difficulty=2, prosthetic=True, seed=0)
+        return env
+
+    env = make_env()
     print('ac_dim: ', env.action_space.shape)
     print('obs_dim: ', env.observation_space.shape)
     print('normalize: ', not (args.dont_normalize_advantages))
@@ -636,6 +603,9 @@ def main():
         nn_baseline=args.nn_baseline,
         n_layers=args.n_layers,
         size=args.size,
+        env_fn=make_env,
+        num_envs=args.num_envs,
+        subproc_envs=args.subproc_envs,
         test=args.test
     )
 
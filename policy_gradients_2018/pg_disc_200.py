@@ -24,6 +24,7 @@ import numpy as np
 import tensorflow as tf
 import gym
 import logz
+import advantages
 import os
 import time
 import inspect
@@ -552,25 +553,12 @@ def train_PG(exp_name='',
         # ====================================================================================#
 
         # DYNAMIC PROGRAMMING
+        rew_n = np.concatenate([path['reward'] for path in paths])
+        path_lengths = [pathlength(path) for path in paths]
         if reward_to_go:
-            q_n = list()
-            for path in paths:
-                pLen = pathlength(path)
-                q_p = np.zeros(pLen)
-                q_p[pLen - 1] = path['reward'][pLen - 1]
-                for t in reversed(range(pLen - 1)):
-                    q_p[t] = path['reward'][t] + gamma * q_p[t + 1]
-                q_p = np.array(q_p)
-                q_n.append(q_p)
+            q_n = advantages.reward_to_go(rew_n, path_lengths, gamma)
         else:
-            q_n = list()
-            for path in paths:
-                pLen = pathlength(path)
-                q_p = 0
-                for t in range(pLen):
-                    q_p = q_p + (gamma ** t) * (path['reward'][t])
-                q_n.append(q_p * np.ones(pLen))
-        q_n = np.concatenate(q_n)
+            q_n = advantages.discounted_returns(rew_n, path_lengths, gamma)
 
         # ====================================================================================#
         #                           ----------SECTION 5----------
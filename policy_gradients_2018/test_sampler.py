@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import sampler
+
+
+class RandomWalkEnv(object):
+    """A gym-style env whose observations, rewards and episode lengths all come from
+    the generator seed() sets."""
+    def __init__(self):
+        self.rng = np.random.RandomState()
+
+    def seed(self, seed):
+        self.rng = np.random.RandomState(seed)
+
+    def reset(self):
+        self.ob = self.rng.randn(3)
+        return self.ob
+
+    def step(self, ac):
+        self.ob = self.ob + 0.1 * ac + self.rng.randn(3)
+        return self.ob, self.rng.randn(), self.rng.rand() < 0.1, {}
+
+    def render(self):
+        pass
+
+
+def policy_fn(obs):
+    return np.tanh(obs)
+
+
+def sample(num_envs, seed, subprocess=False):
+    envs = sampler.make_envs(RandomWalkEnv(), RandomWalkEnv, num_envs, subprocess=subprocess, seed=seed)
+    try:
+        return sampler.sample_paths(envs, policy_fn, 100, 20, False)
+    finally:
+        envs.close()
+
+
+def assert_paths_equal(paths_a, paths_b):
+    assert len(paths_a) == len(paths_b)
+    for path_a, path_b in zip(paths_a, paths_b):
+        assert sorted(path_a) == sorted(path_b)
+        for key in path_a:
+            np.testing.assert_array_equal(path_a[key], path_b[key])
+
+
+@pytest.mark.parametrize('num_envs', [1, 4])
+def test_sample_paths_steps(num_envs):
+    paths, steps = sample(num_envs, 0)
+    # episodes in progress are run to the end, so every simulated step is in a path
+    assert steps == sum(len(path['reward']) for path in paths) > 100
+    assert all(len(path['reward']) <= 21 for path in paths)
+    for path in paths:
+        np.testing.assert_array_equal(path['observation'][1:], path['next_observation'][:-1])
+
+
+def test_sample_paths_seeded():
+    paths, _ = sample(4, 0)
+    assert_paths_equal(paths, sample(4, 0)[0])
+    assert_paths_equal(paths, sample(4, 0, subprocess=True)[0])
+    # env i is seeded with seed + i
+    envs = sampler.make_envs(RandomWalkEnv(), RandomWalkEnv, 4, seed=5)
+    first_obs = [np.random.RandomState(5 + i).randn(3) for i in range(4)]
+    np.testing.assert_array_equal(envs.reset([0, 1, 2, 3]), first_obs)
+    with pytest.raises(AssertionError):
+        assert_paths_equal(paths, sample(4, 1)[0])